@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# Microbenchmark of the per-request work UnixAdapter does before a request is
+# sent (proxy check, socket address lookup, pool lookup), plus end to end
+# requests per second through a Session.
+#
+# Usage: python benchmarks/adapter_hot_path.py [NUM_REQUESTS]
+
+import sys
+import timeit
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+
+def run_get_connection(number=100000):
+    """Return UnixAdapter.get_connection calls per second"""
+    adapter = requests_unixsocket.UnixAdapter()
+    url = 'http+unix://%2Fvar%2Frun%2Fdocker.sock/containers/abc/json?all=1'
+    elapsed = timeit.timeit(lambda: adapter.get_connection(url, {}),
+                            number=number)
+    return number / elapsed
+
+
+def run_session_get(usock, num_requests):
+    """Return Session.get requests per second"""
+    session = requests_unixsocket.Session()
+    urlencoded_usock = requests.compat.quote_plus(usock)
+    url = 'http+unix://%s/_ping' % urlencoded_usock
+    elapsed = timeit.timeit(lambda: session.get(url).content,
+                            number=num_requests)
+    session.close()
+    return num_requests / elapsed
+
+
+def main(num_requests=2000):
+    print('get_connection:      %8.0f calls/s' % run_get_connection())
+    with UnixSocketServerThread() as usock_thread:
+        rps = run_session_get(usock_thread.usock, num_requests)
+    print('Session.get:         %8.0f requests/s' % rps)
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
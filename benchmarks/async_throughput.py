@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Compares the throughput of AsyncSession against a thread pool sharing one
+# Session, for the same number of requests in flight.
+#
+# Usage: python benchmarks/async_throughput.py [NUM_REQUESTS] [CONCURRENCY]
+
+import asyncio
+import concurrent.futures
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+
+def run_threaded(url, num_requests, concurrency):
+    session = requests_unixsocket.Session(pool_maxsize=concurrency)
+
+    def fetch(i):
+        return session.get(url).content
+
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(fetch, range(num_requests)))
+        elapsed = time.perf_counter() - start
+    session.close()
+    return elapsed
+
+
+async def run_async(url, num_requests, concurrency):
+    async with requests_unixsocket.AsyncSession(
+            pool_maxsize=concurrency) as session:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(i):
+            async with semaphore:
+                return (await session.get(url)).content
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch(i) for i in range(num_requests)))
+        return time.perf_counter() - start
+
+
+def run(usock, num_requests, concurrency):
+    """Return requests per second for both clients"""
+    urlencoded_usock = requests.compat.quote_plus(usock)
+    url = 'http+unix://%s/path/to/page' % urlencoded_usock
+    return {
+        'threaded_requests_per_s':
+            num_requests / run_threaded(url, num_requests, concurrency),
+        'async_requests_per_s':
+            num_requests / asyncio.run(
+                run_async(url, num_requests, concurrency)),
+    }
+
+
+def main(num_requests=2000, concurrency=32):
+    with UnixSocketServerThread() as usock_thread:
+        results = run(usock_thread.usock, num_requests, concurrency)
+
+    print('%d requests, %d in flight' % (num_requests, concurrency))
+    print('%-20s %8.1f requests/s'
+          % ('Session + threads', results['threaded_requests_per_s']))
+    print('%-20s %8.1f requests/s'
+          % ('AsyncSession', results['async_requests_per_s']))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+# Compares Session.map, which sends a batch from the calling thread with a
+# selector, with a ThreadPoolExecutor over session.get, for many GETs to one
+# socket, with the same concurrency and pool size on both sides: requests
+# per second, threads started, connects, and the most requests handed out
+# but not finished at once (executor.map submits them all upfront).
+#
+# Usage: python benchmarks/batch_map.py [NUM_REQUESTS] [CONCURRENCY]
+
+import concurrent.futures
+import sys
+import threading
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+
+def connects(session):
+    stats = session.get_adapter('http+unix://').pool_stats()
+    return sum(pool['created'] for pool in stats.values())
+
+
+class CountingIterable(object):
+    """Counts how far ahead of the finished requests the consumer takes
+    items
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.taken = 0
+        self.finished = 0
+        self.most_pending = 0
+
+    def __iter__(self):
+        for item in self.items:
+            self.taken += 1
+            self.most_pending = max(self.most_pending,
+                                    self.taken - self.finished)
+            yield item
+
+
+def run_map(urls, concurrency):
+    session = requests_unixsocket.Session(pool_maxsize=concurrency)
+    items = CountingIterable(urls)
+    threads = threading.active_count()
+    most_threads = threads
+    start = time.perf_counter()
+    for result in session.map(items, concurrency=concurrency):
+        result.response.content
+        items.finished += 1
+        most_threads = max(most_threads, threading.active_count())
+    elapsed = time.perf_counter() - start
+    results = {
+        'requests_per_s': len(urls) / elapsed,
+        'threads': most_threads - threads,
+        'connects': connects(session),
+        'most_pending': items.most_pending,
+    }
+    session.close()
+    return results
+
+
+def run_executor(urls, concurrency):
+    session = requests_unixsocket.Session(pool_maxsize=concurrency)
+    items = CountingIterable(urls)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        for response in executor.map(session.get, items):
+            response.content
+            items.finished += 1
+        elapsed = time.perf_counter() - start
+    results = {
+        'requests_per_s': len(urls) / elapsed,
+        'threads': concurrency,
+        'connects': connects(session),
+        'most_pending': items.most_pending,
+    }
+    session.close()
+    return results
+
+
+def run(usock, num_requests, concurrency):
+    urlencoded_usock = requests.compat.quote_plus(usock)
+    urls = ['http+unix://%s/containers/%d/stats' % (urlencoded_usock, i)
+            for i in range(num_requests)]
+    return {
+        'session_map': run_map(urls, concurrency),
+        'thread_pool_executor': run_executor(urls, concurrency),
+    }
+
+
+def main(num_requests=2000, concurrency=8):
+    with UnixSocketServerThread(threads=8) as usock_thread:
+        results = run(usock_thread.usock, num_requests, concurrency)
+    for name, result in sorted(results.items()):
+        print('%-22s %8.1f requests/s  %3d threads  %4d connects  '
+              '%5d most pending'
+              % (name, result['requests_per_s'], result['threads'],
+                 result['connects'], result['most_pending']))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# Many threads polling the same slow endpoint at once, with and without
+# coalesce=True: requests per second seen by the threads, and requests that
+# reached the server.
+#
+# Usage: python benchmarks/coalescing.py [ROUNDS] [THREADS]
+
+import sys
+import threading
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+LATENCY = 0.005
+
+
+def poll(coalesce, num_rounds, num_threads):
+    with UnixSocketServerThread(threads=4, latency=LATENCY) as usock_thread:
+        session = requests_unixsocket.Session(coalesce=coalesce,
+                                              pool_maxsize=num_threads)
+        url = 'http+unix://%s/json/200' % requests.compat.quote_plus(
+            usock_thread.usock)
+        barrier = threading.Barrier(num_threads)
+
+        def worker():
+            for _ in range(num_rounds):
+                # All threads ask at the same moment, as pollers on a timer do
+                barrier.wait()
+                session.get(url).content
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        session.close()
+        return (num_rounds * num_threads / elapsed,
+                usock_thread.requests_served)
+
+
+def run(num_rounds=100, num_threads=16):
+    """Return ``{'coalesce_<on|off>': (requests/s, server requests)}``"""
+    return dict(('coalesce_%s' % ('on' if coalesce else 'off'),
+                 poll(coalesce, num_rounds, num_threads))
+                for coalesce in (False, True))
+
+
+def main(num_rounds=100, num_threads=16):
+    for name, (per_s, served) in sorted(run(num_rounds,
+                                            num_threads).items()):
+        print('%-14s %8.1f requests/s  %5d served by the server'
+              % (name, per_s, served))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Bytes moved and client CPU time for a large JSON listing fetched with and
+# without compression, from a test server that gzips when asked to.
+#
+# Usage: python benchmarks/compression.py [ENTRIES [REQUESTS]]
+
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+
+def fetch(session, url, num_requests):
+    session.get(url).content  # warm up
+    bytes_moved = 0
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        r = session.get(url)
+        r.json()
+        bytes_moved += r.raw.tell()
+    elapsed = time.perf_counter() - start
+    return {
+        'bytes_per_request': bytes_moved / num_requests,
+        'requests_per_s': num_requests / elapsed,
+        'client_cpu_per_request': (time.thread_time() - start_cpu)
+        / num_requests,
+    }
+
+
+def run(usock, entries=10000, num_requests=20):
+    """Return ``{'identity' | 'compressed': results}`` for one listing size
+
+    ``usock`` must be served with ``gzip_level`` set.
+    """
+    url = 'http+unix://%s/json/%d' % (requests.compat.quote_plus(usock),
+                                      entries)
+    results = {}
+    for name, compression in (('identity', False), ('compressed', True)):
+        session = requests_unixsocket.Session(compression=compression)
+        results[name] = fetch(session, url, num_requests)
+        session.close()
+    return results
+
+
+def main(entries=10000, num_requests=20):
+    with UnixSocketServerThread(gzip_level=6) as usock_thread:
+        for name, result in sorted(run(usock_thread.usock, entries,
+                                       num_requests).items()):
+            print('%-10s %10.0f bytes/request %8.1f requests/s  '
+                  'client CPU %6.2fms/request'
+                  % (name, result['bytes_per_request'],
+                     result['requests_per_s'],
+                     result['client_cpu_per_request'] * 1000))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
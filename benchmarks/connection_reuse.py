@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# Measures how many unix socket connects are made per request when a Session
+# talks to many distinct paths on the same socket.
+#
+# Usage: python benchmarks/connection_reuse.py [NUM_REQUESTS]
+
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+
+def run(usock, num_requests):
+    session = requests_unixsocket.Session()
+    urlencoded_usock = requests.compat.quote_plus(usock)
+
+    start = time.perf_counter()
+    for i in range(num_requests):
+        session.get('http+unix://%s/containers/%d/json'
+                    % (urlencoded_usock, i)).content
+    elapsed = time.perf_counter() - start
+
+    pools = session.get_adapter('http+unix://').pool_stats()
+    connects = sum(stats['created'] for stats in pools.values())
+    session.close()
+    return {
+        'pools': len(pools),
+        'connects': connects,
+        'connects_per_request': connects / num_requests,
+        'requests_per_s': num_requests / elapsed,
+    }
+
+
+def main(num_requests=1000):
+    with UnixSocketServerThread() as usock_thread:
+        results = run(usock_thread.usock, num_requests)
+
+    print('requests:             %d' % num_requests)
+    print('pools:                %d' % results['pools'])
+    print('connects:             %d' % results['connects'])
+    print('connects per request: %.4f' % results['connects_per_request'])
+    print('requests per second:  %.1f' % results['requests_per_s'])
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Download throughput of Response.iter_content against iter_content_views,
+# using the /bytes/<n> endpoint of the test server.
+#
+# Usage: python benchmarks/download_throughput.py [SIZE_MB ...]
+
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_content(response):
+    return response.iter_content(CHUNK_SIZE)
+
+
+def iter_content_views(response):
+    return requests_unixsocket.iter_content_views(response, CHUNK_SIZE)
+
+
+def download(session, url, iterate):
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    r = session.get(url, stream=True)
+    size = 0
+    for chunk in iterate(r):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    return size, elapsed, time.thread_time() - start_cpu
+
+
+def run(usock, size_mb):
+    """Return ``{method: (MB/s, client CPU seconds)}`` for one body size"""
+    session = requests_unixsocket.Session(recv_buffer_size=CHUNK_SIZE)
+    urlencoded_usock = requests.compat.quote_plus(usock)
+    url = 'http+unix://%s/bytes/%d' % (urlencoded_usock,
+                                       size_mb * 1024 * 1024)
+    results = {}
+    for iterate in (iter_content, iter_content_views):
+        size, elapsed, cpu = download(session, url, iterate)
+        results[iterate.__name__] = (size / elapsed / 1024 / 1024, cpu)
+    session.close()
+    return results
+
+
+def main(*sizes_mb):
+    with UnixSocketServerThread() as usock_thread:
+        for size_mb in sizes_mb or (100, 500):
+            for name, (mb_per_s, cpu) in run(usock_thread.usock,
+                                             size_mb).items():
+                print('%5d MB %-19s %8.1f MB/s  client CPU %6.2fs'
+                      % (size_mb, name, mb_per_s, cpu))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
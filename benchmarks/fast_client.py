@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+# Small GETs through Session.get and FastClient.request over the same kind
+# of pooled connections: requests per second, and client CPU per request
+# (of the requesting thread only, as the server runs in the same process).
+#
+# Usage: python benchmarks/fast_client.py [NUM_REQUESTS]
+
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+
+def measure(send, num_requests):
+    send()  # connect first
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        send()
+    elapsed = time.perf_counter() - start
+    cpu = time.thread_time() - start_cpu
+    return num_requests / elapsed, cpu / num_requests * 1e6
+
+
+def run(usock, num_requests=5000):
+    """Return ``{client: (requests/s, client CPU us/request)}``"""
+    url = 'http+unix://%s/_ping' % requests.compat.quote_plus(usock)
+    session = requests_unixsocket.Session()
+    client = requests_unixsocket.FastClient()
+    results = {
+        'session': measure(lambda: session.get(url).content, num_requests),
+        'fast_client': measure(lambda: client.request('GET', url).body,
+                               num_requests),
+    }
+    session.close()
+    client.close()
+    return results
+
+
+def main(num_requests=5000):
+    with UnixSocketServerThread() as usock_thread:
+        results = run(usock_thread.usock, num_requests)
+    for name, (per_s, cpu) in sorted(results.items()):
+        print('%-12s %8.0f requests/s  client CPU %7.1fus/request'
+              % (name, per_s, cpu))
+    print('speedup      %8.1fx' % (results['fast_client'][0]
+                                   / results['session'][0]))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
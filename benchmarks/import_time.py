@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Cold import time of requests_unixsocket, on its own and once Session is
+# used, measured in fresh interpreters with python -X importtime.
+#
+# Usage: python benchmarks/import_time.py [RUNS]
+
+import os
+import subprocess
+import sys
+
+import requests_unixsocket
+
+CASES = {
+    'import': 'import requests_unixsocket',
+    'import_and_session': 'import requests_unixsocket; '
+                          'requests_unixsocket.Session()',
+}
+
+
+def total_import_time(code):
+    """Return the summed top-level import time, in ms, of running ``code``"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.dirname(requests_unixsocket.__file__)),
+        env.get('PYTHONPATH')]))
+    baseline = import_times(['-c', 'pass'], env)
+    times = import_times(['-c', code], env)
+    return sum(cumulative for name, cumulative in times.items()
+               if name not in baseline) / 1000.0
+
+
+def import_times(args, env):
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + args, env=env,
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        # Top-level imports only, as the cumulative times include the rest
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit() and not name.startswith('  '):
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def run(runs=10):
+    """Return ``{case: median import time in ms}``"""
+    results = {}
+    for name, code in CASES.items():
+        times = sorted(total_import_time(code) for _ in range(runs))
+        results[name] = times[len(times) // 2]
+    return results
+
+
+def main(runs=10):
+    for name, ms in sorted(run(runs).items()):
+        print('%-20s %8.2f ms' % (name, ms))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
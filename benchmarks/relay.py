@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# Relaying an upgraded connection to another socket: relay() with splice(),
+# relay() through its buffer, and a Python recv()/sendall() loop. The ends
+# are socket pairs fed and drained by other threads, so only the relaying is
+# measured; client CPU is that of the relaying thread.
+#
+# Usage: python benchmarks/relay.py [SIZE_MB]
+
+import socket
+import sys
+import threading
+import time
+
+import requests_unixsocket
+
+CHUNK_SIZE = 256 * 1024
+
+
+def recv_sendall(sock, dst):
+    while True:
+        data = sock.recv(CHUNK_SIZE)
+        if not data:
+            return
+        dst.sendall(data)
+
+
+def relay_splice(sock, dst):
+    requests_unixsocket.relay(sock, (None, dst), buffer_size=CHUNK_SIZE)
+
+
+def relay_buffer(sock, dst):
+    requests_unixsocket.relay(sock, (None, dst), buffer_size=CHUNK_SIZE,
+                              use_splice=False)
+
+
+def measure(pump, size):
+    upstream, sock = socket.socketpair()
+    dst, downstream = socket.socketpair()
+    chunk = b'x' * CHUNK_SIZE
+
+    def produce():
+        for _ in range(size // CHUNK_SIZE):
+            upstream.sendall(chunk)
+        upstream.close()
+
+    def consume():
+        buffer = bytearray(CHUNK_SIZE)
+        while downstream.recv_into(buffer):
+            pass
+
+    threads = [threading.Thread(target=produce),
+               threading.Thread(target=consume)]
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    pump(sock, dst)
+    dst.close()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.thread_time() - start_cpu
+    sock.close()
+    downstream.close()
+    return size / elapsed / 1024 / 1024, cpu
+
+
+def run(size_mb=256):
+    """Return ``{method: (MB/s, relay CPU seconds)}``"""
+    size = size_mb * 1024 * 1024
+    return dict((pump.__name__, measure(pump, size))
+                for pump in (recv_sendall, relay_buffer, relay_splice))
+
+
+def main(size_mb=256):
+    for name, (mb_per_s, cpu) in sorted(run(size_mb).items()):
+        print('%-14s %8.1f MB/s  relay CPU %6.2fs' % (name, mb_per_s, cpu))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Throughput of one Session spread over replica sockets, against a single
+# socket. Every server has few worker threads and a fixed service time, as a
+# sidecar bound to one core would, so capacity grows with the number of
+# replicas the requests are spread over.
+#
+# Usage: python benchmarks/replicas.py [REQUESTS] [THREADS]
+
+import contextlib
+import logging
+import sys
+import threading
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+NUM_REPLICAS = 4
+SERVICE_TIME = 0.01
+
+
+def throughput(session, url, num_requests, num_threads):
+    per_thread = max(1, num_requests // num_threads)
+
+    def worker():
+        for _ in range(per_thread):
+            session.get(url).content
+
+    session.get(url).content  # warm up
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_thread * num_threads / (time.perf_counter() - start)
+
+
+def run(num_requests=2000, num_threads=16):
+    """Return ``{'<setup>.requests_per_s': requests/s}``"""
+    path = '/sleep/%s' % SERVICE_TIME
+    results = {}
+    with contextlib.ExitStack() as stack:
+        servers = [stack.enter_context(UnixSocketServerThread(threads=2))
+                   for _ in range(NUM_REPLICAS)]
+        usocks = [server.usock for server in servers]
+
+        session = requests_unixsocket.Session(pool_maxsize=num_threads)
+        results['single_socket.requests_per_s'] = throughput(
+            session, 'http+unix://%s%s' % (
+                requests.compat.quote_plus(usocks[0]), path),
+            num_requests, num_threads)
+        session.close()
+
+        for strategy in ('least_outstanding', 'power_of_two'):
+            session = requests_unixsocket.Session(
+                pool_maxsize=num_threads, replicas={'svc': usocks},
+                balancing=strategy)
+            results['%s.requests_per_s' % strategy] = throughput(
+                session, 'http+unix://svc' + path, num_requests,
+                num_threads)
+            session.close()
+
+        # One replica down: its socket is ejected after the first failure
+        session = requests_unixsocket.Session(
+            pool_maxsize=num_threads,
+            replicas={'svc': usocks + [usocks[0] + '.missing']})
+        results['one_ejected.requests_per_s'] = throughput(
+            session, 'http+unix://svc' + path, num_requests, num_threads)
+        session.close()
+    return results
+
+
+def main(num_requests=2000, num_threads=16):
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+    for name, value in sorted(run(num_requests, num_threads).items()):
+        print('%-40s %10.1f' % (name, value))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+
+# Runs the requests_unixsocket benchmark suite against local test servers and
+# writes the results as JSON, optionally comparing them with an earlier run.
+#
+# Usage:
+#
+#     python benchmarks/run.py [--quick] [--output results.json]
+#                              [--compare baseline.json] [--threshold 10]
+#                              [SCENARIO ...]
+#
+# Every result is a metric with a unit and a direction, so --compare can tell
+# a regression from an improvement. It exits with status 1 if any metric got
+# worse by more than --threshold percent.
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+import adapter_hot_path
+import async_throughput
+import batch_map
+import coalescing
+import compression
+import connection_reuse
+import download_throughput
+import fast_client
+import import_time
+import relay
+import replicas
+import seqpacket
+import soak
+import stream_decoding
+import upload_throughput
+
+
+SCENARIOS = collections.OrderedDict()
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def metric(name, value, unit, higher_is_better=True):
+    return {
+        'name': name,
+        'value': value,
+        'unit': unit,
+        'higher_is_better': higher_is_better,
+    }
+
+
+def socket_url(usock, path='/path/to/page'):
+    return 'http+unix://%s%s' % (requests.compat.quote_plus(usock), path)
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1,
+                int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def requests_per_s(get, url, num_requests):
+    get(url)  # warm up
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        get(url).content
+    return num_requests / (time.perf_counter() - start)
+
+
+@scenario
+def small_get_latency(servers, options):
+    session = requests_unixsocket.Session()
+    url = socket_url(servers['filesystem'])
+    session.get(url)
+    latencies = []
+    for _ in range(options.requests):
+        start = time.perf_counter()
+        session.get(url).content
+        latencies.append((time.perf_counter() - start) * 1000)
+    session.close()
+    latencies.sort()
+    return [metric('p%d' % pct, percentile(latencies, pct), 'ms',
+                   higher_is_better=False)
+            for pct in (50, 90, 99)]
+
+
+@scenario
+def threaded_requests(servers, options):
+    url = socket_url(servers['filesystem'])
+    results = []
+    for num_threads in (1, 8, 64):
+        session = requests_unixsocket.Session(pool_maxsize=num_threads)
+        per_thread = max(1, options.requests // num_threads)
+
+        def worker():
+            for _ in range(per_thread):
+                session.get(url).content
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        stats = session.get_adapter('http+unix://').pool_stats()
+        stats = stats[servers['filesystem']]
+        checkouts = stats['created'] + stats['reused']
+        session.close()
+        results.append(metric('threads_%d.requests_per_s' % num_threads,
+                              per_thread * num_threads / elapsed,
+                              'requests/s'))
+        results.append(metric('threads_%d.reuse_ratio' % num_threads,
+                              stats['reused'] / checkouts, 'ratio'))
+    return results
+
+
+@scenario
+def connection_reuse_across_paths(servers, options):
+    results = connection_reuse.run(servers['filesystem'], options.requests)
+    return [
+        metric('connects_per_request', results['connects_per_request'],
+               'connects', higher_is_better=False),
+        metric('requests_per_s', results['requests_per_s'], 'requests/s'),
+    ]
+
+
+@scenario
+def adapter_hot_path_calls(servers, options):
+    return [metric('get_connection', adapter_hot_path.run_get_connection(),
+                   'calls/s')]
+
+
+@scenario
+def fast_path_client(servers, options):
+    results = []
+    for name, (per_s, cpu) in sorted(fast_client.run(
+            servers['filesystem'], options.requests).items()):
+        results.append(metric(name + '.requests_per_s', per_s, 'requests/s'))
+        results.append(metric(name + '.client_cpu_per_request', cpu, 'us',
+                              higher_is_better=False))
+    return results
+
+
+@scenario
+def api_styles(servers, options):
+    url = socket_url(servers['filesystem'])
+    session = requests_unixsocket.Session()
+    results = [
+        metric('session.requests_per_s',
+               requests_per_s(session.get, url, options.requests),
+               'requests/s'),
+        metric('module_helpers.requests_per_s',
+               requests_per_s(requests_unixsocket.get, url,
+                              options.requests),
+               'requests/s'),
+    ]
+    session.close()
+    with requests_unixsocket.monkeypatch():
+        results.append(metric(
+            'monkeypatch.requests_per_s',
+            requests_per_s(requests.get, url, options.requests),
+            'requests/s'))
+    with requests_unixsocket.monkeypatch(shared_session=True):
+        results.append(metric(
+            'monkeypatch_shared_session.requests_per_s',
+            requests_per_s(requests.get, url, options.requests),
+            'requests/s'))
+    return results
+
+
+@scenario
+def socket_types(servers, options):
+    results = []
+    for name in ('filesystem', 'abstract_namespace'):
+        session = requests_unixsocket.Session()
+        results.append(metric(
+            '%s.requests_per_s' % name,
+            requests_per_s(session.get, socket_url(servers[name]),
+                           options.requests),
+            'requests/s'))
+        session.close()
+    return results
+
+
+@scenario
+def async_vs_threads(servers, options):
+    results = async_throughput.run(servers['filesystem'], options.requests,
+                                   concurrency=32)
+    return [metric(name, value, 'requests/s')
+            for name, value in sorted(results.items())]
+
+
+@scenario
+def batch_requests(servers, options):
+    results = []
+    for name, result in sorted(batch_map.run(
+            servers['filesystem'], options.requests, concurrency=8).items()):
+        results.append(metric(name + '.requests_per_s',
+                              result['requests_per_s'], 'requests/s'))
+        results.append(metric(name + '.threads', result['threads'],
+                              'threads', higher_is_better=False))
+        results.append(metric(name + '.connects', result['connects'],
+                              'connects', higher_is_better=False))
+        results.append(metric(name + '.most_pending', result['most_pending'],
+                              'requests', higher_is_better=False))
+    return results
+
+
+@scenario
+def request_coalescing(servers, options):
+    # Brings its own slow server
+    results = []
+    for name, (per_s, served) in sorted(coalescing.run(
+            options.requests // 16).items()):
+        results.append(metric(name + '.requests_per_s', per_s, 'requests/s'))
+        results.append(metric(name + '.server_requests', served, 'requests',
+                              higher_is_better=False))
+    return results
+
+
+@scenario
+def long_lived_session(servers, options):
+    # Brings its own short-lived servers
+    results = []
+    for name, result in sorted(soak.run(
+            200 if options.quick else 2000).items()):
+        results.append(metric(name + '.fds_held', result['fds_held'],
+                              'fds', higher_is_better=False))
+        results.append(metric(name + '.rss_gained', result['rss_kb_gained'],
+                              'KB', higher_is_better=False))
+    return results
+
+
+@scenario
+def upload(servers, options):
+    # Against a sink that discards the body, not the test server, which
+    # would be the bottleneck
+    results = []
+    with upload_throughput.SinkServer() as sink:
+        for size_mb in options.upload_sizes_mb:
+            for name, (mb_per_s, cpu) in sorted(upload_throughput.run(
+                    sink.usock, size_mb).items()):
+                prefix = '%dMB.%s' % (size_mb, name)
+                results.append(metric(prefix + '.throughput', mb_per_s,
+                                      'MB/s'))
+                results.append(metric(prefix + '.client_cpu', cpu, 's',
+                                      higher_is_better=False))
+    return results
+
+
+@scenario
+def download(servers, options):
+    results = []
+    for size_mb in options.sizes_mb:
+        for name, (mb_per_s, cpu) in sorted(download_throughput.run(
+                servers['filesystem'], size_mb).items()):
+            prefix = '%dMB.%s' % (size_mb, name)
+            results.append(metric(prefix + '.throughput', mb_per_s, 'MB/s'))
+            results.append(metric(prefix + '.client_cpu', cpu, 's',
+                                  higher_is_better=False))
+    return results
+
+
+@scenario
+def stream_decoders(servers, options):
+    results = []
+    for name, (per_s, cpu) in sorted(stream_decoding.run(
+            servers['filesystem'], options.requests * 25).items()):
+        results.append(metric(name + '.messages_per_s', per_s,
+                              'messages/s'))
+        results.append(metric(name + '.client_cpu_per_message', cpu, 'us',
+                              higher_is_better=False))
+    return results
+
+
+@scenario
+def upgraded_relay(servers, options):
+    results = []
+    for name, (mb_per_s, cpu) in sorted(relay.run(
+            64 if options.quick else 512).items()):
+        results.append(metric(name + '.throughput', mb_per_s, 'MB/s'))
+        results.append(metric(name + '.relay_cpu', cpu, 's',
+                              higher_is_better=False))
+    return results
+
+
+@scenario
+def response_compression(servers, options):
+    # Needs a server that gzips, so it brings its own
+    results = []
+    with UnixSocketServerThread(threads=4, gzip_level=6) as usock_thread:
+        entries = 1000 if options.quick else 10000
+        for name, result in sorted(compression.run(
+                usock_thread.usock, entries, 20).items()):
+            results.append(metric(name + '.bytes_per_request',
+                                  result['bytes_per_request'], 'bytes',
+                                  higher_is_better=False))
+            results.append(metric(name + '.requests_per_s',
+                                  result['requests_per_s'], 'requests/s'))
+            results.append(metric(name + '.client_cpu_per_request',
+                                  result['client_cpu_per_request'], 's',
+                                  higher_is_better=False))
+    return results
+
+
+@scenario
+def seqpacket_small_responses(servers, options):
+    # Brings its own servers, as waitress can't serve SOCK_SEQPACKET
+    results = []
+    for name, (requests_per_s, p50) in sorted(
+            seqpacket.run(options.requests).items()):
+        results.append(metric(name + '.requests_per_s', requests_per_s,
+                              'requests/s'))
+        results.append(metric(name + '.p50', p50, 'ms',
+                              higher_is_better=False))
+    return results
+
+
+@scenario
+def replica_sockets(servers, options):
+    # Brings its own servers, one per replica
+    return [metric(name, value, 'requests/s')
+            for name, value in sorted(replicas.run(options.requests).items())]
+
+
+@scenario
+def startup(servers, options):
+    return [metric(name, ms, 'ms', higher_is_better=False)
+            for name, ms in sorted(import_time.run(
+                3 if options.quick else 10).items())]
+
+
+def run_scenarios(names, options):
+    results = []
+    with UnixSocketServerThread(threads=16) as fs_server, \
+            UnixSocketServerThread(threads=16,
+                                   abstract_namespace=True) as abstract_server:
+        servers = {
+            'filesystem': fs_server.usock,
+            'abstract_namespace': abstract_server.usock,
+        }
+        for name in names:
+            print('Running %s ...' % name, file=sys.stderr)
+            for result in SCENARIOS[name](servers, options):
+                result['name'] = '%s.%s' % (name, result['name'])
+                results.append(result)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change of each metric and return the names of regressions"""
+    old = dict((result['name'], result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        previous = old.get(result['name'])
+        if not previous or not previous['value']:
+            continue
+        change = (result['value'] - previous['value']) / previous['value']
+        if not result['higher_is_better']:
+            change = -change
+        flag = ''
+        if change * 100 < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(result['name'])
+        print('%-60s %12.3f -> %12.3f %-10s %+7.1f%%%s'
+              % (result['name'], previous['value'], result['value'],
+                 result['unit'], change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the requests_unixsocket benchmark suite')
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help='one of: %s (default: all)'
+                        % ', '.join(SCENARIOS))
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer requests and smaller bodies')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent change counted as a regression')
+    options = parser.parse_args(argv)
+    options.requests = 200 if options.quick else 2000
+    options.sizes_mb = (1, 16) if options.quick else (16, 128, 512)
+    options.upload_sizes_mb = ((16, 100) if options.quick
+                               else upload_throughput.SIZES_MB)
+
+    for name in options.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario %r' % name)
+
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+    results = run_scenarios(options.scenarios or list(SCENARIOS), options)
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(
+                datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'requests': requests.__version__,
+            'quick': options.quick,
+        },
+        'results': results,
+    }
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Small request/response latency over SOCK_SEQPACKET against SOCK_STREAM.
+# Both sockets are served by the same standard library test server, so only
+# the socket type differs.
+#
+# Usage: python benchmarks/seqpacket.py [REQUESTS]
+
+import socket
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+SIZES = (64, 256, 1000)
+
+
+def latencies(session, url, num_requests):
+    session.get(url).content  # warm up
+    results = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        session.get(url).content
+        results.append(time.perf_counter() - start)
+    results.sort()
+    return results
+
+
+def run(num_requests=2000):
+    """Return ``{'<socket type>.<size>B': (requests/s, p50 ms)}``"""
+    results = {}
+    for name, scheme, socket_type in (
+            ('stream', 'http+unix', socket.SOCK_STREAM),
+            ('seqpacket', 'http+unix+seqpacket', socket.SOCK_SEQPACKET)):
+        with UnixSocketServerThread(socket_type=socket_type,
+                                    simple_server=True) as usock_thread:
+            session = requests_unixsocket.Session()
+            for size in SIZES:
+                url = '%s://%s/bytes/%d' % (
+                    scheme, requests.compat.quote_plus(usock_thread.usock),
+                    size)
+                values = latencies(session, url, num_requests)
+                results['%s.%dB' % (name, size)] = (
+                    num_requests / sum(values),
+                    values[len(values) // 2] * 1000)
+            session.close()
+    return results
+
+
+def main(num_requests=2000):
+    for name, (requests_per_s, p50) in sorted(run(num_requests).items()):
+        print('%-16s %8.1f requests/s  p50 %6.3fms'
+              % (name, requests_per_s, p50))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# A long-lived Session under churn of short-lived sockets, as an agent talking
+# to containers that come and go: each round starts a server on a new socket,
+# sends it a few requests and stops it. Reports the file descriptors the
+# Session holds at the end, how many descriptors and how much RSS the process
+# gained between the first tenth of the rounds and the end, and the pools
+# left open, with and without idle reaping.
+#
+# Usage: python benchmarks/soak.py [ROUNDS]
+
+import gc
+import logging
+import os
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+CONFIGURATIONS = {
+    'no_reaping': {},
+    'reaping': {'idle_timeout': 0.5, 'pool_idle_timeout': 0.01,
+                'max_fds': 16},
+}
+
+
+def count_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def rss_kb():
+    with open('/proc/self/statm') as statm:
+        resident_pages = int(statm.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def churn(session, num_rounds, requests_per_round=3):
+    """Yield the round number after each round"""
+    for i in range(num_rounds):
+        with UnixSocketServerThread() as usock_thread:
+            url = 'http+unix://%s/containers/%d/json' % (
+                requests.compat.quote_plus(usock_thread.usock), i)
+            for _ in range(requests_per_round):
+                session.get(url).content
+        # Leave the pools of earlier rounds time to go idle
+        time.sleep(0.001)
+        yield i
+
+
+def soak(num_rounds, **kwargs):
+    gc.collect()
+    initial_fds = count_fds()
+    session = requests_unixsocket.Session(**kwargs)
+    warmup = max(num_rounds // 10, 1)
+    for i in churn(session, num_rounds):
+        if i + 1 == warmup:
+            gc.collect()
+            fds, rss = count_fds(), rss_kb()
+    gc.collect()
+    result = {
+        'fds_held': count_fds() - initial_fds,
+        'fds_gained': count_fds() - fds,
+        'rss_kb_gained': rss_kb() - rss,
+        'pools_open': len(session.get_adapter('http+unix://').pool_info()),
+    }
+    session.close()
+    return result
+
+
+def run(num_rounds=2000):
+    """Return ``{configuration: {'fds_held': n, 'fds_gained': n,
+    'rss_kb_gained': n, 'pools_open': n}}``
+    """
+    return dict((name, soak(num_rounds, **kwargs))
+                for name, kwargs in sorted(CONFIGURATIONS.items()))
+
+
+def main(num_rounds=2000):
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+    for name, result in sorted(run(num_rounds).items()):
+        print('%-12s %3d fds held  %+4d fds  %+7d KB RSS  %3d pools open'
+              % (name, result['fds_held'], result['fds_gained'],
+                 result['rss_kb_gained'], result['pools_open']))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# Decoding newline-delimited JSON and Docker multiplexed log streams: the
+# usual iter_lines()/iter_content() code against iter_json_lines and
+# iter_docker_frames, using the /events/<n> and /logs/<n> endpoints of the
+# test server. Client CPU is that of the decoding thread only, as the server
+# runs in the same process.
+#
+# Usage: python benchmarks/stream_decoding.py [MESSAGES]
+
+import json
+import struct
+import sys
+import time
+
+import requests
+
+import requests_unixsocket
+from requests_unixsocket.testutils import UnixSocketServerThread
+
+_frame_header = struct.Struct('>BxxxL')
+
+
+def iter_lines_json_loads(response):
+    for line in response.iter_lines(chunk_size=64 * 1024):
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_lines(response):
+    return requests_unixsocket.iter_json_lines(response)
+
+
+def iter_content_frames(response):
+    # How Docker frames are commonly parsed: append chunks to a bytes
+    # buffer and slice frames off its front
+    buffer = b''
+    for chunk in response.iter_content(64 * 1024):
+        buffer += chunk
+        while len(buffer) >= 8:
+            stream_type, size = _frame_header.unpack(buffer[:8])
+            if len(buffer) < 8 + size:
+                break
+            yield stream_type, buffer[8:8 + size]
+            buffer = buffer[8 + size:]
+
+
+def iter_docker_frames(response):
+    return requests_unixsocket.iter_docker_frames(response)
+
+
+def decode(session, url, iterate):
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    r = session.get(url, stream=True)
+    count = 0
+    for _ in iterate(r):
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count, elapsed, time.thread_time() - start_cpu
+
+
+def run(usock, num_messages=50000):
+    """Return ``{'<stream>.<method>': (messages/s, client CPU us/message)}``
+    """
+    session = requests_unixsocket.Session()
+    urlencoded_usock = requests.compat.quote_plus(usock)
+    results = {}
+    for stream, iterators in (
+            ('events', (iter_lines_json_loads, iter_json_lines)),
+            ('logs', (iter_content_frames, iter_docker_frames))):
+        url = 'http+unix://%s/%s/%d' % (urlencoded_usock, stream,
+                                        num_messages)
+        for iterate in iterators:
+            count, elapsed, cpu = decode(session, url, iterate)
+            assert count == num_messages
+            results['%s.%s' % (stream, iterate.__name__)] = (
+                count / elapsed, cpu / count * 1e6)
+    session.close()
+    return results
+
+
+def main(num_messages=50000):
+    with UnixSocketServerThread() as usock_thread:
+        for name, (per_s, cpu) in sorted(
+                run(usock_thread.usock, num_messages).items()):
+            print('%-32s %10.0f messages/s  client CPU %6.2fus/message'
+                  % (name, per_s, cpu))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
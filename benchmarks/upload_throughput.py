@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+# Upload throughput and client CPU time for file bodies (sent with sendfile)
+# against the same bytes from a file-like object without a file descriptor
+# (sent in UnixHTTPConnection.blocksize pieces). The server is a sink that
+# parses the request headers and discards the body with recv_into, so the
+# client's cost of sending is what gets measured.
+#
+# Usage: python benchmarks/upload_throughput.py [SIZE_MB ...]
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+import requests_unixsocket
+
+SIZES_MB = (100, 500, 1000, 2000)
+RECV_SIZE = 1024 * 1024
+
+
+class SinkServer(object):
+    """Answers every request on a unix socket with an empty 200 response
+    after reading and discarding its ``Content-Length`` bytes of body
+    """
+
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.usock = os.path.join(self.tmpdir, 'sink.sock')
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.usock)
+        self.listener.listen(8)
+        self.thread = threading.Thread(target=self.accept, daemon=True)
+
+    def accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(sock,),
+                             daemon=True).start()
+
+    def serve(self, sock):
+        buffer = bytearray(RECV_SIZE)
+        view = memoryview(buffer)
+        data = b''
+        with sock:
+            while True:
+                while b'\r\n\r\n' not in data:
+                    chunk = sock.recv(RECV_SIZE)
+                    if not chunk:
+                        return
+                    data += chunk
+                head, _, data = data.partition(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n')[1:]:
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                remaining = length - len(data)
+                data = b''
+                while remaining > 0:
+                    n = sock.recv_into(view[:min(remaining, RECV_SIZE)])
+                    if not n:
+                        return
+                    remaining -= n
+                sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.listener.shutdown(socket.SHUT_RDWR)
+        self.listener.close()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+
+class NoFileno(object):
+    # Hides the file descriptor of the wrapped file, so requests/urllib3 only
+    # see a readable object.
+
+    def __init__(self, f, length):
+        self.f = f
+        self.len = length
+
+    def read(self, size=-1):
+        return self.f.read(size)
+
+
+def upload(session, url, body):
+    start_cpu = time.thread_time()
+    start = time.perf_counter()
+    r = session.post(url, data=body)
+    elapsed = time.perf_counter() - start
+    cpu = time.thread_time() - start_cpu
+    r.raise_for_status()
+    return elapsed, cpu
+
+
+def run(usock, size_mb):
+    """Return ``{method: (MB/s, client CPU seconds)}`` for one upload size"""
+    session = requests_unixsocket.Session()
+    urlencoded_usock = requests.compat.quote_plus(usock)
+    url = 'http+unix://%s/upload' % urlencoded_usock
+    size = size_mb * 1024 * 1024
+    results = {}
+    with tempfile.TemporaryFile() as f:
+        # Real bytes rather than a sparse file, so both read the page cache
+        block = b'x' * RECV_SIZE
+        for _ in range(size // RECV_SIZE):
+            f.write(block)
+        f.flush()
+        for name, body in [('sendfile', f), ('sendall', NoFileno(f, size))]:
+            f.seek(0)
+            elapsed, cpu = upload(session, url, body)
+            results[name] = (size_mb / elapsed, cpu)
+    session.close()
+    return results
+
+
+def main(*sizes_mb):
+    with SinkServer() as sink:
+        for size_mb in sizes_mb or SIZES_MB:
+            for name, (mb_per_s, cpu) in run(sink.usock, size_mb).items():
+                print('%5d MB %-9s %8.1f MB/s  client CPU %6.2fs'
+                      % (size_mb, name, mb_per_s, cpu))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,77 +1,63 @@
-import requests
-import sys
+"""
+Use requests to talk HTTP via a UNIX domain socket
 
-from .adapters import UnixAdapter
-
-DEFAULT_SCHEME = 'http+unix://'
-
-
-class Session(requests.Session):
-    def __init__(self, url_scheme=DEFAULT_SCHEME, *args, **kwargs):
-        super(Session, self).__init__(*args, **kwargs)
-        self.mount(url_scheme, UnixAdapter())
-
-
-class monkeypatch(object):
-    def __init__(self, url_scheme=DEFAULT_SCHEME):
-        self.session = Session()
-        requests = self._get_global_requests_module()
-
-        # Methods to replace
-        self.methods = ('request', 'get', 'head', 'post',
-                        'patch', 'put', 'delete', 'options')
-        # Store the original methods
-        self.orig_methods = dict(
-            (m, requests.__dict__[m]) for m in self.methods)
-        # Monkey patch
-        g = globals()
-        for m in self.methods:
-            requests.__dict__[m] = g[m]
-
-    def _get_global_requests_module(self):
-        return sys.modules['requests']
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, *args):
-        requests = self._get_global_requests_module()
-        for m in self.methods:
-            requests.__dict__[m] = self.orig_methods[m]
-
-
-# These are the same methods defined for the global requests object
-def request(method, url, **kwargs):
-    session = Session()
-    return session.request(method=method, url=url, **kwargs)
+The public names below are imported from their submodules on first use, so
+that ``import requests_unixsocket`` doesn't pay for importing requests and
+urllib3 in programs that may never talk to a socket.
+"""
 
+import importlib
 
-def get(url, **kwargs):
-    kwargs.setdefault('allow_redirects', True)
-    return request('get', url, **kwargs)
-
-
-def head(url, **kwargs):
-    kwargs.setdefault('allow_redirects', False)
-    return request('head', url, **kwargs)
-
-
-def post(url, data=None, json=None, **kwargs):
-    return request('post', url, data=data, json=json, **kwargs)
-
-
-def patch(url, data=None, **kwargs):
-    return request('patch', url, data=data, **kwargs)
-
-
-def put(url, data=None, **kwargs):
-    return request('put', url, data=data, **kwargs)
-
-
-def delete(url, **kwargs):
-    return request('delete', url, **kwargs)
-
+DEFAULT_SCHEME = 'http+unix://'
 
-def options(url, **kwargs):
-    kwargs.setdefault('allow_redirects', True)
-    return request('options', url, **kwargs)
+# Public name -> submodule that defines it
+_LAZY_ATTRIBUTES = {
+    'Session': 'sessions',
+    'MapResult': 'batch',
+    'monkeypatch': 'sessions',
+    'use_shared_session': 'sessions',
+    'get_shared_session': 'sessions',
+    'close_shared_session': 'sessions',
+    'request': 'sessions',
+    'get': 'sessions',
+    'head': 'sessions',
+    'post': 'sessions',
+    'patch': 'sessions',
+    'put': 'sessions',
+    'delete': 'sessions',
+    'options': 'sessions',
+    'UnixAdapter': 'adapters',
+    'TimingEvent': 'adapters',
+    'SeqpacketSocket': 'adapters',
+    'SEQPACKET_SUFFIX': 'adapters',
+    'AsyncSession': 'aio',
+    'CachingAdapter': 'cache',
+    'FastClient': 'fast',
+    'FastResponse': 'fast',
+    'CircuitBreaker': 'breaker',
+    'SocketUnavailable': 'breaker',
+    'ReplicaSet': 'balancer',
+    'UpgradedConnection': 'upgrade',
+    'upgrade_connection': 'upgrade',
+    'relay': 'upgrade',
+    'iter_content_views': 'streaming',
+    'iter_json_lines': 'streaming',
+    'iter_docker_frames': 'streaming',
+}
+
+__all__ = ['DEFAULT_SCHEME'] + sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError('module %r has no attribute %r'
+                             % (__name__, name))
+    value = getattr(importlib.import_module('.' + module_name, __name__),
+                    name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -1,28 +1,360 @@
+import collections
+import copy
+import functools
+import io
+import itertools
+import os
+import queue
+import re
 import socket
+import stat
+import struct
+import threading
+import time
+import weakref
 
 from requests.adapters import HTTPAdapter
 from requests.compat import urlparse, unquote
+from requests.cookies import RequestsCookieJar
+from requests.exceptions import ConnectionError, ReadTimeout
+from requests.models import Response
+from requests.utils import default_headers
 
 try:
     from requests.packages import urllib3
 except ImportError:
     import urllib3
 
+from .balancer import LEAST_OUTSTANDING, ReplicaSet
+from .breaker import CLOSED, CircuitBreaker, SocketUnavailable
+
+
+SOCKET_ADDRESS_CACHE_SIZE = 256
+BLOCKSIZE = 256 * 1024
+SEQPACKET_MESSAGE_SIZE = 64 * 1024
+SEQPACKET_SUFFIX = '+seqpacket'
+
+# Methods whose concurrent identical requests may share one response
+COALESCED_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+# Requests that may be sent again when a reused connection fails, as
+# sending them twice has the same effect as once (RFC 9110, 9.2.2)
+IDEMPOTENT_METHODS = frozenset(
+    ['GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT', 'DELETE'])
+
+# Peer processes whose sockets relay to another machine, so that responses
+# are worth compressing; see is_remote_forwarded().
+REMOTE_FORWARDERS = frozenset(['ssh', 'sshd'])
+
+# What to ask for when compression is wanted: the encodings urllib3 can
+# decode incrementally, best first.
+COMPRESSED_ENCODINGS = ', '.join(
+    encoding for encoding in ('zstd', 'gzip')
+    if encoding in urllib3.util.request.ACCEPT_ENCODING)
+
+_netloc_re = re.compile(r'[^:/?#]+://([^/?#]*)')
+_default_accept_encoding = default_headers()['Accept-Encoding']
+_trace_ids = itertools.count(1)
+_adapters = weakref.WeakSet()
+
+
+TimingEvent = collections.namedtuple(
+    'TimingEvent', 'name timestamp socket_address reused trace_id')
+TimingEvent.__doc__ = """An event passed to a :class:`UnixAdapter` observer
+
+``name`` is one of ``pool_checkout_start``, ``pool_checkout_end``,
+``connect_start``, ``connect_end``, ``connect_failed``, ``request_sent``,
+``headers_received`` and ``body_complete`` (sent when the connection goes
+back to the pool, which is once the body has been read in full).
+``timestamp`` is from :func:`time.monotonic`, ``reused`` tells whether the
+request got an already connected socket, and ``trace_id`` is the same for
+all the events of one request.
+"""
+
+
+@functools.lru_cache(maxsize=SOCKET_ADDRESS_CACHE_SIZE)
+def get_socket_address(netloc):
+    """Return the unix socket address named by a percent-encoded netloc
+
+    This is a filesystem path, or bytes for an abstract namespace socket
+    (a netloc starting with a NULL byte). Results are cached, since the same
+    few sockets are usually looked up for every request.
+    """
+    socket_address = unquote(netloc)
+    if socket_address.startswith('\0'):
+        return os.fsencode(socket_address)
+    return socket_address
+
+
+def get_socket_address_from_url(url):
+    """Return :func:`get_socket_address` for the netloc of ``url``"""
+    match = _netloc_re.match(url)
+    netloc = match.group(1) if match else urlparse(url).netloc
+    return get_socket_address(netloc)
+
+
+def is_remote_forwarded(sock):
+    """Whether the peer of a connected unix socket relays to another host
+
+    True when the process at the other end (from ``SO_PEERCRED``) is one of
+    ``REMOTE_FORWARDERS``, e.g. an ``ssh -L`` forwarded socket. Always false
+    where peer credentials aren't available.
+    """
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                struct.calcsize('3i'))
+        pid = struct.unpack('3i', creds)[0]
+        with open('/proc/%d/comm' % pid) as f:
+            return f.read().strip() in REMOTE_FORWARDERS
+    except (AttributeError, OSError, struct.error):
+        return False
+
+
+def get_socket_type_from_url(url):
+    """Return ``socket.SOCK_SEQPACKET`` for a URL scheme ending in
+    ``+seqpacket``, e.g. ``http+unix+seqpacket://``, else ``SOCK_STREAM``
+    """
+    if url.partition(':')[0].lower().endswith(SEQPACKET_SUFFIX):
+        return socket.SOCK_SEQPACKET
+    return socket.SOCK_STREAM
+
+
+class UnixSocket(socket.socket):
+    """A unix socket whose reads can be bounded by a total ``deadline``
+
+    ``deadline`` is a :func:`time.monotonic` value or None. While it's set,
+    every read waits no longer than the time left, and raises
+    ``socket.timeout`` once it has passed, however much data still trickles
+    in.
+    """
+
+    deadline = None
+    _timeout = None
+
+    def __init__(self, family=socket.AF_UNIX, type=socket.SOCK_STREAM,
+                 proto=0, fileno=None):
+        super(UnixSocket, self).__init__(family, type, proto, fileno)
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+        super(UnixSocket, self).settimeout(timeout)
+
+    def gettimeout(self):
+        # The timeout that was set, not one shortened by the deadline
+        return self._timeout
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout('timed out')
+            if self._timeout is None or remaining < self._timeout:
+                super(UnixSocket, self).settimeout(remaining)
+            else:
+                super(UnixSocket, self).settimeout(self._timeout)
+        return super(UnixSocket, self).recv_into(buffer, nbytes, flags)
+
+
+class SeqpacketSocket(UnixSocket):
+    """A ``SOCK_SEQPACKET`` unix socket that can be used as a byte stream
+
+    Every send is one message, and a receive into a smaller buffer than the
+    message loses the rest of it. So :meth:`sendall` splits data into
+    messages of at most ``SEQPACKET_MESSAGE_SIZE`` bytes, and
+    ``makefile('rb')`` returns a reader that always receives whole messages.
+    Peers can pack a small request or response into a single message.
+    """
+
+    def __init__(self, family=socket.AF_UNIX, type=socket.SOCK_SEQPACKET,
+                 proto=0, fileno=None):
+        super(SeqpacketSocket, self).__init__(family, type, proto, fileno)
+
+    def sendall(self, data, flags=0):
+        view = memoryview(data).cast('B')
+        for start in range(0, len(view), SEQPACKET_MESSAGE_SIZE):
+            super(SeqpacketSocket, self).sendall(
+                view[start:start + SEQPACKET_MESSAGE_SIZE], flags)
+
+    def makefile(self, mode='r', buffering=None, **kwargs):
+        if mode != 'rb':
+            return super(SeqpacketSocket, self).makefile(
+                mode, buffering, **kwargs)
+        raw = _MessageIO(self, mode)
+        self._io_refs += 1
+        if buffering == 0:
+            return raw
+        if buffering is None or buffering < 0:
+            buffering = io.DEFAULT_BUFFER_SIZE
+        return io.BufferedReader(raw, buffering)
+
+
+class AdaptiveTimeout(object):
+    """Timeouts for one socket, derived from its recent latencies
+
+    :param connect_timeout: Upper bound for the connect timeout.
+    :param read_timeout: Upper bound for the time to wait for response
+        headers.
+    :param percentile: Which percentile of recent latencies to scale.
+    :param multiplier: How many times that percentile to wait.
+    :param min_timeout: Lower bound for both timeouts.
+    :param window: How many recent latencies to keep.
+    :param min_samples: Use the upper bounds until this many latencies of a
+        kind have been seen.
+
+    Connect times and times from sending a request to receiving its response
+    headers are recorded separately. Only the wait for headers is shortened:
+    body reads keep ``read_timeout``, so slow streams aren't cut off.
+    """
+
+    def __init__(self, connect_timeout=60, read_timeout=60, percentile=99,
+                 multiplier=4, min_timeout=0.5, window=256, min_samples=20):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+        self.connect_times = collections.deque(maxlen=window)
+        self.response_times = collections.deque(maxlen=window)
+        self._recorded = {'connect': 0, 'response': 0}
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def record_connect(self, seconds):
+        with self._lock:
+            self.connect_times.append(seconds)
+            self._recorded['connect'] += 1
+
+    def record_response(self, seconds):
+        with self._lock:
+            self.response_times.append(seconds)
+            self._recorded['response'] += 1
+
+    def timeouts(self):
+        """Return the current ``(connect, read)`` timeouts"""
+        with self._lock:
+            return (self._derive('connect', self.connect_times,
+                                 self.connect_timeout),
+                    self._derive('response', self.response_times,
+                                 self.read_timeout))
+
+    def _derive(self, kind, samples, upper_bound):
+        if len(samples) < self.min_samples:
+            return upper_bound
+        # Sorting the window for every request would be wasteful, so the
+        # result is only recomputed once per 16 new samples.
+        recorded = self._recorded[kind]
+        derived = self._derived.get(kind)
+        if derived is not None and recorded - derived[0] < 16:
+            return derived[1]
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1,
+                    int(len(ordered) * self.percentile / 100.0))
+        timeout = max(self.min_timeout, ordered[index] * self.multiplier)
+        if upper_bound is not None:
+            timeout = min(timeout, upper_bound)
+        self._derived[kind] = (recorded, timeout)
+        return timeout
+
+
+# The body of a response is read with the timeout used for its headers
+_KEEP_READ_TIMEOUT = object()
+
+
+class _RequestTimeout(urllib3.util.Timeout):
+    # A Timeout that also carries the read timeout for the body (None to
+    # wait indefinitely), for when the wait for headers was shortened by an
+    # AdaptiveTimeout. urllib3 clones timeouts, so the clone has to keep it.
+    # An adaptive one is replaced by the pool's AdaptiveTimeout once the
+    # request has a pool, so that no replica is chosen just to look it up.
+
+    def __init__(self, body_read=_KEEP_READ_TIMEOUT, adaptive=False,
+                 **kwargs):
+        super(_RequestTimeout, self).__init__(**kwargs)
+        self.body_read = body_read
+        self.adaptive = adaptive
+
+    def clone(self):
+        return _RequestTimeout(body_read=self.body_read,
+                               adaptive=self.adaptive,
+                               connect=self._connect, read=self._read,
+                               total=self.total)
+
+
+class _MessageIO(socket.SocketIO):
+    # Reads a SOCK_SEQPACKET socket without truncating messages: the size of
+    # the next message is peeked with MSG_TRUNC (Linux), and whatever
+    # doesn't fit into the caller's buffer is kept for the next read.
+
+    def __init__(self, sock, mode):
+        super(_MessageIO, self).__init__(sock, mode)
+        self._pending = memoryview(b'')
+        self._peek_buffer = bytearray(1)
+
+    def readinto(self, b):
+        self._checkClosed()
+        self._checkReadable()
+        if not self._pending:
+            try:
+                size = self._sock.recv_into(
+                    self._peek_buffer, 1, socket.MSG_PEEK | socket.MSG_TRUNC)
+                if size <= len(b):
+                    return self._sock.recv_into(b)
+                self._pending = memoryview(self._sock.recv(size))
+            except socket.timeout:
+                self._timeout_occurred = True
+                raise
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
 
 # The following was adapted from some code from docker-py
 # https://github.com/docker/docker-py/blob/master/docker/transport/unixconn.py
 class UnixHTTPConnection(urllib3.connection.HTTPConnection, object):
 
-    def __init__(self, unix_socket_url, timeout=60):
+    def __init__(self, unix_socket_url, timeout=60, recv_buffer_size=None,
+                 observer=None, compression='auto',
+                 socket_type=socket.SOCK_STREAM, adaptive_timeout=None,
+                 breaker=None):
         """Create an HTTP connection to a unix domain socket
 
         :param unix_socket_url: A URL with a scheme of 'http+unix' and the
         netloc is a percent-encoded path to a unix domain socket. E.g.:
         'http+unix://%2Ftmp%2Fprofilesvc.sock/status/pid'
+        :param recv_buffer_size: If set, the ``SO_RCVBUF`` size to request
+        for the socket.
+        :param observer: If set, called with a :class:`TimingEvent` at each
+        step of a request.
+        :param compression: Whether to ask for compressed responses: True,
+        False, or ``'auto'`` to do so only if :func:`is_remote_forwarded`.
+        :param socket_type: ``socket.SOCK_STREAM`` or
+        ``socket.SOCK_SEQPACKET`` (see :class:`SeqpacketSocket`).
+        :param adaptive_timeout: If set, an :class:`AdaptiveTimeout` to
+        record connect and response times with.
+        :param breaker: If set, a
+        :class:`~requests_unixsocket.breaker.CircuitBreaker` to report
+        connect failures and successes to.
         """
-        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        super(UnixHTTPConnection, self).__init__(
+            'localhost', timeout=timeout, blocksize=BLOCKSIZE)
         self.unix_socket_url = unix_socket_url
         self.timeout = timeout
+        self.recv_buffer_size = recv_buffer_size
+        self.observer = observer
+        self.compression = compression
+        self.socket_type = socket_type
+        self.adaptive_timeout = adaptive_timeout
+        self.breaker = breaker
+        self.deadline = None
+        self.body_read_timeout = _KEEP_READ_TIMEOUT
+        self.request_started = None
+        self.remote_forwarded = None
+        self.reused = False
+        self.trace_id = None
+        self.connected_at = None
+        self.idle_since = None
         self.sock = None
 
     def __del__(self):  # base class does not have d'tor
@@ -30,58 +362,1019 @@ class UnixHTTPConnection(urllib3.connection.HTTPConnection, object):
             self.sock.close()
 
     def connect(self):
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        sock.settimeout(self.timeout)
-        socket_path = unquote(urlparse(self.unix_socket_url).netloc)
-        sock.connect(socket_path)
+        if self.observer is not None:
+            self.emit('connect_start')
+        if self.adaptive_timeout is not None:
+            connect_started = time.monotonic()
+        if self.socket_type == socket.SOCK_SEQPACKET:
+            sock = SeqpacketSocket()
+        else:
+            sock = UnixSocket(socket.AF_UNIX, self.socket_type)
+        timeout = self.timeout
+        if self.deadline is not None:
+            remaining = max(self.deadline - time.monotonic(), 0.001)
+            if timeout is None or remaining < timeout:
+                timeout = remaining
+        sock.settimeout(timeout)
+        sock.deadline = self.deadline
+        if self.recv_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                            self.recv_buffer_size)
+        try:
+            sock.connect(get_socket_address_from_url(self.unix_socket_url))
+        except BaseException as e:
+            sock.close()
+            if self.breaker is not None and isinstance(e, OSError):
+                self.breaker.record_failure()
+            if self.observer is not None:
+                self.emit('connect_failed')
+            # As urllib3's own connections do, so that callers can tell
+            # that the request was never sent
+            if isinstance(e, socket.timeout):
+                raise urllib3.exceptions.ConnectTimeoutError(
+                    self, 'Connection to %s timed out. (connect timeout=%s)'
+                    % (self.unix_socket_url, timeout)) from e
+            if isinstance(e, OSError):
+                raise urllib3.exceptions.NewConnectionError(
+                    self, 'Failed to establish a new connection: %s' % e
+                ) from e
+            raise
         self.sock = sock
+        self.connected_at = time.monotonic()
+        if self.breaker is not None:
+            self.breaker.record_success()
+        self.remote_forwarded = None
+        if self.adaptive_timeout is not None:
+            self.adaptive_timeout.record_connect(
+                time.monotonic() - connect_started)
+        if self.observer is not None:
+            self.emit('connect_end')
+
+    @property
+    def is_connected(self):
+        # Used by the pool before reusing a connection. An idle HTTP
+        # connection should have nothing to read: EOF means the server
+        # closed it, and stray bytes mean it's out of sync. Either way it
+        # gets reconnected. A non-blocking MSG_PEEK checks without
+        # consuming anything.
+        sock = self.sock
+        if sock is None:
+            return False
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.settimeout(timeout)
+        return False
+
+    def emit(self, name, timestamp=None):
+        """Pass a :class:`TimingEvent` for this connection to the observer"""
+        self.observer(TimingEvent(
+            name,
+            time.monotonic() if timestamp is None else timestamp,
+            get_socket_address_from_url(self.unix_socket_url),
+            self.reused,
+            self.trace_id))
+
+    def request(self, method, url, body=None, headers=None, **kwargs):
+        # Regular files of known length go straight from the page cache to
+        # the socket with sendfile(); everything else is sent by the base
+        # class in BLOCKSIZE pieces. sendfile() would ignore the message size
+        # limit of SOCK_SEQPACKET sockets, so it's only used for streams.
+        if self.adaptive_timeout is not None:
+            self.request_started = time.monotonic()
+        if self.sock is not None:
+            self.sock.deadline = self.deadline
+        headers = self._negotiate_encoding(headers)
+        content_length = None
+        if self.socket_type == socket.SOCK_STREAM:
+            content_length = _get_sendfile_length(body, headers)
+        if content_length is None:
+            super(UnixHTTPConnection, self).request(
+                method, url, body=body, headers=headers, **kwargs)
+        else:
+            super(UnixHTTPConnection, self).request(
+                method, url, body=None, headers=headers, **kwargs)
+            self.sock.sendfile(body, body.tell(), content_length)
+        if self.observer is not None:
+            self.emit('request_sent')
+
+    def _negotiate_encoding(self, headers):
+        # Only the default Accept-Encoding of requests is replaced; one set
+        # by the caller is sent as is.
+        if not headers or \
+                headers.get('Accept-Encoding') != _default_accept_encoding:
+            return headers
+        compress = self.compression
+        if compress == 'auto':
+            if self.sock is None:
+                self.connect()
+            if self.remote_forwarded is None:
+                self.remote_forwarded = is_remote_forwarded(self.sock)
+            compress = self.remote_forwarded
+        headers = headers.copy()
+        headers['Accept-Encoding'] = (
+            COMPRESSED_ENCODINGS if compress else 'identity')
+        return headers
+
+    def getresponse(self, *args, **kwargs):
+        response = super(UnixHTTPConnection, self).getresponse(
+            *args, **kwargs)
+        if self.adaptive_timeout is not None:
+            self.adaptive_timeout.record_response(
+                time.monotonic() - self.request_started)
+        if self.body_read_timeout is not _KEEP_READ_TIMEOUT:
+            self.sock.settimeout(self.body_read_timeout)
+        if self.observer is not None:
+            self.emit('headers_received')
+        return response
+
+
+def _get_sendfile_length(body, headers):
+    if body is None or not headers:
+        return None
+    try:
+        fileno = body.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    if not stat.S_ISREG(os.fstat(fileno).st_mode):
+        return None
+    for name, value in headers.items():
+        if name.lower() == 'content-length':
+            return int(value)
+    return None
 
 
 class UnixHTTPConnectionPool(urllib3.connectionpool.HTTPConnectionPool):
 
-    def __init__(self, socket_path, timeout=60):
+    def __init__(self, socket_path, timeout=60, maxsize=1, block=False,
+                 replica_set=None, idle_timeout=None, fd_budget=None,
+                 **kwargs):
+        if isinstance(timeout, tuple):
+            timeout = urllib3.util.Timeout(connect=timeout[0],
+                                           read=timeout[1])
         super(UnixHTTPConnectionPool, self).__init__(
-            'localhost', timeout=timeout)
+            'localhost', timeout=timeout, maxsize=maxsize, block=block,
+            **kwargs)
         self.socket_path = socket_path
-        self.timeout = timeout
+        self.replica_set = replica_set
+        if replica_set is not None:
+            self.socket_address = get_socket_address_from_url(socket_path)
+        self.num_reused = 0
+        self.num_created = 0
+        self.num_discarded = 0
+        self.num_reaped = 0
+        self.num_in_use = 0
+        self.idle_timeout = idle_timeout
+        self.fd_budget = fd_budget
+        self.created_at = self.last_used = time.monotonic()
+        # Every connection of this pool that is still referenced, idle or
+        # not, to count and describe their sockets
+        self.connections = weakref.WeakSet()
+        self._stats_lock = threading.Lock()
+        self.observer = self.conn_kw.get('observer')
+        self.adaptive_timeout = self.conn_kw.get('adaptive_timeout')
 
     def _new_conn(self):
-        return UnixHTTPConnection(self.socket_path, self.timeout)
+        self.num_connections += 1
+        conn = UnixHTTPConnection(
+            self.socket_path,
+            urllib3.util.Timeout.resolve_default_timeout(
+                self.timeout.connect_timeout),
+            **self.conn_kw)
+        with self._stats_lock:
+            self.connections.add(conn)
+        return conn
+
+    def _make_request(self, conn, method, url, *args, **kwargs):
+        # A total timeout also bounds reading the body, through the
+        # socket's deadline. Retries get a new one.
+        timeout = kwargs.get('timeout')
+        if (getattr(timeout, 'adaptive', False)
+                and self.adaptive_timeout is not None):
+            connect, read = self.adaptive_timeout.timeouts()
+            timeout = kwargs['timeout'] = _RequestTimeout(
+                body_read=timeout.body_read, connect=connect, read=read,
+                total=timeout.total)
+        total = getattr(timeout, 'total', None)
+        conn.deadline = None if total is None else time.monotonic() + total
+        conn.body_read_timeout = getattr(
+            timeout, 'body_read', _KEEP_READ_TIMEOUT)
+        return super(UnixHTTPConnectionPool, self)._make_request(
+            conn, method, url, *args, **kwargs)
+
+    def _get_conn(self, timeout=None):
+        if self.observer is not None:
+            checkout_start = time.monotonic()
+        conn = super(UnixHTTPConnectionPool, self)._get_conn(timeout)
+        if self.replica_set is not None:
+            self.replica_set.acquire(self.socket_address)
+        now = time.monotonic()
+        expired = (self.idle_timeout is not None and conn.sock is not None
+                   and conn.idle_since is not None
+                   and now - conn.idle_since >= self.idle_timeout)
+        if expired:
+            # Not reaped yet, but past its idle timeout all the same
+            conn.close()
+        conn.idle_since = None
+        reused = conn.sock is not None
+        with self._stats_lock:
+            if reused:
+                self.num_reused += 1
+            else:
+                self.num_created += 1
+            self.num_reaped += expired
+            self.num_in_use += 1
+            self.last_used = now
+        if not reused and self.fd_budget is not None:
+            self.fd_budget.make_room(1)
+        if self.observer is not None:
+            conn.reused = reused
+            conn.trace_id = next(_trace_ids)
+            conn.emit('pool_checkout_start', checkout_start)
+            conn.emit('pool_checkout_end')
+        return conn
+
+    def _put_conn(self, conn):
+        if self.replica_set is not None:
+            self.replica_set.release(self.socket_address)
+        if conn is not None and self.observer is not None:
+            conn.emit('body_complete')
+        now = time.monotonic()
+        if conn is not None:
+            conn.idle_since = now
+        pool = self.pool
+        with self._stats_lock:
+            if conn is not None and (pool is None or pool.full()):
+                self.num_discarded += 1
+            self.num_in_use -= 1
+            self.last_used = now
+        super(UnixHTTPConnectionPool, self)._put_conn(conn)
+        if self.fd_budget is not None and self.fd_budget.exceeded:
+            self.fd_budget.make_room(0)
+
+    def prewarm(self, connections=None):
+        """Connect up to ``connections`` idle sockets now
+
+        Defaults to filling the pool. Connections that are already open and
+        alive are kept. Returns the number of sockets that were opened.
+        """
+        if connections is None:
+            connections = self.pool.maxsize
+        taken = []
+        opened = 0
+        try:
+            for _ in range(connections):
+                try:
+                    taken.append(self.pool.get(block=False))
+                except queue.Empty:
+                    break
+            for i, conn in enumerate(taken):
+                if conn is None:
+                    conn = taken[i] = self._new_conn()
+                if not conn.is_connected:
+                    conn.close()
+                    conn.connect()
+                    conn.idle_since = time.monotonic()
+                    opened += 1
+        finally:
+            for conn in taken:
+                self.pool.put(conn, block=False)
+            with self._stats_lock:
+                self.num_created += opened
+        return opened
+
+    def _close_inherited_sockets(self):
+        # Called in a forked child. Other threads of the parent may have held
+        # this pool's locks at fork time, so don't take any; just close the
+        # child's copies of the idle sockets, which leaves the parent's open.
+        pool = self.pool
+        if pool is not None:
+            for conn in list(pool.queue):
+                if conn is not None and conn.sock is not None:
+                    conn.sock.close()
+                    conn.sock = None
+
+    def idle_connections(self):
+        """Return the connections waiting in the pool with an open socket"""
+        pool = self.pool
+        if pool is None:
+            return []
+        with pool.mutex:
+            return [conn for conn in pool.queue
+                    if conn is not None and conn.sock is not None]
+
+    def close_idle(self, idle_since=None, connections=None):
+        """Close the sockets of connections waiting in the pool
+
+        Only those idle since before the ``idle_since`` timestamp (from
+        ``time.monotonic()``), or only those in ``connections``, if given.
+        The connections stay in the pool and reconnect when next used.
+        Returns the number of sockets closed.
+        """
+        pool = self.pool
+        if pool is None:
+            return 0
+        closed = 0
+        # Holding the queue's lock, none of them can be checked out meanwhile
+        with pool.mutex:
+            for conn in pool.queue:
+                if conn is None or conn.sock is None:
+                    continue
+                if idle_since is not None and conn.idle_since is not None \
+                        and conn.idle_since > idle_since:
+                    continue
+                if connections is not None and conn not in connections:
+                    continue
+                conn.close()
+                closed += 1
+        with self._stats_lock:
+            self.num_reaped += closed
+        return closed
+
+    def is_unused_since(self, timestamp):
+        """Whether no connection was checked out or returned after the
+        ``timestamp`` (from ``time.monotonic()``), and none is in use
+        """
+        with self._stats_lock:
+            return not self.num_in_use and self.last_used <= timestamp
+
+    def open_sockets(self):
+        """Return the number of connections of this pool with a socket
+        open, in use or idle
+        """
+        with self._stats_lock:
+            connections = list(self.connections)
+        return sum(1 for conn in connections if conn.sock is not None)
+
+    def describe(self, now=None):
+        """Return the pool's ``age`` and ``idle_for`` (None while a
+        connection is in use) in seconds, its number of connections
+        ``in_use``, and ``connections``: the ``fileno``, ``age`` and
+        ``idle_for`` (None while in use) of each open socket, oldest first
+        """
+        if now is None:
+            now = time.monotonic()
+        with self._stats_lock:
+            connections = list(self.connections)
+            in_use = self.num_in_use
+            last_used = self.last_used
+        described = []
+        for conn in connections:
+            sock = conn.sock
+            if sock is None:
+                continue
+            idle_since = conn.idle_since
+            described.append({
+                'fileno': sock.fileno(),
+                'age': now - conn.connected_at,
+                'idle_for': None if idle_since is None else now - idle_since,
+            })
+        described.sort(key=lambda conn: conn['age'], reverse=True)
+        return {
+            'age': now - self.created_at,
+            'idle_for': None if in_use else now - last_used,
+            'in_use': in_use,
+            'connections': described,
+        }
+
+    def stats(self):
+        """Return connection reuse counters for this pool
+
+        ``created`` counts checkouts that had to open a new socket,
+        ``reused`` counts checkouts of an already connected socket,
+        ``discarded`` counts connections closed because the pool was full or
+        closed, ``reaped`` counts sockets closed for being idle too long or
+        to stay within ``max_fds``, and ``idle`` is the number of connected
+        sockets currently waiting in the pool.
+        """
+        pool = self.pool
+        idle = 0
+        if pool is not None:
+            with pool.mutex:
+                idle = sum(1 for conn in pool.queue
+                           if conn is not None and conn.sock is not None)
+        with self._stats_lock:
+            return {
+                'created': self.num_created,
+                'reused': self.num_reused,
+                'discarded': self.num_discarded,
+                'reaped': self.num_reaped,
+                'idle': idle,
+            }
 
 
 class UnixAdapter(HTTPAdapter):
+    """Transport adapter for ``http+unix://`` URLs
+
+    :param timeout: Connect timeout in seconds for requests sent without
+        one, or a ``(connect, read)`` tuple to also bound reads.
+    :param read_timeout: Read timeout in seconds for requests sent without
+        one, if ``timeout`` is a number. It applies to each wait for data,
+        not to the whole response. By default reads wait indefinitely, as
+        with requests, so that streams such as ``/events`` can go quiet.
+    :param pool_connections: Number of socket pools to keep around.
+    :param pool_maxsize: Maximum number of connections kept open per socket.
+    :param max_retries: Retries per request, as for
+        :class:`requests.adapters.HTTPAdapter`.
+    :param pool_block: Whether to wait for a free connection instead of
+        opening a throwaway one when ``pool_maxsize`` are in use.
+    :param recv_buffer_size: ``SO_RCVBUF`` size for new sockets, for large
+        downloads read with :func:`requests_unixsocket.iter_content_views`.
+    :param observer: A callable that gets a :class:`TimingEvent` at each
+        step of every request, e.g. to feed latency histograms. Nothing is
+        timed without one.
+    :param compression: Whether to ask for compressed (zstd or gzip)
+        responses instead of the uncompressed ones that suit a local
+        socket: True, False, ``'auto'`` (the default) to compress only on
+        sockets that :func:`is_remote_forwarded`, or a dict mapping socket
+        addresses to one of these, with ``'auto'`` for the others. Only the
+        default ``Accept-Encoding`` header of requests is replaced.
+    :param socket_type: Force ``socket.SOCK_STREAM`` or
+        ``socket.SOCK_SEQPACKET`` sockets. By default this is chosen by the
+        URL scheme; see :func:`get_socket_type_from_url`.
+    :param total_timeout: If set, the most seconds a request may take from
+        connecting to reading the last byte of the body (each retry starts
+        over). A ``urllib3.Timeout`` passed as a request's ``timeout`` can
+        set its own ``total``.
+    :param adaptive_timeout: True, or a dict of :class:`AdaptiveTimeout`
+        arguments, to derive the timeouts of requests sent without one from
+        each socket's recent latencies, with ``timeout`` and
+        ``read_timeout`` as upper bounds.
+    :param circuit_breaker: True, or a dict of
+        :class:`~requests_unixsocket.breaker.CircuitBreaker` arguments, to
+        fail requests to a socket fast with
+        :class:`~requests_unixsocket.breaker.SocketUnavailable` after
+        repeated failed connects. See :meth:`breaker_states`.
+    :param replicas: A dict mapping logical netlocs to the socket addresses
+        of the replicas serving them (or to a
+        :class:`~requests_unixsocket.balancer.ReplicaSet`). A request to
+        ``http+unix://<netloc>/...`` goes to one of the sockets, each with
+        its own pool; sockets that fail to connect are ejected for a while,
+        and the request is retried on another one. See
+        :meth:`replica_states`.
+    :param balancing: How to pick a replica socket:
+        ``'least_outstanding'`` (the default) or ``'power_of_two'``.
+    :param coalesce: Let concurrent identical GET, HEAD and OPTIONS requests
+        (same socket, path, query and headers, without a body or
+        ``stream=True``) share one request to the socket. The body is read
+        once, and every waiting request gets its own :class:`Response` with
+        it, or a copy of the exception chained from the first one. A waiting
+        request that reaches its own timeout first raises
+        :class:`requests.ReadTimeout`. See :meth:`coalescing_stats`.
+    :param idle_timeout: Seconds a connection may wait in its pool before
+        its socket is closed.
+    :param pool_idle_timeout: Seconds a pool may go unused before it is
+        dropped, with its idle sockets, e.g. for sockets of containers that
+        are gone.
+    :param max_fds: The most sockets to keep open across all pools. Idle
+        ones are closed, longest idle first, to make room for new ones;
+        sockets in use are never closed, so while more are in use the
+        budget is exceeded, until they are returned.
+    :param reap_interval: Seconds between checks for idle connections and
+        pools (see :meth:`reap_idle`), by default half the shortest idle
+        timeout. The checks are made while sending requests, or by a
+        background thread if ``reaper_thread`` is True, which also closes
+        what goes idle while no requests are sent. ``close()`` stops it.
+    """
 
     def __init__(self, timeout=60, pool_connections=25, *args, **kwargs):
+        self.recv_buffer_size = kwargs.pop('recv_buffer_size', None)
+        self.observer = kwargs.pop('observer', None)
+        self.compression = kwargs.pop('compression', 'auto')
+        self.socket_type = kwargs.pop('socket_type', None)
+        self.total_timeout = kwargs.pop('total_timeout', None)
+        read_timeout = kwargs.pop('read_timeout', None)
+        self.adaptive_timeout = kwargs.pop('adaptive_timeout', None)
+        self.circuit_breaker = kwargs.pop('circuit_breaker', None)
+        self.replicas = self._make_replica_sets(
+            kwargs.pop('replicas', None),
+            kwargs.pop('balancing', LEAST_OUTSTANDING))
+        self.coalesce = kwargs.pop('coalesce', False)
+        self.idle_timeout = kwargs.pop('idle_timeout', None)
+        self.pool_idle_timeout = kwargs.pop('pool_idle_timeout', None)
+        self.max_fds = kwargs.pop('max_fds', None)
+        self.reap_interval = kwargs.pop('reap_interval', None)
+        reaper_thread = kwargs.pop('reaper_thread', False)
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.num_flights = 0
+        self.num_coalesced = 0
+        if self.socket_type not in (None, socket.SOCK_STREAM,
+                                    socket.SOCK_SEQPACKET):
+            raise ValueError('%s only supports SOCK_STREAM and '
+                             'SOCK_SEQPACKET sockets'
+                             % self.__class__.__name__)
+        if isinstance(self.compression, dict):
+            self.compression = dict(
+                (_normalize_socket_address(address), compression)
+                for address, compression in self.compression.items())
         super(UnixAdapter, self).__init__(*args, **kwargs)
         self.timeout = timeout
-        self.pools = urllib3._collections.RecentlyUsedContainer(
-            pool_connections, dispose_func=lambda p: p.close()
+        if isinstance(timeout, tuple):
+            self._connect_timeout, self._read_timeout = timeout
+        else:
+            self._connect_timeout = timeout
+            self._read_timeout = read_timeout
+        self._default_timeout = self._make_timeout(
+            (self._connect_timeout, self._read_timeout))
+        self.pool_connections = pool_connections
+        self.pools = self._new_pools()
+        self.fd_budget = None
+        if self.max_fds is not None:
+            self.fd_budget = _FdBudget(self, self.max_fds)
+        if self.reap_interval is None:
+            idle_timeouts = [t for t in (self.idle_timeout,
+                                         self.pool_idle_timeout)
+                             if t is not None]
+            if idle_timeouts:
+                self.reap_interval = min(idle_timeouts) / 2.0
+        self._next_reap = None
+        self._reaper_stopped = None
+        if reaper_thread:
+            if self.reap_interval is None:
+                raise ValueError('reaper_thread needs idle_timeout, '
+                                 'pool_idle_timeout or reap_interval')
+            self._start_reaper()
+        elif self.reap_interval is not None:
+            self._next_reap = time.monotonic() + self.reap_interval
+        _adapters.add(self)
+
+    @staticmethod
+    def _make_replica_sets(replicas, balancing):
+        replica_sets = {}
+        for netloc, socket_addresses in (replicas or {}).items():
+            if not isinstance(socket_addresses, ReplicaSet):
+                socket_addresses = ReplicaSet(
+                    [_normalize_socket_address(socket_address)
+                     for socket_address in socket_addresses],
+                    strategy=balancing)
+            replica_sets[get_socket_address(netloc)] = socket_addresses
+        return replica_sets
+
+    def _new_pools(self):
+        return urllib3._collections.RecentlyUsedContainer(
+            self.pool_connections, dispose_func=lambda p: p.close()
         )
 
+    def _reset_after_fork(self):
+        # The child must not share sockets with its parent, and the pools'
+        # locks may have been held by threads that don't exist in the child,
+        # so start over with new pools.
+        old_pools, self.pools = self.pools, self._new_pools()
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        for replica_set in self.replicas.values():
+            replica_set._reset_after_fork()
+        if self.fd_budget is not None:
+            self.fd_budget = _FdBudget(self, self.max_fds)
+        for pool in list(old_pools._container.values()):
+            pool._close_inherited_sockets()
+        if self._reaper_stopped is not None:
+            # Threads don't survive fork()
+            self._start_reaper()
+
     # Fix for requests 2.32.2+: https://github.com/psf/requests/pull/6710
     def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
         return self.get_connection(request.url, proxies)
 
     def get_connection(self, url, proxies=None):
-        proxies = proxies or {}
-        proxy = proxies.get(urlparse(url.lower()).scheme)
-
-        if proxy:
+        if proxies and proxies.get(url.partition(':')[0].lower()):
             raise ValueError('%s does not support specifying proxies'
                              % self.__class__.__name__)
 
+        if (self._next_reap is not None
+                and time.monotonic() >= self._next_reap):
+            self.reap_idle()
+
+        replica_set = None
+        if self.replicas:
+            replica_set = self.replicas.get(get_socket_address_from_url(url))
+            if replica_set is not None:
+                url = replica_set.url_for(replica_set.choose())
+        return self._get_pool(url, replica_set)
+
+    def _get_pool(self, url, replica_set=None):
+        pool_key = self._get_pool_key(url)
         with self.pools.lock:
-            pool = self.pools.get(url)
+            pool = self.pools.get(pool_key)
             if pool:
                 return pool
 
-            pool = UnixHTTPConnectionPool(url, self.timeout)
-            self.pools[url] = pool
+            if replica_set is None:
+                breaker = self.get_breaker(url)
+            else:
+                breaker = replica_set.breakers[pool_key[0]]
+            pool = UnixHTTPConnectionPool(
+                url, self.timeout,
+                maxsize=self._pool_maxsize,
+                block=self._pool_block,
+                replica_set=replica_set,
+                recv_buffer_size=self.recv_buffer_size,
+                observer=self.observer,
+                compression=self.get_compression(pool_key[0]),
+                socket_type=pool_key[-1],
+                adaptive_timeout=self._new_adaptive_timeout(),
+                breaker=breaker,
+                idle_timeout=self.idle_timeout,
+                fd_budget=self.fd_budget)
+            self.pools[pool_key] = pool
 
         return pool
 
+    def _get_pool_key(self, url):
+        # Pools are shared by every request to the same socket, so the key
+        # is the decoded socket address rather than the full request URL.
+        # Anything that changes how connections are made goes in too.
+        socket_type = self.socket_type
+        if socket_type is None:
+            socket_type = get_socket_type_from_url(url)
+        return (get_socket_address_from_url(url), self.timeout,
+                self._pool_maxsize, self._pool_block,
+                self.recv_buffer_size, socket_type)
+
+    def get_breaker(self, url):
+        """Return the circuit breaker for the socket of ``url``, or None if
+        ``circuit_breaker`` isn't enabled
+        """
+        if not self.circuit_breaker:
+            return None
+        socket_address = get_socket_address_from_url(url)
+        breaker = self.breakers.get(socket_address)
+        if breaker is None:
+            options = {}
+            if isinstance(self.circuit_breaker, dict):
+                options = self.circuit_breaker
+            with self._breakers_lock:
+                breaker = self.breakers.setdefault(
+                    socket_address, CircuitBreaker(socket_address, **options))
+        return breaker
+
+    def breaker_states(self):
+        """Return :meth:`CircuitBreaker.snapshot` for every socket with a
+        circuit breaker, keyed by socket address
+        """
+        with self._breakers_lock:
+            breakers = list(self.breakers.items())
+        return dict((socket_address, breaker.snapshot())
+                    for socket_address, breaker in breakers)
+
+    def replica_states(self):
+        """Return :meth:`ReplicaSet.snapshot` for every logical netloc in
+        ``replicas``, keyed by netloc
+        """
+        return dict((netloc, replica_set.snapshot())
+                    for netloc, replica_set in self.replicas.items())
+
+    def _new_adaptive_timeout(self):
+        if not self.adaptive_timeout:
+            return None
+        options = dict(connect_timeout=self._connect_timeout,
+                       read_timeout=self._read_timeout)
+        if isinstance(self.adaptive_timeout, dict):
+            options.update(self.adaptive_timeout)
+        return AdaptiveTimeout(**options)
+
+    def _make_timeout(self, timeout, body_read=_KEEP_READ_TIMEOUT):
+        if isinstance(timeout, urllib3.util.Timeout):
+            return timeout
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        return _RequestTimeout(body_read=body_read, connect=connect,
+                               read=read, total=self.total_timeout)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        if (self.coalesce and not stream and request.body is None
+                and request.method in COALESCED_METHODS):
+            return self._send_coalesced(request, dict(
+                timeout=timeout, verify=verify, cert=cert, proxies=proxies))
+        return self._send(request, stream, timeout, verify, cert, proxies)
+
+    def _send_coalesced(self, request, kwargs):
+        # The first request with a key sends it; the others that come while
+        # it's in flight wait for its response, or exception.
+        key = (get_socket_address_from_url(request.url), request.method,
+               request.path_url,
+               tuple(sorted((name.lower(), value)
+                            for name, value in request.headers.items())))
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.num_flights += 1
+            else:
+                self.num_coalesced += 1
+        if not leader:
+            # Waiting for the response is all this request does, so its
+            # timeout bounds the wait
+            if not flight.done.wait(self._wait_timeout(kwargs['timeout'])):
+                raise ReadTimeout(
+                    'Timed out waiting for an identical request in flight',
+                    request=request)
+            if flight.error is not None:
+                raise _copy_error(flight.error, request) from flight.error
+            return _copy_response(flight.response, request)
+        try:
+            response = self._send(request, **kwargs)
+            response.content  # read it all, for the others too
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            flight.response = response
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+        return response
+
+    def _wait_timeout(self, timeout):
+        if timeout is None:
+            timeout = self._default_timeout
+        else:
+            timeout = self._make_timeout(timeout)
+        if timeout.total is not None:
+            return timeout.total
+        return urllib3.util.Timeout.resolve_default_timeout(
+            timeout.read_timeout)
+
+    def coalescing_stats(self):
+        """Return request coalescing counters
+
+        ``sent`` counts the requests that went to the socket with
+        ``coalesce`` on, ``coalesced`` those that got the response of an
+        identical request in flight instead, and ``in_flight`` is the number
+        of requests that others can join now.
+        """
+        with self._flights_lock:
+            return {
+                'sent': self.num_flights,
+                'coalesced': self.num_coalesced,
+                'in_flight': len(self._flights),
+            }
+
+    def _send(self, request, stream=False, timeout=None, verify=True,
+              cert=None, proxies=None):
+        # Requests sent without a timeout get the adapter's, or one derived
+        # from the socket's latencies in adaptive mode.
+        if timeout is None:
+            if self.adaptive_timeout:
+                # Filled in by the pool the request is sent on
+                timeout = _RequestTimeout(
+                    body_read=self._read_timeout, adaptive=True,
+                    connect=self._connect_timeout, read=self._read_timeout,
+                    total=self.total_timeout)
+            else:
+                timeout = self._default_timeout
+        elif self.total_timeout is not None:
+            timeout = self._make_timeout(timeout)
+        if self.replicas:
+            replica_set = self.replicas.get(
+                get_socket_address_from_url(request.url))
+            if replica_set is not None:
+                return self._send_to_replica(
+                    replica_set, request, stream=stream, timeout=timeout,
+                    verify=verify, cert=cert, proxies=proxies)
+        if not self.circuit_breaker:
+            return super(UnixAdapter, self).send(
+                request, stream=stream, timeout=timeout, verify=verify,
+                cert=cert, proxies=proxies)
+        breaker = self.get_breaker(request.url)
+        try:
+            breaker.before_request()
+        except SocketUnavailable as e:
+            e.request = request
+            raise
+        response = super(UnixAdapter, self).send(
+            request, stream=stream, timeout=timeout, verify=verify,
+            cert=cert, proxies=proxies)
+        breaker.record_success()
+        return response
+
+    def _send_to_replica(self, replica_set, request, **kwargs):
+        # Each attempt picks a socket in get_connection(). One that fails to
+        # connect is ejected by its breaker and never got the request, so
+        # that is safe to retry on another socket, whatever the method.
+        attempts = len(replica_set.socket_addresses)
+        connect_error = None
+        for attempt in range(attempts):
+            try:
+                return super(UnixAdapter, self).send(request, **kwargs)
+            except SocketUnavailable as e:
+                if connect_error is not None:
+                    raise connect_error
+                e.request = request
+                raise
+            except ConnectionError as e:
+                reason = getattr(e.args[0] if e.args else None, 'reason',
+                                 None)
+                if attempt + 1 == attempts or not isinstance(
+                        reason, urllib3.exceptions.NewConnectionError):
+                    raise
+                connect_error = e
+
+    def get_compression(self, socket_address):
+        """Return the ``compression`` setting for a socket address"""
+        if isinstance(self.compression, dict):
+            return self.compression.get(socket_address, 'auto')
+        return self.compression
+
+    def prewarm(self, url, connections=None):
+        """Open up to ``connections`` sockets to the socket of ``url`` ahead
+        of time; see :meth:`UnixHTTPConnectionPool.prewarm`
+        """
+        if self.replicas:
+            replica_set = self.replicas.get(get_socket_address_from_url(url))
+            if replica_set is not None:
+                return sum(
+                    self._get_pool(replica_set.url_for(socket_address),
+                                   replica_set).prewarm(connections)
+                    for socket_address in replica_set.socket_addresses)
+        return self.get_connection(url).prewarm(connections)
+
+    def pool_stats(self):
+        """Return :meth:`UnixHTTPConnectionPool.stats` for every open pool,
+        keyed by socket address
+        """
+        return dict((key[0], pool.stats())
+                    for key, pool in self._open_pools())
+
+    def pool_info(self):
+        """Return :meth:`UnixHTTPConnectionPool.describe` for every open
+        pool, keyed by socket address
+        """
+        now = time.monotonic()
+        return dict((key[0], pool.describe(now))
+                    for key, pool in self._open_pools())
+
+    def _open_pools(self):
+        # Snapshot without touching the LRU order of self.pools
+        with self.pools.lock:
+            return list(self.pools._container.items())
+
+    def reap_idle(self):
+        """Close the sockets of connections idle for ``idle_timeout`` and
+        drop pools unused for ``pool_idle_timeout``
+
+        Called every ``reap_interval`` anyway. Returns the number of
+        ``connections`` and ``pools`` closed, as a dict.
+        """
+        now = time.monotonic()
+        if self._next_reap is not None:
+            self._next_reap = now + self.reap_interval
+        closed = dropped = 0
+        for key, pool in self._open_pools():
+            if (self.pool_idle_timeout is not None and pool.is_unused_since(
+                    now - self.pool_idle_timeout)):
+                with self.pools.lock:
+                    # Not with del, which would close the pool: a request
+                    # may have just got it from get_connection(). Its
+                    # connection gets closed with the pool once that's
+                    # garbage.
+                    dropped += self.pools._container.pop(key, None) is pool
+                closed += pool.close_idle()
+                self._drop_breaker(key[0])
+            elif self.idle_timeout is not None:
+                closed += pool.close_idle(now - self.idle_timeout)
+        return {'connections': closed, 'pools': dropped}
+
+    def _drop_breaker(self, socket_address):
+        # The breaker of a socket that has gone unused; unless it's keeping
+        # requests away from the socket, a new one will do.
+        with self._breakers_lock:
+            breaker = self.breakers.get(socket_address)
+            if breaker is not None and breaker.state == CLOSED:
+                del self.breakers[socket_address]
+
+    def _start_reaper(self):
+        self._reaper_stopped = threading.Event()
+        thread = threading.Thread(
+            target=_reap_periodically, name='requests_unixsocket reaper',
+            args=(weakref.ref(self), self.reap_interval,
+                  self._reaper_stopped))
+        thread.daemon = True
+        thread.start()
+
     def request_url(self, request, proxies):
         return request.path_url
 
     def close(self):
         self.pools.clear()
+        if self._reaper_stopped is not None:
+            self._reaper_stopped.set()
+            self._reaper_stopped = None
+            # Later requests reap instead
+            self._next_reap = time.monotonic() + self.reap_interval
+
+
+class _Flight(object):
+    __slots__ = ('done', 'response', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def _copy_error(error, request):
+    # An exception of its own for each coalesced request: raising the same
+    # one from several threads would mix up their tracebacks
+    try:
+        error = copy.copy(error)
+    except Exception:
+        return error
+    if hasattr(error, 'request'):
+        error.request = request
+    return error
+
+
+def _copy_response(response, request):
+    # A Response of its own for each coalesced request, sharing the body
+    copy = Response()
+    copy.status_code = response.status_code
+    copy.reason = response.reason
+    copy.headers = response.headers.copy()
+    copy.encoding = response.encoding
+    copy.raw = response.raw
+    copy.url = response.url
+    copy.elapsed = response.elapsed
+    copy.connection = response.connection
+    copy._content = response._content
+    copy._content_consumed = True
+    copy.cookies = RequestsCookieJar()
+    copy.cookies.update(response.cookies)
+    copy.request = request
+    return copy
+
+
+class _FdBudget(object):
+    # Keeps the sockets of an adapter's pools within max_fds by closing the
+    # longest idle ones
+
+    def __init__(self, adapter, max_fds):
+        self.adapter = weakref.ref(adapter)
+        self.max_fds = max_fds
+        self.exceeded = False
+        self._lock = threading.Lock()
+
+    def make_room(self, needed):
+        adapter = self.adapter()
+        if adapter is None:
+            return
+        pools = [pool for _, pool in adapter._open_pools()]
+        with self._lock:
+            excess = sum(pool.open_sockets() for pool in pools) + needed - \
+                self.max_fds
+            if excess > 0:
+                idle = sorted(
+                    ((conn.idle_since or 0, i, pool, conn)
+                     for i, pool in enumerate(pools)
+                     for conn in pool.idle_connections()),
+                    key=lambda item: item[:2])
+                by_pool = collections.OrderedDict()
+                for _, _, pool, conn in idle[:excess]:
+                    by_pool.setdefault(pool, []).append(conn)
+                for pool, connections in by_pool.items():
+                    excess -= pool.close_idle(connections=connections)
+            self.exceeded = excess > 0
+
+
+def _reap_periodically(adapter_ref, interval, stopped):
+    # Holds the adapter only while reaping, so that it can still be garbage
+    # collected if it's never closed
+    while not stopped.wait(interval):
+        adapter = adapter_ref()
+        if adapter is None:
+            return
+        adapter.reap_idle()
+        del adapter
+
+
+def _normalize_socket_address(socket_address):
+    # Abstract namespace addresses may be given as str, but are looked up
+    # as the bytes that get_socket_address() returns.
+    if isinstance(socket_address, str) and socket_address.startswith('\0'):
+        return os.fsencode(socket_address)
+    return socket_address
+
+
+def _reset_adapters_after_fork():
+    for adapter in list(_adapters):
+        adapter._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_adapters_after_fork)
@@ -0,0 +1,485 @@
+"""
+An asyncio client for ``http+unix://`` URLs
+
+``AsyncSession`` understands the same URLs as ``requests_unixsocket.Session``
+(a percent-encoded socket path, or an abstract namespace name starting with a
+NULL byte, as the netloc) and keeps a pool of keep-alive connections per
+socket, using ``asyncio.open_unix_connection``.
+
+Example usage:
+
+.. code-block:: python
+
+    async with requests_unixsocket.AsyncSession() as session:
+        r = await session.get('http+unix://%2Fvar%2Frun%2Fdocker.sock/info')
+        print(r.json())
+
+        r = await session.get(
+            'http+unix://%2Fvar%2Frun%2Fdocker.sock/events', stream=True)
+        async for chunk in r.iter_content():
+            print(chunk)
+"""
+
+import asyncio
+import collections
+import json as complexjson
+
+import requests
+from requests.compat import urlencode, urlparse
+from requests.structures import CaseInsensitiveDict
+from requests.utils import default_user_agent
+
+from .adapters import IDEMPOTENT_METHODS, get_socket_address_from_url
+
+
+DEFAULT_SCHEME = 'http+unix://'
+CHUNK_SIZE = 64 * 1024
+
+
+class _ClosedBeforeResponse(requests.ConnectionError):
+    # The server closed the connection without sending a byte of the
+    # response, as it does with keep-alive connections it found idle
+    pass
+
+
+class _AsyncConnection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def is_dropped(self):
+        return self.reader.at_eof() or self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+
+class _AsyncConnectionPool(object):
+
+    def __init__(self, socket_address, maxsize):
+        self.socket_address = socket_address
+        self.maxsize = maxsize
+        self.num_connections = 0
+        self.idle = collections.deque()
+
+    async def get_conn(self, timeout):
+        """Return ``(conn, reused)``"""
+        while self.idle:
+            conn = self.idle.pop()
+            if not conn.is_dropped():
+                return conn, True
+            conn.close()
+        return await self.new_conn(timeout), False
+
+    async def new_conn(self, timeout):
+        self.num_connections += 1
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.socket_address,
+                                             limit=CHUNK_SIZE),
+                timeout)
+        except asyncio.TimeoutError as e:
+            raise requests.ConnectTimeout(e)
+        except OSError as e:
+            raise requests.ConnectionError(e)
+        return _AsyncConnection(reader, writer)
+
+    def put_conn(self, conn):
+        if len(self.idle) < self.maxsize and not conn.is_dropped():
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+class AsyncResponse(object):
+    """The response to an :class:`AsyncSession` request
+
+    Unless the request was made with ``stream=True``, the body has already
+    been read into :attr:`content`. Otherwise it is read with :meth:`read` or
+    :meth:`iter_content`, and the connection goes back to the pool once the
+    body has been consumed.
+    """
+
+    def __init__(self, url, status_code, reason, headers):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.encoding = requests.utils.get_encoding_from_headers(headers)
+        self._content = None
+        self._body = None
+
+    def __repr__(self):
+        return '<AsyncResponse [%s]>' % self.status_code
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        if self._content is None:
+            raise RuntimeError(
+                'The body of a streamed response must be read with '
+                'await response.read() first')
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', 'replace')
+
+    def json(self, **kwargs):
+        return complexjson.loads(self.content, **kwargs)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                '%s Error: %s for url: %s'
+                % (self.status_code, self.reason, self.url), response=self)
+
+    async def read(self):
+        """Read the rest of the body and return it"""
+        if self._content is None:
+            chunks = []
+            async for chunk in self.iter_content():
+                chunks.append(chunk)
+            self._content = b''.join(chunks)
+        return self._content
+
+    async def iter_content(self, chunk_size=CHUNK_SIZE):
+        """Yield the body in chunks of up to ``chunk_size`` bytes"""
+        if self._content is not None:
+            for start in range(0, len(self._content), chunk_size):
+                yield self._content[start:start + chunk_size]
+            return
+        if self._body is None:
+            return
+        async for chunk in self._body.iter_chunks(chunk_size):
+            yield chunk
+
+    async def close(self):
+        if self._body is not None:
+            self._body.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class _Body(object):
+    # Reads one response body off a connection, then hands the connection
+    # back to its pool (or closes it if it can't be reused).
+
+    def __init__(self, pool, conn, headers, keep_alive, read_timeout):
+        self.pool = pool
+        self.conn = conn
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        self.chunked = 'chunked' in headers.get(
+            'Transfer-Encoding', '').lower()
+        length = headers.get('Content-Length')
+        self.remaining = None
+        if length is not None:
+            try:
+                self.remaining = int(length)
+            except ValueError:
+                self.remaining = -1
+            if self.remaining < 0:
+                raise requests.exceptions.InvalidHeader(
+                    'Invalid Content-Length %r' % length)
+        if not self.chunked and self.remaining is None:
+            self.keep_alive = False
+
+    async def _read(self, coro):
+        try:
+            return await asyncio.wait_for(coro, self.read_timeout)
+        except asyncio.TimeoutError as e:
+            self.close()
+            raise requests.ReadTimeout(e)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.close()
+            raise requests.ConnectionError(e)
+        except ValueError as e:
+            # readline() raises it for lines over the reader's limit
+            self.close()
+            raise requests.ConnectionError(e)
+
+    async def _read_some(self, size):
+        data = await self._read(self.conn.reader.read(size))
+        if not data:
+            self.close()
+            raise requests.ConnectionError(
+                'Connection closed before the response body was complete')
+        return data
+
+    async def iter_chunks(self, chunk_size):
+        if self.conn is None:
+            return
+        reader = self.conn.reader
+        if self.chunked:
+            while True:
+                line = await self._read(reader.readline())
+                if not line.endswith(b'\n'):
+                    self.close()
+                    raise requests.ConnectionError(
+                        'Connection closed before the response body was '
+                        'complete')
+                try:
+                    size = int(line.split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    self.close()
+                    raise requests.ConnectionError(
+                        'Invalid chunk size %r' % line)
+                if size == 0:
+                    # Skip any trailers up to the final empty line
+                    while (await self._read(reader.readline())).strip():
+                        pass
+                    break
+                while size:
+                    data = await self._read_some(min(size, chunk_size))
+                    size -= len(data)
+                    yield data
+                await self._read(reader.readexactly(2))
+        elif self.remaining is not None:
+            while self.remaining:
+                data = await self._read_some(min(self.remaining, chunk_size))
+                self.remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await self._read(reader.read(chunk_size))
+                if not data:
+                    break
+                yield data
+        self.release()
+
+    def release(self):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if self.keep_alive:
+            self.pool.put_conn(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        # Closing before the body was fully read leaves unread bytes on the
+        # connection, so it can't go back to the pool.
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            conn.close()
+
+
+class AsyncSession(object):
+    """An asyncio counterpart of :class:`requests_unixsocket.Session`
+
+    :param url_scheme: URL scheme handled by this session.
+    :param timeout: Default timeout in seconds, or a ``(connect, read)``
+        tuple.
+    :param pool_maxsize: Maximum number of idle connections kept per socket.
+    """
+
+    def __init__(self, url_scheme=DEFAULT_SCHEME, timeout=60,
+                 pool_maxsize=10):
+        self.url_scheme = url_scheme
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.headers = CaseInsensitiveDict({
+            'User-Agent': default_user_agent(),
+            'Accept': '*/*',
+        })
+        self.pools = {}
+
+    def get_pool(self, url):
+        socket_address = get_socket_address_from_url(url)
+        pool = self.pools.get(socket_address)
+        if pool is None:
+            pool = _AsyncConnectionPool(socket_address, self.pool_maxsize)
+            self.pools[socket_address] = pool
+        return pool
+
+    async def request(self, method, url, params=None, data=None, json=None,
+                      headers=None, stream=False, timeout=None):
+        if not url.lower().startswith(self.url_scheme):
+            raise requests.exceptions.InvalidSchema(
+                'No connection adapters were found for %r' % url)
+        method = method.upper()
+        connect_timeout, read_timeout = self._get_timeouts(timeout)
+        request_bytes = self._build_request(
+            method, url, params, data, json, headers)
+        pool = self.get_pool(url)
+
+        conn, reused = await pool.get_conn(connect_timeout)
+        try:
+            response, keep_alive = await self._send(
+                conn, request_bytes, url, read_timeout)
+        except requests.ConnectionError as e:
+            conn.close()
+            if not reused or not (
+                    method in IDEMPOTENT_METHODS
+                    or isinstance(e, _ClosedBeforeResponse)):
+                raise
+            # The server closed an idle keep-alive connection; try once more
+            # on a fresh one. Other failures may come after the server acted
+            # on the request, so only idempotent ones are sent again.
+            conn = await pool.new_conn(connect_timeout)
+            try:
+                response, keep_alive = await self._send(
+                    conn, request_bytes, url, read_timeout)
+            except BaseException:
+                conn.close()
+                raise
+        except BaseException:
+            conn.close()
+            raise
+
+        if (method == 'HEAD' or response.status_code in (204, 304)
+                or 100 <= response.status_code < 200):
+            response._content = b''
+            if keep_alive:
+                pool.put_conn(conn)
+            else:
+                conn.close()
+            return response
+
+        try:
+            response._body = _Body(pool, conn, response.headers, keep_alive,
+                                   read_timeout)
+        except BaseException:
+            conn.close()
+            raise
+        if not stream:
+            await response.read()
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request('HEAD', url, **kwargs)
+
+    async def post(self, url, data=None, json=None, **kwargs):
+        return await self.request('POST', url, data=data, json=json,
+                                  **kwargs)
+
+    async def patch(self, url, data=None, **kwargs):
+        return await self.request('PATCH', url, data=data, **kwargs)
+
+    async def put(self, url, data=None, **kwargs):
+        return await self.request('PUT', url, data=data, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    async def options(self, url, **kwargs):
+        return await self.request('OPTIONS', url, **kwargs)
+
+    async def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self.pools.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _get_timeouts(self, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        if isinstance(timeout, tuple):
+            return timeout
+        return timeout, timeout
+
+    def _build_request(self, method, url, params, data, json, headers):
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        query = parsed.query
+        if params:
+            extra = urlencode(params, doseq=True)
+            query = '%s&%s' % (query, extra) if query else extra
+        if query:
+            path = '%s?%s' % (path, query)
+
+        request_headers = CaseInsensitiveDict(self.headers)
+        body = b''
+        if json is not None and not data:
+            body = complexjson.dumps(json).encode('utf-8')
+            request_headers['Content-Type'] = 'application/json'
+        elif isinstance(data, (dict, list, tuple)):
+            body = urlencode(data, doseq=True).encode('ascii')
+            request_headers['Content-Type'] = (
+                'application/x-www-form-urlencoded')
+        elif isinstance(data, str):
+            body = data.encode('utf-8')
+        elif data:
+            body = bytes(data)
+        if headers:
+            request_headers.update(headers)
+        request_headers['Host'] = 'localhost'
+        if body or method in ('POST', 'PUT', 'PATCH'):
+            request_headers['Content-Length'] = str(len(body))
+
+        lines = ['%s %s HTTP/1.1' % (method, path)]
+        lines.extend('%s: %s' % item for item in request_headers.items()
+                     if item[1] is not None)
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        return head + body
+
+    async def _send(self, conn, request_bytes, url, read_timeout):
+        try:
+            conn.writer.write(request_bytes)
+            await asyncio.wait_for(conn.writer.drain(), read_timeout)
+            status_line = await asyncio.wait_for(
+                conn.reader.readline(), read_timeout)
+            if not status_line:
+                raise _ClosedBeforeResponse(
+                    'Connection closed before the response status line')
+            header_lines = []
+            line = status_line
+            while True:
+                if not line.endswith(b'\n'):
+                    raise requests.ConnectionError(
+                        'Connection closed before the end of the headers')
+                line = await asyncio.wait_for(
+                    conn.reader.readline(), read_timeout)
+                if line in (b'\r\n', b'\n'):
+                    break
+                header_lines.append(line)
+        except asyncio.TimeoutError as e:
+            raise requests.ReadTimeout(e)
+        except requests.ConnectionError:
+            raise
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            # readline() raises ValueError for lines over the reader's limit
+            raise requests.ConnectionError(e)
+
+        version, _, rest = status_line.decode('latin-1').partition(' ')
+        status, _, reason = rest.strip().partition(' ')
+        if not status.isdigit():
+            raise requests.ConnectionError(
+                'Invalid status line %r' % status_line)
+        headers = CaseInsensitiveDict()
+        for line in header_lines:
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip(), value.strip()
+            if name in headers:
+                headers[name] = '%s, %s' % (headers[name], value)
+            else:
+                headers[name] = value
+
+        connection = headers.get('Connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+        response = AsyncResponse(url, int(status), reason, headers)
+        return response, keep_alive
@@ -0,0 +1,138 @@
+"""
+Load balancing over replica sockets
+
+A :class:`ReplicaSet` maps one logical netloc to the sockets of several
+replicas of a service. :class:`requests_unixsocket.UnixAdapter` picks one of
+them for each request, keeps a connection pool per socket, and ejects sockets
+that fail to connect for a while.
+"""
+
+import random
+import threading
+
+from requests.compat import quote
+
+from .breaker import CLOSED, CircuitBreaker, SocketUnavailable
+
+LEAST_OUTSTANDING = 'least_outstanding'
+POWER_OF_TWO = 'power_of_two'
+
+
+class ReplicaSet(object):
+    """The sockets of one logical netloc, and how busy each one is
+
+    :param socket_addresses: Paths (or abstract namespace names) of the
+        replicas' sockets.
+    :param strategy: ``'least_outstanding'`` sends each request to a socket
+        with the fewest requests in flight; ``'power_of_two'`` compares two
+        random sockets and picks the less busy one, which costs less with
+        many sockets and herds less under bursts.
+    :param eject_after: Stop using a socket after this many consecutive
+        failed connects...
+    :param eject_time: ... for this many seconds, after which one trial
+        request is sent to it.
+
+    A request whose connect fails is retried on another socket; it never
+    reached the failed one.
+    """
+
+    def __init__(self, socket_addresses, strategy=LEAST_OUTSTANDING,
+                 eject_after=1, eject_time=10.0):
+        if strategy not in (LEAST_OUTSTANDING, POWER_OF_TWO):
+            raise ValueError('Unknown balancing strategy %r' % strategy)
+        if not socket_addresses:
+            raise ValueError('A ReplicaSet needs at least one socket')
+        self.socket_addresses = list(socket_addresses)
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_time = eject_time
+        self._urls = dict(
+            (socket_address, 'http+unix://%s/' % quote(socket_address,
+                                                       safe=''))
+            for socket_address in self.socket_addresses)
+        self._reset()
+
+    def _reset(self):
+        self.breakers = dict(
+            (socket_address, CircuitBreaker(
+                socket_address, failure_threshold=self.eject_after,
+                reset_timeout=self.eject_time))
+            for socket_address in self.socket_addresses)
+        self.outstanding = dict.fromkeys(self.socket_addresses, 0)
+        self.num_requests = dict.fromkeys(self.socket_addresses, 0)
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        # The parent's requests in flight never finish in the child, and its
+        # threads may have held the locks at fork time, so start over
+        self._reset()
+
+    def choose(self):
+        """Return the socket address to send the next request to
+
+        Raises :class:`~requests_unixsocket.breaker.SocketUnavailable` if
+        every socket is ejected and none is due for a trial.
+        """
+        candidates = []
+        for socket_address in self.socket_addresses:
+            breaker = self.breakers[socket_address]
+            if breaker.state == CLOSED:
+                candidates.append(socket_address)
+            elif breaker.allow_request():
+                # An ejected socket due for its trial request, or replaced
+                # by a new one, gets this request even if others are up
+                return socket_address
+        if not candidates:
+            for socket_address in self.socket_addresses:
+                try:
+                    self.breakers[socket_address].before_request()
+                except SocketUnavailable:
+                    continue
+                return socket_address
+            raise SocketUnavailable(
+                'All %d replica sockets are ejected'
+                % len(self.socket_addresses))
+        if len(candidates) == 1:
+            return candidates[0]
+        outstanding = self.outstanding
+        if self.strategy == POWER_OF_TWO:
+            first, second = random.sample(candidates, 2)
+            if outstanding[second] < outstanding[first]:
+                return second
+            return first
+        fewest = min(outstanding[socket_address]
+                     for socket_address in candidates)
+        return random.choice([socket_address for socket_address in candidates
+                              if outstanding[socket_address] == fewest])
+
+    def url_for(self, socket_address):
+        """Return an ``http+unix://`` URL for one of the sockets"""
+        return self._urls[socket_address]
+
+    def acquire(self, socket_address):
+        with self._lock:
+            self.outstanding[socket_address] += 1
+            self.num_requests[socket_address] += 1
+
+    def release(self, socket_address):
+        with self._lock:
+            if self.outstanding[socket_address]:
+                self.outstanding[socket_address] -= 1
+
+    def snapshot(self):
+        """Return the state of every socket, keyed by socket address
+
+        Each value has the number of ``outstanding`` requests, the number of
+        ``requests`` sent to it so far and the ``breaker`` snapshot that
+        tells whether it's ejected (``'open'``).
+        """
+        with self._lock:
+            outstanding = dict(self.outstanding)
+            num_requests = dict(self.num_requests)
+        return dict(
+            (socket_address, {
+                'outstanding': outstanding[socket_address],
+                'requests': num_requests[socket_address],
+                'breaker': self.breakers[socket_address].snapshot(),
+            })
+            for socket_address in self.socket_addresses)
@@ -0,0 +1,269 @@
+"""
+Batches of requests sent from one thread
+
+:meth:`Session.map <requests_unixsocket.Session.map>` keeps up to
+``concurrency`` requests in flight on connections from the
+:class:`~requests_unixsocket.UnixAdapter` pools, and waits on all of their
+sockets at once with a selector. Requests are written and responses parsed
+as by :class:`~requests_unixsocket.FastClient`, so a batch takes no thread
+besides the caller's, and at most ``concurrency`` connections.
+"""
+
+import collections
+import datetime
+import io
+import selectors
+import time
+
+from requests.exceptions import (ConnectionError, ConnectTimeout, ReadTimeout,
+                                 RequestException)
+from requests.hooks import dispatch_hook
+from requests.models import Request
+
+from .adapters import (IDEMPOTENT_METHODS, SEQPACKET_MESSAGE_SIZE,
+                       UnixAdapter, get_socket_address_from_url, urllib3)
+from .fast import RECV_SIZE, _build_request, _ResponseParser
+
+MapResult = collections.namedtuple(
+    'MapResult', 'index request response exception')
+
+
+def map_requests(session, requests, concurrency, timeout=None):
+    """Yield a :class:`MapResult` for each of ``requests`` as it completes
+
+    See :meth:`Session.map <requests_unixsocket.Session.map>`.
+    """
+    items = enumerate(requests)
+    selector = selectors.DefaultSelector()
+    error = None
+    try:
+        while True:
+            while items is not None and len(selector.get_map()) < concurrency:
+                try:
+                    index, request = next(items)
+                except StopIteration:
+                    items = None
+                    break
+                except Exception as e:
+                    # Raised once the requests in flight are done
+                    items, error = None, e
+                    break
+                result = _Exchange(session, index, request, timeout).start(
+                    selector)
+                if result is not None:
+                    yield result
+            exchanges = [key.data for key in selector.get_map().values()]
+            if not exchanges:
+                break
+            expires = [exchange.expires for exchange in exchanges
+                       if exchange.expires is not None]
+            wait = None
+            if expires:
+                wait = max(min(expires) - time.monotonic(), 0)
+            for key, mask in selector.select(wait):
+                result = key.data.on_ready(selector)
+                if result is not None:
+                    yield result
+            now = time.monotonic()
+            for key in list(selector.get_map().values()):
+                exchange = key.data
+                if exchange.expires is not None and exchange.expires <= now:
+                    yield exchange.fail(selector, ReadTimeout(
+                        'Read timed out. (read timeout=%s)'
+                        % exchange.read_timeout, request=exchange.prepared))
+        if error is not None:
+            raise error
+    finally:
+        for key in list(selector.get_map().values()):
+            key.data.fail(selector, None)
+        selector.close()
+
+
+class _Exchange(object):
+    # One request of a batch, and the pooled connection it's sent on
+
+    def __init__(self, session, index, request, timeout):
+        self.session = session
+        self.index = index
+        self.request = request
+        self.timeout = timeout
+        self.prepared = self.adapter = self.pool = self.conn = None
+        self.breaker = None
+        self.expires = self.read_timeout = None
+        self.retried = False
+
+    def start(self, selector):
+        """Send the request from the selector loop, or return its
+        :class:`MapResult` if it failed or had to be sent otherwise
+        """
+        try:
+            if isinstance(self.request, str):
+                self.request = Request('GET', self.request)
+            prepared = self.prepared = self.session.prepare_request(
+                self.request)
+            adapter = self.adapter = self.session.get_adapter(prepared.url)
+            body = prepared.body
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            if not (isinstance(adapter, UnixAdapter)
+                    and (body is None or isinstance(body, bytes))):
+                return self.result(self.session.send(
+                    prepared, timeout=self.timeout))
+            self.started = time.monotonic()
+            headers = dict((name, value)
+                           for name, value in prepared.headers.items()
+                           if name.lower() != 'content-length')
+            self.data = memoryview(_build_request(
+                prepared.method, prepared.path_url, headers, body))
+            if self.timeout is None:
+                timeout = adapter._default_timeout
+            else:
+                timeout = adapter._make_timeout(self.timeout)
+            if timeout.total is not None:
+                # Enforced with the deadline below; urllib3 can only tell
+                # the read timeout once its timer has started
+                timeout = timeout.clone()
+                timeout.start_connect()
+            resolve = urllib3.util.Timeout.resolve_default_timeout
+            self.connect_timeout = resolve(timeout.connect_timeout)
+            self.read_timeout = resolve(timeout.read_timeout)
+            self.deadline = None
+            if timeout.total is not None:
+                self.deadline = self.started + timeout.total
+            if adapter.circuit_breaker and get_socket_address_from_url(
+                    prepared.url) not in adapter.replicas:
+                self.breaker = adapter.get_breaker(prepared.url)
+                self.breaker.before_request()
+            self.pool = adapter.get_connection(prepared.url)
+            self.conn = self.pool._get_conn()
+            self._send(selector)
+        except Exception as e:
+            return self.fail(selector, e)
+        return None
+
+    def _send(self, selector):
+        conn = self.conn
+        self.reused = conn.sock is not None
+        if not self.reused:
+            conn.timeout = self.connect_timeout
+            conn.deadline = self.deadline
+            conn.connect()
+        conn.sock.settimeout(0)
+        self.sent = 0
+        self.received = False
+        self.parser = _ResponseParser(self.prepared.method)
+        self._extend()
+        selector.register(conn.sock, selectors.EVENT_WRITE, self)
+
+    def _extend(self):
+        # The read timeout applies to each wait for data, within the
+        # deadline of a total timeout
+        expires = self.deadline
+        if self.read_timeout is not None:
+            expires = time.monotonic() + self.read_timeout
+            if self.deadline is not None:
+                expires = min(expires, self.deadline)
+        self.expires = expires
+
+    def on_ready(self, selector):
+        """Make progress on the socket, and return the
+        :class:`MapResult` once the request is done
+        """
+        conn = self.conn
+        sock = conn.sock
+        try:
+            if self.sent < len(self.data):
+                self.sent += sock.send(
+                    self.data[self.sent:self.sent + SEQPACKET_MESSAGE_SIZE])
+                self._extend()
+                if self.sent == len(self.data):
+                    selector.modify(sock, selectors.EVENT_READ, self)
+                    if conn.observer is not None:
+                        conn.emit('request_sent')
+                return None
+            data = sock.recv(RECV_SIZE)
+            self._extend()
+            if not data:
+                self.parser.feed_eof()
+            else:
+                self.received = True
+                if not self.parser.feed(data):
+                    return None
+        except (BlockingIOError, InterruptedError):
+            return None
+        except (OSError, urllib3.exceptions.ProtocolError) as e:
+            if (self.reused and not self.received and not self.retried
+                    and self.prepared.method in IDEMPOTENT_METHODS):
+                # The server closed the pooled connection before the
+                # request reached it; send it again on a new one
+                self.retried = True
+                selector.unregister(sock)
+                conn.close()
+                try:
+                    self._send(selector)
+                except Exception as e:
+                    return self.fail(selector, e)
+                return None
+            return self.fail(selector, e)
+        except Exception as e:
+            return self.fail(selector, e)
+        return self.finish(selector)
+
+    def finish(self, selector):
+        parser = self.parser
+        conn = self.conn
+        selector.unregister(conn.sock)
+        if conn.observer is not None:
+            conn.emit('headers_received')
+        self.release(close=not parser.keep_alive)
+        if self.breaker is not None:
+            self.breaker.record_success()
+        raw = urllib3.HTTPResponse(
+            body=io.BytesIO(parser.body), headers=parser.headers,
+            status=parser.status, preload_content=False,
+            decode_content=True, request_method=self.prepared.method)
+        try:
+            response = self.adapter.build_response(self.prepared, raw)
+            response.content  # decoded here, so errors end up in the result
+        except Exception as e:
+            return self.result(exception=self.wrap(e))
+        response.elapsed = datetime.timedelta(
+            seconds=time.monotonic() - self.started)
+        response = dispatch_hook('response', self.prepared.hooks, response)
+        return self.result(response)
+
+    def fail(self, selector, error):
+        conn = self.conn
+        if conn is not None and conn.sock is not None:
+            try:
+                selector.unregister(conn.sock)
+            except KeyError:
+                pass
+        self.release(close=True)
+        return self.result(exception=self.wrap(error))
+
+    def release(self, close):
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        if close:
+            conn.close()
+        elif conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+        self.pool._put_conn(conn)
+
+    def wrap(self, error):
+        # As requests.adapters.HTTPAdapter.send raises them
+        request = self.prepared
+        if error is None or isinstance(error, RequestException):
+            return error
+        if isinstance(error, urllib3.exceptions.NewConnectionError):
+            return ConnectionError(error, request=request)
+        if isinstance(error, urllib3.exceptions.ConnectTimeoutError):
+            return ConnectTimeout(error, request=request)
+        if isinstance(error, (OSError, urllib3.exceptions.HTTPError)):
+            return ConnectionError(error, request=request)
+        return error
+
+    def result(self, response=None, exception=None):
+        return MapResult(self.index, self.request, response, exception)
@@ -0,0 +1,156 @@
+"""
+Circuit breakers for unix sockets that can't be connected to
+
+When a daemon is down, its socket file is missing or refuses connections, and
+every request would still try to connect. A :class:`CircuitBreaker` per socket
+opens after a number of consecutive failed connects, so that requests fail
+fast with :class:`SocketUnavailable` instead, and lets a trial request through
+once ``reset_timeout`` has passed.
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class SocketUnavailable(requests.exceptions.ConnectionError):
+    """Raised instead of connecting while a socket's circuit breaker is open"""
+
+
+class CircuitBreaker(object):
+    """Tracks connect failures to one socket
+
+    :param socket_address: The socket address, as from
+        :func:`requests_unixsocket.adapters.get_socket_address`.
+    :param failure_threshold: Open after this many consecutive failed
+        connects.
+    :param reset_timeout: Seconds to stay open before letting one trial
+        request through (half open). Its outcome closes the breaker or opens
+        it again.
+    :param watch: While open, ``stat()`` the socket file on each request and
+        close the breaker as soon as a different file appears there, e.g.
+        because the daemon was restarted. Abstract namespace sockets can't be
+        watched.
+    """
+
+    def __init__(self, socket_address, failure_threshold=5, reset_timeout=5.0,
+                 watch=True):
+        self.socket_address = socket_address
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.watch = watch and isinstance(socket_address, str)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.num_failures = 0
+        self.num_rejected = 0
+        self.num_opened = 0
+        self.opened_at = None
+        self.retry_at = None
+        self._file_id = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise :class:`SocketUnavailable` if a request mustn't be sent now
+
+        Called for every request; cheap while the breaker is closed.
+        """
+        if self.state == CLOSED or self.allow_request():
+            return
+        with self._lock:
+            self.num_rejected += 1
+            retry_in = max((self.retry_at or 0) - time.monotonic(), 0.0)
+        raise SocketUnavailable(
+            'Circuit breaker for %r is open after %d failed connects; '
+            'retrying in %.1fs' % (self.socket_address,
+                                   self.consecutive_failures, retry_in))
+
+    def allow_request(self):
+        """Return whether a request may be sent now, without counting it as
+        rejected if not
+
+        While open, a request is let through as the trial once
+        ``reset_timeout`` has passed, or when the socket file was replaced.
+        """
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.watch and self._get_file_id() not in (None,
+                                                          self._file_id):
+                self._close()
+                return True
+            now = time.monotonic()
+            if now >= self.retry_at:
+                # Let this request through as the trial; others keep failing
+                # fast until it's done, or until reset_timeout passes again.
+                self.state = HALF_OPEN
+                self.retry_at = now + self.reset_timeout
+                return True
+            return False
+
+    def record_success(self):
+        """Called after a successful connect or request"""
+        if self.state != CLOSED or self.consecutive_failures:
+            with self._lock:
+                self._close()
+
+    def record_failure(self):
+        """Called after a failed connect"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self.num_failures += 1
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED and
+                    self.consecutive_failures >= self.failure_threshold):
+                self.state = OPEN
+                self.num_opened += 1
+                self.opened_at = time.monotonic()
+                self.retry_at = self.opened_at + self.reset_timeout
+                if self.watch:
+                    self._file_id = self._get_file_id()
+
+    def reset(self):
+        """Close the breaker and forget recent failures"""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = self.retry_at = None
+
+    def _get_file_id(self):
+        try:
+            st = os.stat(self.socket_address)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+    def snapshot(self):
+        """Return the state of the breaker as a dict
+
+        ``state`` is ``'closed'``, ``'open'`` or ``'half_open'``;
+        ``retry_in`` is the number of seconds until the next trial request
+        while open, else None. The counters are ``consecutive_failures``,
+        ``failures`` (failed connects), ``rejected`` (requests failed fast)
+        and ``opened`` (times the breaker opened).
+        """
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(self.retry_at - time.monotonic(), 0.0)
+            return {
+                'state': self.state,
+                'retry_in': retry_in,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.num_failures,
+                'rejected': self.num_rejected,
+                'opened': self.num_opened,
+            }
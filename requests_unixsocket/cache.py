@@ -0,0 +1,343 @@
+"""
+An HTTP cache for GET requests to local daemons
+
+``CachingAdapter`` wraps a :class:`requests_unixsocket.UnixAdapter` and
+answers repeated GETs of the same socket and path from memory while they are
+fresh, then revalidates them with conditional requests. ``Session(cache=True)``
+sets one up:
+
+.. code-block:: python
+
+    session = requests_unixsocket.Session(cache={'default_ttl': 0.5})
+    r = session.get('http+unix://%2Fvar%2Frun%2Fdocker.sock/info')
+    r = session.get('http+unix://%2Fvar%2Frun%2Fdocker.sock/info')
+    assert r.from_cache
+"""
+
+import collections
+import email.utils
+import os
+import threading
+import time
+import weakref
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .adapters import UnixAdapter, get_socket_address_from_url
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL = 1.0
+
+# Statuses whose responses are stored
+CACHEABLE_STATUSES = frozenset([200, 203])
+
+# Headers of a 304 response that must not replace the stored ones
+_NOT_UPDATED_HEADERS = frozenset([
+    'content-length', 'content-encoding', 'transfer-encoding', 'connection'])
+
+# Rough bookkeeping overhead of an entry, counted against max_bytes
+_ENTRY_OVERHEAD = 256
+
+_caching_adapters = weakref.WeakSet()
+
+
+def parse_cache_control(value):
+    """Return the directives of a ``Cache-Control`` header as a dict
+
+    Directive names are lowercased; directives without an argument map to
+    None.
+    """
+    directives = {}
+    for directive in value.split(','):
+        name, _, argument = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def freshness_lifetime(headers, default_ttl):
+    """Return how many seconds a response may be served from the cache
+
+    Uses ``max-age`` from ``Cache-Control``, or else ``Expires``, minus the
+    ``Age`` of the response; without either it's ``default_ttl``. Returns
+    None if the response must not be stored at all.
+    """
+    directives = parse_cache_control(headers.get('Cache-Control', ''))
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.0
+    if 'max-age' in directives:
+        try:
+            lifetime = float(int(directives['max-age']))
+        except (TypeError, ValueError):
+            return 0.0
+    elif 'Expires' in headers:
+        expires = _parse_http_date(headers['Expires'])
+        date = _parse_http_date(headers.get('Date', ''))
+        if expires is None:
+            return 0.0
+        lifetime = expires - (date if date is not None else time.time())
+    else:
+        return default_ttl
+    try:
+        lifetime -= int(headers.get('Age', 0))
+    except ValueError:
+        pass
+    return max(lifetime, 0.0)
+
+
+class _CacheEntry(object):
+    __slots__ = ('status_code', 'reason', 'headers', 'content', 'vary',
+                 'stored_at', 'lifetime', 'size')
+
+    def __init__(self, response, request, lifetime):
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.headers = CaseInsensitiveDict(response.headers)
+        self.content = response.content
+        self.vary = dict(
+            (name, request.headers.get(name))
+            for name in _vary_names(response.headers))
+        self.stored_at = time.monotonic()
+        self.lifetime = lifetime
+        self.size = _ENTRY_OVERHEAD + len(self.content) + sum(
+            len(name) + len(value) for name, value in self.headers.items())
+
+    def is_fresh(self):
+        return time.monotonic() - self.stored_at < self.lifetime
+
+    def matches(self, request):
+        return all(request.headers.get(name) == value
+                   for name, value in self.vary.items())
+
+    def add_validators(self, request):
+        etag = self.headers.get('ETag')
+        last_modified = self.headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            return False
+        if etag is not None:
+            request.headers['If-None-Match'] = etag
+        if last_modified is not None:
+            request.headers['If-Modified-Since'] = last_modified
+        return True
+
+
+def _vary_names(headers):
+    return [name.strip() for name in headers.get('Vary', '').split(',')
+            if name.strip()]
+
+
+class CachingAdapter(BaseAdapter):
+    """Transport adapter that caches GET responses of another adapter
+
+    :param adapter: The adapter to send requests with. Defaults to a new
+        :class:`requests_unixsocket.UnixAdapter`.
+    :param max_bytes: Memory budget for cached bodies and headers. The
+        least recently used responses are evicted to stay under it.
+    :param default_ttl: Seconds to serve responses that have neither
+        ``Cache-Control: max-age`` nor ``Expires`` from the cache.
+
+    Responses are keyed by socket address and request path (with the query
+    string), and the ``Vary`` header is honoured. ``Cache-Control:
+    no-store`` responses are never stored, and ``no-cache`` ones are
+    revalidated on every use. Stale responses with an ``ETag`` or
+    ``Last-Modified`` header are revalidated with a conditional request;
+    a ``304 Not Modified`` refreshes them. Streamed requests, requests with
+    conditional or ``Range`` headers of their own and other methods go
+    straight to the wrapped adapter, and successful unsafe requests
+    (e.g. POST or DELETE) drop the cached response for their path.
+
+    Responses served from the cache have ``from_cache`` set to True.
+    Anything else, such as :meth:`UnixAdapter.pool_stats`, is looked up on
+    the wrapped adapter.
+    """
+
+    def __init__(self, adapter=None, max_bytes=DEFAULT_MAX_BYTES,
+                 default_ttl=DEFAULT_TTL):
+        super(CachingAdapter, self).__init__()
+        self.adapter = adapter if adapter is not None else UnixAdapter()
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_revalidated = 0
+        self.num_evicted = 0
+        self._lock = threading.Lock()
+        _caching_adapters.add(self)
+
+    def _reset_after_fork(self):
+        # Another thread of the parent may have held the lock at fork time,
+        # halfway through updating the entries and their size. The cached
+        # responses are still good in the child.
+        self._lock = threading.Lock()
+        self.size = sum(entry.size for entry in self.entries.values())
+
+    def __getattr__(self, name):
+        # Only called for attributes not found the normal way
+        if name == 'adapter':
+            raise AttributeError(name)
+        return getattr(self.adapter, name)
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = self.adapter.send(request, stream=stream, **kwargs)
+            if response.status_code < 400:
+                self._drop(self._get_key(request.url, request))
+            return response
+        if (request.method != 'GET' or stream
+                or not self._is_cacheable_request(request)):
+            return self.adapter.send(request, stream=stream, **kwargs)
+
+        key = self._get_key(request.url, request)
+        no_cache = 'no-cache' in parse_cache_control(
+            request.headers.get('Cache-Control', ''))
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and not entry.matches(request):
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                if entry.is_fresh() and not no_cache:
+                    self.num_hits += 1
+                    return self._build_response(entry, request)
+
+        conditional = request
+        if entry is not None:
+            conditional = request.copy()
+            if not entry.add_validators(conditional):
+                conditional, entry = request, None
+        response = self.adapter.send(conditional, stream=False, **kwargs)
+        response.content  # read it all, so the connection is released
+
+        if entry is not None and response.status_code == 304:
+            with self._lock:
+                self.num_revalidated += 1
+                for name, value in response.headers.items():
+                    if name.lower() not in _NOT_UPDATED_HEADERS:
+                        entry.headers[name] = value
+                lifetime = freshness_lifetime(entry.headers,
+                                              self.default_ttl)
+                entry.stored_at = time.monotonic()
+                entry.lifetime = lifetime or 0.0
+            response.close()
+            return self._build_response(entry, request)
+
+        with self._lock:
+            self.num_misses += 1
+        response.request = request
+        response.from_cache = False
+        self._store(key, request, response)
+        return response
+
+    def _is_cacheable_request(self, request):
+        headers = request.headers
+        if ('Range' in headers or 'If-None-Match' in headers
+                or 'If-Modified-Since' in headers):
+            return False
+        return 'no-store' not in parse_cache_control(
+            headers.get('Cache-Control', ''))
+
+    def _get_key(self, url, request=None):
+        if request is None:
+            request = requests.Request('GET', url).prepare()
+        return (get_socket_address_from_url(url), request.path_url)
+
+    def _store(self, key, request, response):
+        if response.status_code not in CACHEABLE_STATUSES:
+            return
+        if '*' in _vary_names(response.headers):
+            return
+        lifetime = freshness_lifetime(response.headers, self.default_ttl)
+        if lifetime is None:
+            return
+        if not lifetime and not (response.headers.get('ETag')
+                                 or response.headers.get('Last-Modified')):
+            return
+        entry = _CacheEntry(response, request, lifetime)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+                self.num_evicted += 1
+
+    def _build_response(self, entry, request):
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.reason = entry.reason
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        response._content = entry.content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.from_cache = True
+        return response
+
+    def invalidate(self, url):
+        """Drop the cached response for ``url``, if there is one"""
+        self._drop(self._get_key(url))
+
+    def _drop(self, key):
+        with self._lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return cache counters
+
+        ``hits`` counts responses served from the cache without asking the
+        server, ``revalidated`` those served after a ``304 Not Modified``,
+        ``misses`` those fetched in full, and ``evicted`` responses dropped
+        to stay under ``max_bytes``. ``entries`` and ``bytes`` describe what
+        is cached now.
+        """
+        with self._lock:
+            return {
+                'hits': self.num_hits,
+                'revalidated': self.num_revalidated,
+                'misses': self.num_misses,
+                'evicted': self.num_evicted,
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
+
+    def close(self):
+        self.clear()
+        self.adapter.close()
+
+
+def _reset_caching_adapters_after_fork():
+    for adapter in list(_caching_adapters):
+        adapter._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_caching_adapters_after_fork)
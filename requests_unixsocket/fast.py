@@ -0,0 +1,378 @@
+"""
+A lean client for small, frequent requests to trusted local daemons
+
+:class:`FastClient` uses the connection pools of a
+:class:`~requests_unixsocket.UnixAdapter`, but skips what
+:class:`requests.Session` does around a request (preparing a
+:class:`requests.PreparedRequest`, cookies, hooks, proxy lookups from the
+environment, redirects, building a :class:`requests.Response`), and writes
+requests and parses responses itself instead of going through
+``urllib3.HTTPConnectionPool.urlopen`` and ``http.client``.
+"""
+
+import collections
+import socket
+
+from requests.exceptions import InvalidHeader, RequestException
+from requests.utils import requote_uri
+
+from .adapters import (UnixAdapter, _netloc_re, get_socket_address_from_url,
+                       urllib3)
+
+RECV_SIZE = 64 * 1024
+
+# Responses to these never have a body
+_NO_BODY_STATUSES = frozenset([204, 304])
+
+# Requests with these methods announce an empty body
+_BODY_METHODS = frozenset(['POST', 'PUT', 'PATCH'])
+
+FastResponse = collections.namedtuple('FastResponse', 'status headers body')
+FastResponse.__doc__ = """A response from :meth:`FastClient.request`
+
+``status`` is the status code. ``headers`` is a dict with lowercase header
+names; repeated headers are joined with ``, ``. ``body`` is the body as
+bytes, not decoded even if it has a ``Content-Encoding``, or for requests
+sent with ``stream=True`` the ``urllib3.HTTPResponse`` to read it from,
+whose connection goes back to the pool once the body was read in full (or
+after ``release_conn()``).
+"""
+
+
+class FastClient(object):
+    """Send requests to ``http+unix://`` URLs with as little work as possible
+
+    Keyword arguments, such as ``timeout``, ``pool_maxsize`` or
+    ``replicas``, are passed to the :class:`UnixAdapter` whose pools are
+    used, so connection reuse, connect and read timeouts, replica balancing
+    and circuit breakers work as with a :class:`Session`: with
+    ``circuit_breaker``, requests to a socket whose breaker is open raise
+    :class:`~requests_unixsocket.breaker.SocketUnavailable`. Only
+    the headers given are sent, plus ``Host`` and ``Content-Length``.
+    Redirects are not followed, nothing is retried, and request-level
+    adapter features (``coalesce``, caching, ``total_timeout``) don't apply.
+    Errors are raised as ``urllib3`` exceptions: ``NewConnectionError``,
+    ``ReadTimeoutError`` or ``ProtocolError``, except for
+    ``requests.exceptions.InvalidHeader`` for an invalid ``Content-Length``.
+    Interim (1xx) responses are skipped.
+    """
+
+    def __init__(self, **kwargs):
+        self.adapter = UnixAdapter(**kwargs)
+
+    def request(self, method, url, headers=None, body=None, stream=False,
+                timeout=None):
+        """Send a request and return a :class:`FastResponse`
+
+        :param headers: A dict of headers to send.
+        :param body: Bytes, a str (sent as UTF-8) or a file-like object.
+        :param stream: Return the body unread; see :class:`FastResponse`.
+        :param timeout: Seconds, a ``(connect, read)`` tuple or a
+            ``urllib3.Timeout``; defaults to the adapter's.
+
+        Streamed requests and file-like bodies are sent through
+        ``urlopen``, which is slower.
+        """
+        if timeout is None:
+            timeout = self.adapter._default_timeout
+        else:
+            timeout = self.adapter._make_timeout(timeout)
+        breaker = None
+        if self.adapter.circuit_breaker and get_socket_address_from_url(
+                url) not in self.adapter.replicas:
+            breaker = self.adapter.get_breaker(url)
+            breaker.before_request()
+        pool = self.adapter.get_connection(url)
+        path = _path_from_url(url)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if stream or not (body is None or isinstance(body, bytes)):
+            response = pool.urlopen(
+                method, path, body=body, headers=headers, retries=False,
+                redirect=False, assert_same_host=False, timeout=timeout,
+                preload_content=not stream, decode_content=False)
+            if breaker is not None:
+                breaker.record_success()
+            return FastResponse(
+                response.status,
+                dict((name.lower(), value)
+                     for name, value in response.headers.items()),
+                response if stream else response.data)
+
+        request = _build_request(method, path, headers, body)
+        if timeout.total is not None:
+            # It only shortens the read timeout here
+            timeout = timeout.clone()
+            timeout.start_connect()
+        conn = pool._get_conn()
+        keep_alive = False
+        try:
+            # Left over from a streamed request, whose total timeout
+            # doesn't apply here
+            conn.deadline = None
+            if conn.sock is None:
+                conn.timeout = urllib3.util.Timeout.resolve_default_timeout(
+                    timeout.connect_timeout)
+                conn.connect()
+            sock = conn.sock
+            sock.deadline = None
+            sock.settimeout(urllib3.util.Timeout.resolve_default_timeout(
+                timeout.read_timeout))
+            try:
+                sock.sendall(request)
+                if conn.observer is not None:
+                    conn.emit('request_sent')
+                parser = _ResponseParser(method)
+                observer = conn.observer
+                while True:
+                    data = sock.recv(RECV_SIZE)
+                    if not data:
+                        parser.feed_eof()
+                        break
+                    done = parser.feed(data)
+                    if observer is not None and parser.status is not None:
+                        conn.emit('headers_received')
+                        observer = None
+                    if done:
+                        break
+                status, headers = parser.status, parser.headers
+                body, keep_alive = parser.body, parser.keep_alive
+            except socket.timeout as e:
+                raise urllib3.exceptions.ReadTimeoutError(
+                    pool, url, 'Read timed out. (read timeout=%s)'
+                    % sock.gettimeout()) from e
+            except RequestException:
+                raise
+            except OSError as e:
+                raise urllib3.exceptions.ProtocolError(
+                    'Connection aborted.', e) from e
+        finally:
+            if not keep_alive:
+                conn.close()
+            pool._put_conn(conn)
+        if breaker is not None:
+            breaker.record_success()
+        return FastResponse(status, headers, body)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, body=None, **kwargs):
+        return self.request('POST', url, body=body, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _path_from_url(url):
+    # What follows the netloc, without a fragment
+    match = _netloc_re.match(url)
+    path = url[match.end():] if match else '/'
+    path = path.partition('#')[0]
+    if not path.startswith('/'):
+        path = '/' + path
+    return path
+
+
+def _build_request(method, path, headers, body):
+    try:
+        path = path.encode('ascii')
+    except UnicodeEncodeError:
+        path = requote_uri(path).encode('ascii')
+    parts = [b'%s %s HTTP/1.1\r\nHost: localhost\r\n'
+             % (method.encode('ascii'), path)]
+    if headers:
+        for name, value in headers.items():
+            parts.append(b'%s: %s\r\n' % (name.encode('latin-1'),
+                                          value.encode('latin-1')))
+    if body is not None:
+        parts.append(b'Content-Length: %d\r\n\r\n' % len(body))
+        parts.append(body)
+    elif method in _BODY_METHODS:
+        parts.append(b'Content-Length: 0\r\n\r\n')
+    else:
+        parts.append(b'\r\n')
+    return b''.join(parts)
+
+
+# _ResponseParser states
+_HEADERS, _BODY, _BODY_UNTIL_EOF, _CHUNK_SIZE, _CHUNK_DATA, _CHUNK_END, \
+    _TRAILERS, _DONE = range(8)
+
+
+class _ResponseParser(object):
+    # Parses one HTTP/1.1 response from the bytes fed to it, as they arrive,
+    # so that it can be driven by blocking reads or by a selector loop.
+    # Nothing may follow the response, as requests aren't pipelined. Bytes
+    # received but not parsed yet are in buffer; body bytes are collected
+    # in chunks and joined once.
+
+    __slots__ = ('method', 'buffer', 'state', 'status', 'headers',
+                 'keep_alive', 'chunks', 'remaining')
+
+    def __init__(self, method):
+        self.method = method
+        self.buffer = bytearray()
+        self.state = _HEADERS
+        self.status = self.headers = None
+        self.keep_alive = False
+        self.chunks = []
+        self.remaining = 0
+
+    @property
+    def body(self):
+        return b''.join(self.chunks)
+
+    def feed(self, data):
+        """Parse the next bytes received; return True once the response
+        is complete
+        """
+        if self.state in (_BODY, _BODY_UNTIL_EOF) and not self.buffer:
+            # Most of a large body, without going through the buffer
+            self._take_body(data)
+        else:
+            self.buffer += data
+            while self.state != _DONE and self._parse_buffer():
+                pass
+        if self.state == _DONE:
+            self.keep_alive = self.keep_alive and not self.buffer
+            return True
+        return False
+
+    def feed_eof(self):
+        """Note that the connection was closed; raise ProtocolError if the
+        response is incomplete
+        """
+        if self.state == _BODY_UNTIL_EOF:
+            self.state = _DONE
+        elif self.state != _DONE:
+            raise _incomplete()
+
+    def _take_body(self, data):
+        if self.state == _BODY_UNTIL_EOF:
+            self.chunks.append(bytes(data))
+            return
+        if len(data) < self.remaining:
+            self.chunks.append(bytes(data))
+            self.remaining -= len(data)
+            return
+        self.chunks.append(bytes(data[:self.remaining]))
+        self.buffer += data[self.remaining:]
+        self.remaining = 0
+        self.state = _DONE
+
+    def _read_line(self):
+        end = self.buffer.find(b'\r\n')
+        if end < 0:
+            return None
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end + 2]
+        return line
+
+    def _parse_buffer(self):
+        # Parses what it can; returns False when more data is needed
+        state = self.state
+        if state == _HEADERS:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return False
+            head = bytes(self.buffer[:end])
+            del self.buffer[:end + 4]
+            self._parse_head(head)
+        elif state in (_BODY, _BODY_UNTIL_EOF):
+            if not self.buffer:
+                return False
+            data, self.buffer = self.buffer, bytearray()
+            self._take_body(data)
+        elif state == _CHUNK_SIZE:
+            line = self._read_line()
+            if line is None:
+                return False
+            try:
+                self.remaining = int(line.partition(b';')[0], 16)
+            except ValueError:
+                raise urllib3.exceptions.ProtocolError(
+                    'Invalid chunk size %r' % line)
+            self.state = _CHUNK_DATA if self.remaining else _TRAILERS
+        elif state == _CHUNK_DATA:
+            if not self.buffer:
+                return False
+            data = self.buffer[:self.remaining]
+            self.chunks.append(bytes(data))
+            del self.buffer[:len(data)]
+            self.remaining -= len(data)
+            if not self.remaining:
+                self.state = _CHUNK_END
+        elif state == _CHUNK_END:
+            if len(self.buffer) < 2:
+                return False
+            if self.buffer[:2] != b'\r\n':
+                raise urllib3.exceptions.ProtocolError(
+                    'Invalid chunked encoding')
+            del self.buffer[:2]
+            self.state = _CHUNK_SIZE
+        elif state == _TRAILERS:
+            line = self._read_line()
+            if line is None:
+                return False
+            if not line:
+                self.state = _DONE
+        return True
+
+    def _parse_head(self, head):
+        lines = head.decode('latin-1').split('\r\n')
+        version, _, rest = lines[0].partition(' ')
+        try:
+            status = int(rest[:3])
+        except ValueError:
+            raise urllib3.exceptions.ProtocolError(
+                'Invalid status line %r' % lines[0])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name in headers:
+                headers[name] += ', ' + value
+            else:
+                headers[name] = value
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = 'keep-alive' in connection
+        else:
+            self.keep_alive = 'close' not in connection
+        if 100 <= status < 200 and status != 101:
+            # An interim response; the final one follows
+            return
+        self.status, self.headers = status, headers
+        if (self.method == 'HEAD' or status < 200
+                or status in _NO_BODY_STATUSES):
+            # After a 101 the connection speaks another protocol
+            self.keep_alive = self.keep_alive and status != 101
+            self.state = _DONE
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            self.state = _CHUNK_SIZE
+        elif 'content-length' in headers:
+            length = headers['content-length']
+            try:
+                self.remaining = int(length)
+            except ValueError:
+                self.remaining = -1
+            if self.remaining < 0:
+                raise InvalidHeader('Invalid Content-Length %r' % length)
+            self.state = _BODY if self.remaining else _DONE
+        else:
+            # Until the server closes the connection
+            self.keep_alive = False
+            self.state = _BODY_UNTIL_EOF
+
+
+def _incomplete():
+    return urllib3.exceptions.ProtocolError(
+        'Connection closed before the response was complete')
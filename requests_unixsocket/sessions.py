@@ -0,0 +1,232 @@
+"""
+``Session``, the requests-style helpers and ``monkeypatch``
+
+Everything here is re-exported by the ``requests_unixsocket`` package, which
+only imports this module (and so requests) when one of them is first used.
+"""
+
+import atexit
+import os
+import requests
+import sys
+import threading
+
+from . import DEFAULT_SCHEME
+from .adapters import SEQPACKET_SUFFIX, UnixAdapter
+from .batch import map_requests
+from .cache import CachingAdapter
+from .upgrade import upgrade_connection
+
+_shared_session = None
+_shared_session_enabled = False
+_shared_session_lock = threading.Lock()
+
+
+class Session(requests.Session):
+    def __init__(self, url_scheme=DEFAULT_SCHEME, *args, **kwargs):
+        """Keyword arguments, such as ``pool_maxsize``, ``pool_block`` and
+        ``max_retries``, are passed through to :class:`UnixAdapter`.
+
+        The adapter is also mounted for ``url_scheme`` with ``+seqpacket``
+        added, e.g. ``http+unix+seqpacket://``, for ``SOCK_SEQPACKET``
+        sockets.
+
+        ``cache=True``, or a dict of :class:`CachingAdapter` arguments, wraps
+        the adapter in a :class:`CachingAdapter`.
+        """
+        cache = kwargs.pop('cache', None)
+        super(Session, self).__init__(*args)
+        self.url_scheme = url_scheme
+        adapter = UnixAdapter(**kwargs)
+        if cache:
+            adapter = CachingAdapter(
+                adapter, **(cache if isinstance(cache, dict) else {}))
+        self.mount(url_scheme, adapter)
+        self.mount(url_scheme.replace('://', SEQPACKET_SUFFIX + '://', 1),
+                   adapter)
+
+    def prewarm(self, url, connections=None):
+        """Open up to ``connections`` (default: ``pool_maxsize``) sockets to
+        the socket of ``url`` now, so the first requests don't pay for them.
+        Returns the number of sockets opened.
+        """
+        return self.get_adapter(url).prewarm(url, connections)
+
+    def upgrade(self, url, method='POST', protocol='tcp', **kwargs):
+        """Send a request that switches protocols, and take over its socket
+
+        Sends ``Connection: Upgrade`` and ``Upgrade: <protocol>`` headers
+        (unless given in ``headers``), as Docker's ``attach`` and ``exec``
+        endpoints expect, and returns an
+        :class:`~requests_unixsocket.upgrade.UpgradedConnection` once the
+        server answered ``101 Switching Protocols``, or any other
+        successful status with which it hijacked the connection. Raises
+        :class:`requests.HTTPError` for error statuses.
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.setdefault('Connection', 'Upgrade')
+        headers.setdefault('Upgrade', protocol)
+        response = self.request(method, url, headers=headers, stream=True,
+                                **kwargs)
+        if response.status_code >= 400:
+            response.content  # read it all, so the connection is released
+            response.raise_for_status()
+        return upgrade_connection(response)
+
+    def map(self, requests, concurrency=None, timeout=None):
+        """Send many requests from this thread, yielding results in
+        completion order
+
+        :param requests: An iterable of URLs (sent as GETs) or
+            :class:`requests.Request` objects. It is consumed lazily, as
+            requests complete.
+        :param concurrency: How many requests to have in flight at once.
+            Defaults to the adapter's ``pool_maxsize``, so that each keeps a
+            pooled connection; going above it opens throwaway connections.
+        :param timeout: As for :meth:`request`; defaults to the adapter's.
+
+        The requests in flight are sent on connections from the adapter's
+        pools, and one selector waits on all of their sockets, so a batch
+        takes no other thread and at most ``concurrency`` connections (see
+        :mod:`requests_unixsocket.batch`). Like :class:`FastClient`, this
+        skips parts of :meth:`send`: redirects aren't followed, cookies set
+        by responses aren't stored, bodies are read in full, and a failed
+        request is only sent again if it's idempotent and its pooled
+        connection turned out to be closed. Requests whose body isn't bytes
+        or a str, or whose URL has another adapter (such as a
+        :class:`CachingAdapter`), go through :meth:`send`, one at a time.
+
+        Each result is a :class:`MapResult` whose ``index`` is the position
+        of the request in ``requests``, and whose ``exception`` is set
+        instead of ``response`` if that request failed. If iterating over
+        ``requests`` raises, the requests in flight are finished and their
+        results yielded, then the exception is raised. Closing the generator
+        early stops sending new requests.
+        """
+        if concurrency is None:
+            concurrency = self.get_adapter(self.url_scheme)._pool_maxsize
+        return map_requests(self, requests, concurrency, timeout)
+
+
+def use_shared_session(enabled=True):
+    """Make the module-level helpers share one process-wide :class:`Session`
+
+    The shared session is created lazily, so connections to a socket are kept
+    alive between calls. Cookies aren't: each call starts with none, as it
+    would with a session of its own. It is replaced in a forked child, so
+    children never reuse the parent's sockets. Turning the mode off closes
+    the session.
+    """
+    global _shared_session_enabled
+    _shared_session_enabled = enabled
+    if not enabled:
+        close_shared_session()
+
+
+def get_shared_session():
+    """Return the process-wide :class:`Session`, creating it if needed"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = Session()
+        return _shared_session
+
+
+def close_shared_session():
+    """Close the process-wide :class:`Session` and its connections"""
+    global _shared_session
+    with _shared_session_lock:
+        session, _shared_session = _shared_session, None
+    if session is not None:
+        session.close()
+
+
+def _reset_shared_session_after_fork():
+    # The parent's lock may have been held by another thread at fork time, and
+    # its sockets must not be shared with the child, so start over.
+    global _shared_session, _shared_session_lock
+    _shared_session_lock = threading.Lock()
+    _shared_session = None
+
+
+atexit.register(close_shared_session)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_shared_session_after_fork)
+
+
+class monkeypatch(object):
+    def __init__(self, url_scheme=DEFAULT_SCHEME, shared_session=False):
+        self.session = Session()
+        self.shared_session = shared_session
+        self.orig_shared_session_enabled = _shared_session_enabled
+        if shared_session:
+            use_shared_session()
+        requests = self._get_global_requests_module()
+
+        # Methods to replace
+        self.methods = ('request', 'get', 'head', 'post',
+                        'patch', 'put', 'delete', 'options')
+        # Store the original methods
+        self.orig_methods = dict(
+            (m, requests.__dict__[m]) for m in self.methods)
+        # Monkey patch
+        g = globals()
+        for m in self.methods:
+            requests.__dict__[m] = g[m]
+
+    def _get_global_requests_module(self):
+        return sys.modules['requests']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        requests = self._get_global_requests_module()
+        for m in self.methods:
+            requests.__dict__[m] = self.orig_methods[m]
+        if self.shared_session:
+            use_shared_session(self.orig_shared_session_enabled)
+
+
+# These are the same methods defined for the global requests object
+def request(method, url, **kwargs):
+    if _shared_session_enabled:
+        # Only the connections are shared: a cookie set by the response to
+        # one call mustn't be sent by unrelated calls
+        session = Session.__new__(Session)
+        session.__dict__.update(get_shared_session().__dict__)
+        session.cookies = requests.cookies.RequestsCookieJar()
+    else:
+        session = Session()
+    return session.request(method=method, url=url, **kwargs)
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return request('get', url, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', False)
+    return request('head', url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request('post', url, data=data, json=json, **kwargs)
+
+
+def patch(url, data=None, **kwargs):
+    return request('patch', url, data=data, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    return request('put', url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('delete', url, **kwargs)
+
+
+def options(url, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return request('options', url, **kwargs)
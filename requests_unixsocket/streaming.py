@@ -0,0 +1,219 @@
+"""
+Helpers for consuming large or long-lived response bodies
+"""
+
+import io
+import json
+import struct
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_STREAM_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+# Stream types of Docker multiplexed frames
+STDIN = 0
+STDOUT = 1
+STDERR = 2
+
+DOCKER_RAW_STREAM = 'application/vnd.docker.raw-stream'
+
+# Docker frame header: stream type, 3 padding bytes, big endian payload size
+_frame_header = struct.Struct('>BxxxL')
+
+
+def iter_content_views(response, chunk_size=DEFAULT_CHUNK_SIZE, buffer=None):
+    """Iterate over a streamed response body without copying it
+
+    Like ``response.iter_content(chunk_size)``, but reads with
+    ``readinto1`` into one reusable buffer and yields ``memoryview`` slices
+    of it, so each chunk is only valid until the next one is requested. Copy
+    it (``bytes()``) to keep it. Chunks hold whatever had arrived, up to
+    ``chunk_size`` bytes, so data of a live stream is yielded without
+    waiting for the buffer to fill.
+
+    The response must have been requested with ``stream=True``. Bodies with
+    a ``Content-Encoding`` fall back to ``iter_content``, since they have to
+    be decoded anyway.
+
+    :param buffer: A writable buffer to read into instead of allocating a
+        ``bytearray`` of ``chunk_size`` bytes.
+    """
+    raw = response.raw
+    fp = getattr(raw, '_fp', None)
+    if (response._content_consumed or fp is None
+            or not hasattr(fp, 'readinto')
+            or response.headers.get('Content-Encoding', 'identity')
+            != 'identity'):
+        for chunk in response.iter_content(chunk_size):
+            yield memoryview(chunk)
+        return
+
+    view = memoryview(buffer if buffer is not None else bytearray(chunk_size))
+    readinto = _readinto1(fp)
+    try:
+        while True:
+            n = readinto(view)
+            if not n:
+                break
+            yield view[:n]
+    finally:
+        response._content_consumed = True
+    # The body was read in full, so the connection can be reused
+    raw.release_conn()
+
+
+def _readinto1(fp):
+    # readinto() waits until the buffer is full, even across chunks of a
+    # chunked body, which would hold back the messages of a live stream
+    return getattr(fp, 'readinto1', fp.readinto)
+
+
+class _StreamBuffer(object):
+    # A reusable buffer holding the unparsed bytes of a streamed body in
+    # buffer[start:end]. It only grows for a message longer than the buffer,
+    # up to max_size.
+
+    def __init__(self, response, chunk_size, max_size):
+        self.response = response
+        self.max_size = max(max_size, chunk_size)
+        self.buffer = bytearray(chunk_size)
+        self.view = memoryview(self.buffer)
+        self.start = self.end = 0
+        fp = getattr(response.raw, '_fp', None)
+        if (response._content_consumed or fp is None
+                or not hasattr(fp, 'readinto')):
+            # Not streamed, so the body is in memory already
+            self._readinto = io.BytesIO(response.content).readinto
+        elif response.headers.get('Content-Encoding',
+                                  'identity') == 'identity':
+            self._readinto = _readinto1(fp)
+        else:
+            # Encoded bodies are decoded by urllib3, then copied in
+            self._readinto = self._read_decoded
+
+    def _read_decoded(self, view):
+        raw = self.response.raw
+        # urllib3 2's read1 returns what has arrived and been decoded so far
+        read = getattr(raw, 'read1', raw.read)
+        data = read(len(view), decode_content=True)
+        view[:len(data)] = data
+        return len(data)
+
+    def fill(self, needed=0):
+        """Read more of the body, making room for ``needed`` unparsed bytes
+
+        Returns the number of bytes read, 0 at the end of the body.
+        """
+        pending = self.end - self.start
+        if not pending:
+            self.start = self.end = 0
+        if needed > len(self.buffer):
+            if needed > self.max_size:
+                raise ValueError('Message of %d bytes exceeds the maximum '
+                                 'of %d' % (needed, self.max_size))
+            size = len(self.buffer)
+            while size < needed:
+                size *= 2
+            buffer = bytearray(min(size, self.max_size))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer, self.view = buffer, memoryview(buffer)
+            self.start, self.end = 0, pending
+        elif self.start and (self.start + needed > len(self.buffer) or
+                             self.end > len(self.buffer) * 3 // 4):
+            # Move the unparsed bytes to the front, rather than reading
+            # into a small space at the end
+            self.view[:pending] = self.view[self.start:self.end]
+            self.start, self.end = 0, pending
+        elif self.end == len(self.buffer):
+            return self.fill(pending + 1)
+        n = self._readinto(self.view[self.end:])
+        self.end += n
+        return n
+
+    def close(self):
+        if self.response._content is False:
+            self.response._content_consumed = True
+        # The body was read in full, so the connection can be reused
+        self.response.raw.release_conn()
+
+
+def iter_json_lines(response, chunk_size=DEFAULT_STREAM_CHUNK_SIZE,
+                    max_line_size=DEFAULT_MAX_MESSAGE_SIZE, loads=json.loads):
+    """Iterate over the objects of a newline-delimited JSON response body
+
+    For streams such as Docker's ``/events`` or ``/containers/{id}/stats``.
+    All the complete lines in the buffer are decoded (as UTF-8) at once and
+    handed to ``loads`` (e.g. ``orjson.loads``) one by one, as they arrive;
+    blank lines are skipped. The response must have been requested with
+    ``stream=True``.
+
+    :param max_line_size: Raise ValueError for a longer line, to bound
+        memory use.
+    """
+    stream = _StreamBuffer(response, chunk_size, max_line_size)
+    while stream.fill():
+        last = stream.buffer.rfind(b'\n', stream.start, stream.end)
+        if last < 0:
+            if stream.end - stream.start >= max_line_size:
+                raise ValueError('Line exceeds the maximum of %d bytes'
+                                 % max_line_size)
+            continue
+        lines = str(stream.view[stream.start:last], 'utf-8')
+        stream.start = last + 1
+        for line in lines.split('\n'):
+            if line and not line.isspace():
+                yield loads(line)
+    line = str(stream.view[stream.start:stream.end], 'utf-8')
+    if line and not line.isspace():
+        yield loads(line)
+    stream.close()
+
+
+def iter_docker_frames(response, chunk_size=DEFAULT_STREAM_CHUNK_SIZE,
+                       max_frame_size=DEFAULT_MAX_MESSAGE_SIZE):
+    """Iterate over the frames of a Docker multiplexed stream
+
+    For the bodies of ``/containers/{id}/logs`` and ``/attach`` when the
+    container has no TTY. Yields ``(stream_type, payload)`` tuples, where
+    stream_type is :data:`STDOUT`, :data:`STDERR` or :data:`STDIN` and
+    payload a ``memoryview`` into a reusable buffer, valid only until the
+    next frame is requested. Responses of containers with a TTY
+    (``application/vnd.docker.raw-stream``) aren't multiplexed; their data
+    is yielded as :data:`STDOUT` as it arrives. The response must have been
+    requested with ``stream=True``.
+
+    :param max_frame_size: Raise ValueError for a larger frame, to bound
+        memory use.
+    """
+    stream = _StreamBuffer(response, chunk_size,
+                           _frame_header.size + max_frame_size)
+    if response.headers.get('Content-Type') == DOCKER_RAW_STREAM:
+        while stream.fill():
+            yield STDOUT, stream.view[stream.start:stream.end]
+            stream.start = stream.end = 0
+        stream.close()
+        return
+
+    unpack_from = _frame_header.unpack_from
+    header_size = _frame_header.size
+    needed = header_size
+    while stream.fill(needed):
+        buffer, view = stream.buffer, stream.view
+        start, end = stream.start, stream.end
+        needed = header_size
+        # Yield every complete frame in the buffer
+        while end - start >= header_size:
+            stream_type, size = unpack_from(buffer, start)
+            if size > max_frame_size:
+                raise ValueError('Frame of %d bytes exceeds the maximum of %d'
+                                 % (size, max_frame_size))
+            if end - start - header_size < size:
+                needed = header_size + size
+                break
+            start += header_size
+            yield stream_type, view[start:start + size]
+            start += size
+        stream.start = start
+    if stream.end != stream.start:
+        raise ValueError('Stream ended inside a frame')
+    stream.close()
@@ -3,13 +3,26 @@
 
 """Tests for requests_unixsocket"""
 
+import asyncio
+import gc
+import io
+import json
 import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
 import pytest
 import requests
+import urllib3
 
 import requests_unixsocket
-from requests_unixsocket.testutils import UnixSocketServerThread
+from requests_unixsocket.testutils import (
+    UnixSocketServerThread, docker_frames, json_events, payload_chunks)
 
 
 logger = logging.getLogger(__name__)
@@ -28,6 +41,44 @@ def test_use_UnixAdapter_directly():
     assert url == '/info'
 
 
+def import_times(code):
+    """Run ``code`` with ``python -X importtime``, returning the cumulative
+    import time in microseconds of every module it imported
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        os.path.dirname(os.path.dirname(requests_unixsocket.__file__)),
+        env.get('PYTHONPATH')]))
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], env=env,
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_is_lazy():
+    baseline = set(import_times('pass'))
+    times = import_times('import requests_unixsocket')
+    assert set(times) - baseline == set(['requests_unixsocket'])
+    # A generous budget; importing requests takes ~100ms
+    assert times['requests_unixsocket'] < 50000
+
+    times = import_times('import requests_unixsocket as r; r.Session')
+    # importlib.import_module() isn't logged, but what it imports is
+    assert 'requests' in times
+    assert 'requests_unixsocket.adapters' in times
+    assert 'requests_unixsocket.aio' not in times
+
+    assert 'Session' in dir(requests_unixsocket)
+    with pytest.raises(AttributeError):
+        requests_unixsocket.does_not_exist
+
+
 def test_unix_domain_adapter_ok():
     with UnixSocketServerThread() as usock_thread:
         session = requests_unixsocket.Session('http+unix://')
@@ -82,6 +133,1217 @@ def test_unix_domain_adapter_url_with_query_params():
                 assert r.text == 'Hello world!'
 
 
+def test_unix_domain_adapter_pools_by_socket_path():
+    adapter = requests_unixsocket.UnixAdapter()
+    pool = adapter.get_connection(
+        'http+unix://%2Fvar%2Frun%2Fdocker.sock/containers/abc/json')
+    assert pool is adapter.get_connection(
+        'http+unix://%2fvar%2frun%2fdocker.sock/containers/def/json?all=1')
+    assert pool is not adapter.get_connection(
+        'http+unix://%2Fvar%2Frun%2Fother.sock/containers/abc/json')
+    assert len(adapter.pools) == 2
+
+
+def test_unix_domain_adapter_reuses_connection_across_paths():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session('http+unix://')
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+
+        for i in range(10):
+            url = 'http+unix://%s/containers/%d/json' % (urlencoded_usock, i)
+            r = session.get(url)
+            assert r.status_code == 200
+            assert r.headers['X-Requested-Path'] == '/containers/%d/json' % i
+
+        adapter = session.get_adapter('http+unix://')
+        assert len(adapter.pools) == 1
+        pool = adapter.get_connection(url)
+        assert pool.num_connections == 1
+
+
+def test_get_socket_address():
+    from requests_unixsocket.adapters import get_socket_address_from_url
+
+    assert get_socket_address_from_url(
+        'http+unix://%2Fvar%2Frun%2Fdocker.sock/info?all=1') == (
+        '/var/run/docker.sock')
+    assert get_socket_address_from_url(
+        'http+unix://%2fvar%2frun%2fdocker.sock') == '/var/run/docker.sock'
+    assert get_socket_address_from_url(
+        'http+unix://\0test_socket/get') == b'\0test_socket'
+    assert get_socket_address_from_url(
+        'http+unix://%00test_socket/get') == b'\0test_socket'
+
+
+def test_unix_domain_adapter_pool_settings():
+    session = requests_unixsocket.Session(
+        pool_maxsize=8, pool_block=True, max_retries=3)
+    adapter = session.get_adapter('http+unix://')
+    assert adapter.max_retries.total == 3
+    pool = adapter.get_connection('http+unix://%2Ftmp%2Fsock/info')
+    assert pool.pool.maxsize == 8
+    assert pool.block is True
+
+
+def test_unix_domain_adapter_pool_stats():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(pool_maxsize=2, pool_block=True)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+
+        for _ in range(3):
+            assert session.get(url).status_code == 200
+
+        adapter = session.get_adapter('http+unix://')
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats == {'created': 1, 'reused': 2, 'discarded': 0,
+                         'reaped': 0, 'idle': 1}
+
+        def worker():
+            for _ in range(5):
+                assert session.get(url).status_code == 200
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats['created'] <= 2
+        assert stats['created'] + stats['reused'] == 43
+        assert stats['discarded'] == 0
+
+
+def test_unix_domain_adapter_file_body_uses_sendfile(monkeypatch):
+    sendfile_calls = []
+    orig_sendfile = socket.socket.sendfile
+
+    def sendfile(self, file, offset=0, count=None):
+        sendfile_calls.append((offset, count))
+        return orig_sendfile(self, file, offset, count)
+
+    monkeypatch.setattr(socket.socket, 'sendfile', sendfile)
+
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session('http+unix://')
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/upload' % urlencoded_usock
+
+        with tempfile.TemporaryFile() as body:
+            body.write(b'x' * 1000000)
+            body.seek(100)
+            r = session.post(url, data=body)
+        assert r.status_code == 200
+        assert r.headers['X-Request-Body-Length'] == '999900'
+        assert sendfile_calls == [(100, 999900)]
+
+        r = session.post(url, data=io.BytesIO(b'y' * 1000000))
+        assert r.status_code == 200
+        assert r.headers['X-Request-Body-Length'] == '1000000'
+        assert len(sendfile_calls) == 1
+
+
+def test_iter_content_views():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(recv_buffer_size=1 << 20)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        size = 5 * 1024 * 1024 + 7
+        url = 'http+unix://%s/bytes/%d' % (urlencoded_usock, size)
+        expected = b''.join(payload_chunks(size))
+
+        r = session.get(url, stream=True)
+        buffer = bytearray(256 * 1024)
+        received = bytearray()
+        for view in requests_unixsocket.iter_content_views(r, buffer=buffer):
+            assert isinstance(view, memoryview)
+            assert view.obj is buffer
+            received += view
+        assert received == expected
+
+        # Each view is only valid until the next one, so copy them
+        r = session.get(url, stream=True)
+        assert b''.join(bytes(view) for view in
+                        requests_unixsocket.iter_content_views(r)) == expected
+
+        adapter = session.get_adapter('http+unix://')
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats['created'] == 1
+        assert stats['reused'] == 1
+
+
+def test_iter_json_lines():
+    expected = [json.loads(line) for line in
+                b''.join(json_events(1000)).splitlines()]
+    for gzip_level in (None, 6):
+        with UnixSocketServerThread(gzip_level=gzip_level) as usock_thread:
+            session = requests_unixsocket.Session(compression=True)
+            url = 'http+unix://%s/events/1000' % requests.compat.quote_plus(
+                usock_thread.usock)
+
+            # A small buffer, so that lines span reads and the buffer grows
+            r = session.get(url, stream=True)
+            assert list(requests_unixsocket.iter_json_lines(
+                r, chunk_size=128)) == expected
+            r = session.get(url)
+            assert list(requests_unixsocket.iter_json_lines(r)) == expected
+
+            r = session.get(url, stream=True)
+            with pytest.raises(ValueError):
+                list(requests_unixsocket.iter_json_lines(
+                    r, chunk_size=64, max_line_size=100))
+
+
+def test_iter_docker_frames():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session()
+        url = 'http+unix://%s/logs/1000' % requests.compat.quote_plus(
+            usock_thread.usock)
+        r = session.get(url, stream=True)
+        frames = [(stream_type, bytes(payload)) for stream_type, payload
+                  in requests_unixsocket.iter_docker_frames(r, chunk_size=40)]
+        assert len(frames) == 1000
+        assert frames[0] == (1, b'2024-01-01T00:00:00Z log line 0\n')
+        assert frames[999] == (2, b'2024-01-01T00:00:00Z log line 999\n')
+
+        r = session.get(url, stream=True)
+        with pytest.raises(ValueError):
+            list(requests_unixsocket.iter_docker_frames(r, max_frame_size=10))
+
+        # Without multiplexing, the data comes through as stdout
+        r = session.get(url)
+        r.headers['Content-Type'] = 'application/vnd.docker.raw-stream'
+        assert b''.join(
+            bytes(payload) for stream_type, payload
+            in requests_unixsocket.iter_docker_frames(r)) == \
+            b''.join(docker_frames(1000))
+
+
+def stream_live(sock, content_type, messages, acks, late):
+    # Answers one request on the listening sock with a chunked body that
+    # sends each message only once the client acknowledged the one before
+    conn, _ = sock.accept()
+    with conn:
+        head = b''
+        while b'\r\n\r\n' not in head:
+            data = conn.recv(65536)
+            if not data:
+                return
+            head += data
+        conn.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: %s\r\n'
+                     b'Connection: close\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n' % content_type)
+        for i, message in enumerate(messages):
+            conn.sendall(b'%x\r\n%s\r\n' % (len(message), message))
+            if not acks[i].wait(2):
+                late.append(i)
+        conn.sendall(b'0\r\n\r\n')
+
+
+@pytest.mark.parametrize('name', ['json_lines', 'docker_frames',
+                                  'content_views'])
+def test_streaming_helpers_yield_live_messages(name):
+    messages = {
+        'json_lines': [b'{"id": %d}\n' % i for i in range(3)],
+        'docker_frames': [b'\x01\x00\x00\x00\x00\x00\x00\x06line %d'
+                          % i for i in range(3)],
+        'content_views': [b'chunk %d' % i for i in range(3)],
+    }[name]
+    decode = {
+        'json_lines': lambda r: (json.dumps(item).encode() + b'\n' for item
+                                 in requests_unixsocket.iter_json_lines(r)),
+        'docker_frames': lambda r: (
+            b'\x01\x00\x00\x00\x00\x00\x00\x06' + bytes(payload)
+            for stream_type, payload
+            in requests_unixsocket.iter_docker_frames(r)),
+        'content_views': lambda r: (
+            bytes(view) for view in requests_unixsocket.iter_content_views(r)),
+    }[name]
+    acks = [threading.Event() for _ in messages]
+    late = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(path)
+        sock.listen(1)
+        server = threading.Thread(target=stream_live, args=(
+            sock, b'application/octet-stream', messages, acks, late))
+        server.daemon = True
+        server.start()
+        url = 'http+unix://%s/events' % requests.compat.quote_plus(path)
+        received = []
+        try:
+            r = requests_unixsocket.Session().get(url, stream=True)
+            for data in decode(r):
+                received.append(data)
+                acks[len(received) - 1].set()
+        finally:
+            sock.close()
+            server.join(10)
+    assert received == messages
+    # Each message was yielded before the next one was sent
+    assert late == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'),
+                    reason='abstract namespace sockets are Linux only')
+def test_unix_domain_adapter_abstract_namespace():
+    with UnixSocketServerThread(abstract_namespace=True) as usock_thread:
+        assert usock_thread.usock.startswith('\0')
+        session = requests_unixsocket.Session('http+unix://')
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+
+        r = session.get(url)
+        assert r.status_code == 200
+        assert r.headers['X-Requested-Path'] == '/path/to/page'
+        assert r.text == 'Hello world!'
+        adapter = session.get_adapter('http+unix://')
+        assert list(adapter.pool_stats()) == [
+            usock_thread.usock.encode('ascii')]
+
+
+def test_unix_domain_adapter_observer():
+    events = []
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(observer=events.append)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+        assert session.get(url).text == 'Hello world!'
+        assert session.get(url).text == 'Hello world!'
+
+    assert [event.name for event in events] == [
+        'pool_checkout_start', 'pool_checkout_end',
+        'connect_start', 'connect_end', 'request_sent', 'headers_received',
+        'body_complete',
+        'pool_checkout_start', 'pool_checkout_end',
+        'request_sent', 'headers_received', 'body_complete',
+    ]
+    assert [event.reused for event in events] == [False] * 7 + [True] * 5
+    assert len(set(event.trace_id for event in events[:7])) == 1
+    assert len(set(event.trace_id for event in events[7:])) == 1
+    assert events[0].trace_id != events[7].trace_id
+    assert all(event.socket_address == usock_thread.usock
+               for event in events)
+    timestamps = [event.timestamp for event in events]
+    assert timestamps == sorted(timestamps)
+
+
+def test_unix_domain_adapter_observer_connect_failed():
+    events = []
+    session = requests_unixsocket.Session(observer=events.append)
+    with pytest.raises(requests.ConnectionError):
+        session.get('http+unix://socket_does_not_exist/path/to/page')
+    assert [event.name for event in events][:4] == [
+        'pool_checkout_start', 'pool_checkout_end',
+        'connect_start', 'connect_failed']
+
+
+def test_unix_domain_adapter_compression():
+    adapters = requests_unixsocket.adapters
+    with UnixSocketServerThread(gzip_level=6) as usock_thread:
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/json/100' % urlencoded_usock
+
+        # A local socket gets uncompressed responses by default
+        session = requests_unixsocket.Session()
+        r = session.get(url)
+        assert r.headers['X-Requested-Accept-Encoding'] == 'identity'
+        assert 'Content-Encoding' not in r.headers
+        assert len(r.json()) == 100
+
+        # ... unless compression is turned on for it
+        session = requests_unixsocket.Session(
+            compression={usock_thread.usock: True})
+        r = session.get(url)
+        assert r.headers['X-Requested-Accept-Encoding'] == \
+            adapters.COMPRESSED_ENCODINGS
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert len(r.json()) == 100
+
+        # Streamed bodies are decoded as they arrive
+        r = session.get('http+unix://%s/bytes/1000000' % urlencoded_usock,
+                        stream=True)
+        assert r.headers['Content-Encoding'] == 'gzip'
+        body = b''.join(r.iter_content(65536))
+        assert body == b''.join(payload_chunks(1000000))
+
+        # An Accept-Encoding header set by the caller is left alone
+        r = session.get(url, headers={'Accept-Encoding': 'deflate'})
+        assert r.headers['X-Requested-Accept-Encoding'] == 'deflate'
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/comm'),
+                    reason='needs /proc/<pid>/comm')
+def test_unix_domain_adapter_compression_remote_forwarded(monkeypatch):
+    # The test server runs in this process, so make it look like a forwarder
+    with open('/proc/self/comm') as f:
+        comm = f.read().strip()
+    adapters = requests_unixsocket.adapters
+    with UnixSocketServerThread(gzip_level=6) as usock_thread:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(usock_thread.usock)
+        assert not adapters.is_remote_forwarded(sock)
+        monkeypatch.setattr(adapters, 'REMOTE_FORWARDERS',
+                            frozenset([comm]))
+        assert adapters.is_remote_forwarded(sock)
+        sock.close()
+
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        r = session.get('http+unix://%s/json/10' % urlencoded_usock)
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert len(r.json()) == 10
+
+
+@pytest.mark.skipif(not hasattr(socket, 'SOCK_SEQPACKET'),
+                    reason='needs SOCK_SEQPACKET')
+def test_unix_domain_adapter_seqpacket():
+    with UnixSocketServerThread(
+            socket_type=socket.SOCK_SEQPACKET) as usock_thread:
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix+seqpacket://%s/path/to/page' % urlencoded_usock
+        r = session.get(url)
+        assert r.status_code == 200
+        assert r.headers['X-Requested-Path'] == '/path/to/page'
+        assert r.text == 'Hello world!'
+
+        # Bodies bigger than one message, both ways
+        r = session.post(url, data=b'x' * 300000)
+        assert r.headers['X-Request-Body-Length'] == '300000'
+        r = session.get('http+unix+seqpacket://%s/bytes/1000000'
+                        % urlencoded_usock)
+        assert r.content == b''.join(payload_chunks(1000000))
+
+        adapter = session.get_adapter(url)
+        assert adapter is session.get_adapter('http+unix://')
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats['created'] == 1
+        assert stats['reused'] == 2
+
+        # The scheme picks the socket type
+        with pytest.raises(requests.ConnectionError):
+            session.get('http+unix://%s/path/to/page' % urlencoded_usock)
+
+    with pytest.raises(ValueError):
+        requests_unixsocket.UnixAdapter(socket_type=socket.SOCK_DGRAM)
+
+
+@pytest.mark.skipif(not hasattr(socket, 'SOCK_SEQPACKET'),
+                    reason='needs SOCK_SEQPACKET')
+def test_seqpacket_socket_reads_whole_messages():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    right = requests_unixsocket.SeqpacketSocket(fileno=right.detach())
+    message = b''.join(payload_chunks(100000))
+    left.sendall(message)
+    left.sendall(b'second')
+    left.close()
+    with right.makefile('rb', buffering=0) as f:
+        assert f.read(10) == message[:10]
+        assert f.read(100000) == message[10:]
+        assert f.read(100) == b'second'
+        assert f.read(100) == b''
+    right.close()
+
+
+def test_caching_adapter():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(cache={'default_ttl': 60})
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+
+        # Without caching headers, the default TTL applies
+        r = session.get(url)
+        assert not r.from_cache
+        r = session.get(url)
+        assert r.from_cache
+        assert r.text == 'Hello world!'
+        assert r.headers['X-Requested-Path'] == '/path/to/page'
+        assert usock_thread.requests_served == 1
+
+        # Other query strings, streamed and unsafe requests aren't cached,
+        # and the latter invalidate
+        assert not session.get(url + '?x=1').from_cache
+        assert not hasattr(session.get(url, stream=True), 'from_cache')
+        session.post(url, data=b'x')
+        assert not session.get(url).from_cache
+        assert usock_thread.requests_served == 5
+
+        # Stale responses with an ETag are revalidated
+        url = 'http+unix://%s/cache/v1?max-age=0' % urlencoded_usock
+        assert not session.get(url).from_cache
+        r = session.get(url)
+        assert r.from_cache
+        assert r.status_code == 200
+        assert r.text == 'Hello world!'
+        assert usock_thread.requests_served == 7
+
+        # no-store responses are never stored
+        url = 'http+unix://%s/cache/v1?no-store' % urlencoded_usock
+        assert not session.get(url).from_cache
+        assert not session.get(url).from_cache
+
+        adapter = session.get_adapter(url)
+        assert adapter.stats() == {
+            'hits': 1, 'revalidated': 1, 'misses': 6, 'evicted': 0,
+            'entries': 3, 'bytes': adapter.size}
+        assert usock_thread.usock in adapter.pool_stats()
+
+
+def test_caching_adapter_evicts_least_recently_used():
+    with UnixSocketServerThread() as usock_thread:
+        adapter = requests_unixsocket.CachingAdapter(max_bytes=6000)
+        session = requests_unixsocket.Session()
+        session.mount('http+unix://', adapter)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        urls = ['http+unix://%s/bytes/%d' % (urlencoded_usock, 2000 + i)
+                for i in range(3)]
+        for url in urls[:2]:
+            session.get(url)
+        assert session.get(urls[0]).from_cache
+        session.get(urls[2])
+        assert adapter.stats()['evicted'] == 1
+        assert adapter.size <= 6000
+        assert session.get(urls[0]).from_cache
+        assert not session.get(urls[1]).from_cache
+
+
+def test_unix_domain_adapter_timeouts():
+    with UnixSocketServerThread() as usock_thread:
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s' % urlencoded_usock
+
+        # The adapter's timeout is used for requests sent without one
+        session = requests_unixsocket.Session(timeout=(5, 0.2))
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            session.get(url + '/sleep/0.5')
+        assert session.get(url + '/sleep/0.5', timeout=(5, 2)).ok
+        session = requests_unixsocket.Session(timeout=5, read_timeout=0.2)
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            session.get(url + '/sleep/0.5')
+
+        # A number only bounds connecting, so a stream may go quiet for
+        # longer, streamed or not
+        session = requests_unixsocket.Session(timeout=0.2)
+        assert session.get(url + '/sleep/0.5').ok
+        r = session.get(url + '/drip/2/0.5', stream=True)
+        assert len(r.content) == 2048
+
+        # A total timeout bounds the whole response, unlike the read
+        # timeout, which applies to each wait for data
+        session = requests_unixsocket.Session(timeout=5, total_timeout=0.5)
+        assert session.get(url + '/drip/2/0.1').ok
+        start = time.monotonic()
+        with pytest.raises(requests.ConnectionError):
+            session.get(url + '/drip/10/0.1')
+        assert time.monotonic() - start < 0.9
+        timeout = urllib3.Timeout(connect=5, read=5, total=5)
+        assert session.get(url + '/drip/10/0.1', timeout=timeout).ok
+
+
+def test_unix_domain_adapter_adaptive_timeout():
+    adaptive = requests_unixsocket.adapters.AdaptiveTimeout(
+        connect_timeout=10, read_timeout=None, min_samples=5,
+        min_timeout=0.01)
+    assert adaptive.timeouts() == (10, None)
+    for _ in range(10):
+        adaptive.record_response(0.1)
+    assert adaptive.timeouts() == (10, pytest.approx(0.4))
+
+    with UnixSocketServerThread() as usock_thread:
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s' % urlencoded_usock
+        session = requests_unixsocket.Session(
+            timeout=5,
+            adaptive_timeout={'min_samples': 5, 'min_timeout': 0.1})
+        for _ in range(5):
+            assert session.get(url + '/path/to/page').ok
+
+        # A hung request is shed quickly...
+        start = time.monotonic()
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            session.get(url + '/sleep/1')
+        assert time.monotonic() - start < 0.9
+        # ... but an explicit timeout wins, and slow bodies aren't cut off
+        assert session.get(url + '/sleep/0.3', timeout=5).ok
+        r = session.get(url + '/drip/3/0.2')
+        assert len(r.content) == 3072
+
+
+def test_unix_domain_adapter_circuit_breaker():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        url = 'http+unix://%s/path/to/page' % requests.compat.quote_plus(path)
+        session = requests_unixsocket.Session(circuit_breaker={
+            'failure_threshold': 2, 'reset_timeout': 0.2, 'watch': False})
+        adapter = session.get_adapter(url)
+        assert adapter.breaker_states() == {}
+
+        for _ in range(2):
+            with pytest.raises(requests.ConnectionError) as excinfo:
+                session.get(url)
+            assert not isinstance(excinfo.value,
+                                  requests_unixsocket.SocketUnavailable)
+        with pytest.raises(requests_unixsocket.SocketUnavailable) as excinfo:
+            session.get(url)
+        assert excinfo.value.request.url == url
+        state = adapter.breaker_states()[path]
+        assert state['state'] == 'open'
+        assert 0 < state['retry_in'] <= 0.2
+        assert (state['failures'], state['rejected'], state['opened']) == \
+            (2, 1, 1)
+
+        # A failed trial opens it again...
+        time.sleep(0.2)
+        with pytest.raises(requests.ConnectionError) as excinfo:
+            session.get(url)
+        assert not isinstance(excinfo.value,
+                              requests_unixsocket.SocketUnavailable)
+        assert adapter.breaker_states()[path]['state'] == 'open'
+
+        # ... and a successful one closes it
+        with UnixSocketServerThread(usock=path):
+            with pytest.raises(requests_unixsocket.SocketUnavailable):
+                session.get(url)
+            time.sleep(0.2)
+            assert session.get(url).ok
+            state = adapter.breaker_states()[path]
+            assert state['state'] == 'closed'
+            assert state['consecutive_failures'] == 0
+
+
+def test_unix_domain_adapter_circuit_breaker_watch():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        url = 'http+unix://%s/path/to/page' % requests.compat.quote_plus(path)
+        session = requests_unixsocket.Session(circuit_breaker={
+            'failure_threshold': 1, 'reset_timeout': 60})
+        with pytest.raises(requests.ConnectionError):
+            session.get(url)
+        with pytest.raises(requests_unixsocket.SocketUnavailable):
+            session.get(url)
+
+        # The socket file appearing closes the breaker at once
+        with UnixSocketServerThread(usock=path):
+            assert session.get(url).ok
+
+
+def test_unix_domain_adapter_replicas():
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            UnixSocketServerThread() as first, \
+            UnixSocketServerThread() as second:
+        missing = os.path.join(tmpdir, 'sock')
+        session = requests_unixsocket.Session(replicas={
+            'svc': [first.usock, second.usock, missing]})
+        adapter = session.get_adapter('http+unix://svc/')
+        for i in range(30):
+            r = session.post('http+unix://svc/path/%d' % i, data=b'x')
+            assert r.text == 'Hello world!'
+
+        # Each socket has its own pool, and the missing one was ejected
+        # after its first failed connect, which was retried elsewhere
+        assert first.requests_served + second.requests_served == 30
+        assert first.requests_served and second.requests_served
+        assert set(adapter.pool_stats()) == set(
+            [first.usock, second.usock, missing])
+        states = adapter.replica_states()['svc']
+        assert states[missing]['breaker']['state'] == 'open'
+        assert states[missing]['breaker']['failures'] == 1
+        assert states[first.usock]['requests'] == first.requests_served
+        assert all(state['outstanding'] == 0 for state in states.values())
+
+    # With every socket gone, requests fail fast once all are ejected
+    with pytest.raises(requests.ConnectionError) as excinfo:
+        session.get('http+unix://svc/')
+    assert not isinstance(excinfo.value,
+                          requests_unixsocket.SocketUnavailable)
+    with pytest.raises(requests_unixsocket.SocketUnavailable):
+        session.get('http+unix://svc/')
+
+
+def test_unix_domain_adapter_replica_comes_back():
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            UnixSocketServerThread() as live:
+        dead = os.path.join(tmpdir, 'sock')
+        replica_set = requests_unixsocket.ReplicaSet([live.usock, dead],
+                                                     eject_time=0.2)
+        session = requests_unixsocket.Session(replicas={'svc': replica_set})
+        for _ in range(10):
+            assert session.get('http+unix://svc/path').ok
+        assert replica_set.snapshot()[dead]['breaker']['state'] == 'open'
+
+        # Its socket file appears while the other replica is still up
+        with UnixSocketServerThread(usock=dead) as revived:
+            for _ in range(50):
+                assert session.get('http+unix://svc/path').ok
+            assert revived.requests_served
+            assert replica_set.snapshot()[dead]['breaker']['state'] == \
+                'closed'
+
+
+def test_unix_domain_adapter_replicas_adaptive_timeout():
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            UnixSocketServerThread() as live:
+        dead = os.path.join(tmpdir, 'sock')
+        replica_set = requests_unixsocket.ReplicaSet([live.usock, dead],
+                                                     eject_time=0.2)
+        session = requests_unixsocket.Session(
+            replicas={'svc': replica_set}, adaptive_timeout=True)
+        for _ in range(10):
+            assert session.get('http+unix://svc/path').ok
+        breaker = replica_set.snapshot()[dead]['breaker']
+        assert (breaker['state'], breaker['failures']) == ('open', 1)
+
+        # The trial request goes to the ejected socket, and is retried on
+        # the other one when it fails
+        time.sleep(0.2)
+        assert session.get('http+unix://svc/path').ok
+        breaker = replica_set.snapshot()[dead]['breaker']
+        assert (breaker['state'], breaker['failures']) == ('open', 2)
+        assert live.requests_served == 11
+
+
+def test_unix_domain_adapter_coalesce():
+    with UnixSocketServerThread(threads=8, latency=0.3) as usock_thread:
+        session = requests_unixsocket.Session(coalesce=True, pool_maxsize=8)
+        url = 'http+unix://%s/json/3' % requests.compat.quote_plus(
+            usock_thread.usock)
+        barrier = threading.Barrier(6)
+        responses = []
+
+        def get(url):
+            barrier.wait()
+            responses.append(session.get(url))
+
+        threads = [threading.Thread(target=get, args=(url,))
+                   for _ in range(5)]
+        threads.append(threading.Thread(target=get, args=(url + '?all=1',)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # One request per distinct URL reached the server
+        assert usock_thread.requests_served == 2
+        assert len(set(map(id, responses))) == 6
+        assert all(r.json() == responses[0].json() for r in responses)
+        assert sorted(r.request.url for r in responses)[-1].endswith('?all=1')
+        adapter = session.get_adapter('http+unix://')
+        assert adapter.coalescing_stats() == {
+            'sent': 2, 'coalesced': 4, 'in_flight': 0}
+
+        # Requests with a body are never coalesced
+        session.post(url, data=b'x')
+        assert adapter.coalescing_stats()['sent'] == 2
+
+    # Errors are passed on and the flight ends
+    with pytest.raises(requests.ConnectionError):
+        session.get(url)
+    assert adapter.coalescing_stats()['in_flight'] == 0
+
+
+def test_unix_domain_adapter_coalesce_waiters():
+    with UnixSocketServerThread(threads=2, latency=1.0) as usock_thread:
+        adapter = requests_unixsocket.UnixAdapter(coalesce=True)
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(
+            usock_thread.usock)
+        leader = threading.Thread(target=adapter.send, args=(
+            requests.Request('GET', url).prepare(),), kwargs={'timeout': 60})
+        leader.start()
+        while not adapter.coalescing_stats()['in_flight']:
+            time.sleep(0.01)
+        # A waiter gives up after its own timeout, not the leader's
+        started = time.monotonic()
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            adapter.send(requests.Request('GET', url).prepare(), timeout=0.2)
+        assert time.monotonic() - started < 0.9
+        leader.join()
+
+    # Each waiter gets an exception of its own, caused by the leader's
+    release = threading.Event()
+    errors = {}
+
+    def failing_send(request, **kwargs):
+        release.wait()
+        raise requests.ConnectionError('boom', request=request)
+
+    adapter._send = failing_send
+
+    def send(name):
+        request = requests.Request('GET', url).prepare()
+        try:
+            adapter.send(request)
+        except requests.ConnectionError as e:
+            errors[name] = (e, request)
+
+    threads = [threading.Thread(target=send, args=(name,))
+               for name in ('leader', 'waiter1', 'waiter2')]
+    threads[0].start()
+    while not adapter.coalescing_stats()['in_flight']:
+        time.sleep(0.01)
+    threads[1].start()
+    threads[2].start()
+    while adapter.coalescing_stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    leader_error = errors['leader'][0]
+    for name in ('waiter1', 'waiter2'):
+        error, request = errors[name]
+        assert error is not leader_error
+        assert error.__cause__ is leader_error
+        assert error.request is request
+        assert str(error) == 'boom'
+
+
+def test_replica_set_strategies():
+    replica_set = requests_unixsocket.ReplicaSet(['/a', '/b', '/c'])
+    replica_set.acquire('/a')
+    replica_set.acquire('/b')
+    assert replica_set.choose() == '/c'
+    replica_set.acquire('/c')
+    replica_set.acquire('/c')
+    assert replica_set.choose() in ('/a', '/b')
+    replica_set.breakers['/a'].record_failure()
+    assert replica_set.choose() == '/b'
+    # Once due, the ejected socket gets its trial though others are up
+    replica_set.breakers['/a'].retry_at = time.monotonic()
+    assert replica_set.choose() == '/a'
+    assert replica_set.breakers['/a'].state == 'half_open'
+    assert replica_set.choose() in ('/b', '/c')
+    assert replica_set.breakers['/a'].snapshot()['rejected'] == 0
+
+    replica_set = requests_unixsocket.ReplicaSet(
+        ['/a', '/b'], strategy='power_of_two')
+    replica_set.acquire('/a')
+    assert replica_set.choose() == '/b'
+    assert replica_set.url_for('/a') == 'http+unix://%2Fa/'
+    with pytest.raises(ValueError):
+        requests_unixsocket.ReplicaSet(['/a'], strategy='round_robin')
+
+
+def read_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+
+def test_session_upgrade():
+    with UnixSocketServerThread(simple_server=True) as usock_thread:
+        session = requests_unixsocket.Session()
+        url = 'http+unix://%s/containers/web/attach' % (
+            requests.compat.quote_plus(usock_thread.usock))
+        with session.upgrade(url) as conn:
+            assert conn.response.status_code == 101
+            assert conn.response.headers['Upgrade'] == 'tcp'
+            greeting = conn.buffered
+            greeting += read_exactly(conn.sock, 8 - len(greeting))
+            assert greeting == b'welcome\n'
+            conn.sock.sendall(b'ping')
+            assert read_exactly(conn.sock, 4) == b'ping'
+
+        # The pool's connection was left without the socket
+        assert session.get(url.replace('attach', 'json')).ok
+        stats = session.get_adapter(url).pool_stats()[usock_thread.usock]
+        assert stats['created'] == 2
+
+        async def run():
+            conn = session.upgrade(url)
+            reader, writer = await conn.open_streams()
+            assert await reader.readexactly(8) == b'welcome\n'
+            writer.write(b'pong')
+            assert await reader.readexactly(4) == b'pong'
+            writer.close()
+            await writer.wait_closed()
+
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize('use_splice', [True, False])
+def test_relay(use_splice):
+    payload = os.urandom(3 * 1024 * 1024 + 5)
+    with UnixSocketServerThread(simple_server=True) as usock_thread:
+        session = requests_unixsocket.Session()
+        url = 'http+unix://%s/exec/1/start' % (
+            requests.compat.quote_plus(usock_thread.usock))
+        local, remote = socket.socketpair()
+        received = []
+
+        def send():
+            local.sendall(payload)
+            local.shutdown(socket.SHUT_WR)
+
+        def receive():
+            while True:
+                data = local.recv(1024 * 1024)
+                if not data:
+                    break
+                received.append(data)
+
+        threads = [threading.Thread(target=send),
+                   threading.Thread(target=receive)]
+        for thread in threads:
+            thread.start()
+        with session.upgrade(url) as conn:
+            result = conn.relay(remote, buffer_size=64 * 1024,
+                                use_splice=use_splice)
+        remote.close()
+        for thread in threads:
+            thread.join()
+        assert b''.join(received) == b'welcome\n' + payload
+        assert result == (len(payload) + 8, len(payload))
+        local.close()
+
+
+def test_fast_client():
+    with UnixSocketServerThread() as usock_thread:
+        url = 'http+unix://%s' % requests.compat.quote_plus(
+            usock_thread.usock)
+        with requests_unixsocket.FastClient() as client:
+            r = client.get(url + '/path/to/page?a=1#top')
+            assert r.status == 200
+            assert r.body == b'Hello world!'
+            assert r.headers['x-requested-path'] == '/path/to/page'
+            assert r.headers['x-requested-query-string'] == 'a=1'
+
+            r = client.post(url + '/upload', body='h\xe9',
+                            headers={'Content-Type': 'text/plain'})
+            assert r.headers['x-request-body-length'] == '3'
+            stats = client.adapter.pool_stats()[usock_thread.usock]
+            assert (stats['created'], stats['reused']) == (1, 1)
+
+            r = client.request('GET', url + '/events/3')
+            assert r.headers['transfer-encoding'] == 'chunked'
+            assert [json.loads(line) for line in r.body.splitlines()] == \
+                list(map(json.loads, b''.join(json_events(3)).splitlines()))
+
+            r = client.get(url + '/cache/v1',
+                           headers={'If-None-Match': '"v1"'})
+            assert (r.status, r.body) == (304, b'')
+            assert client.request('HEAD', url + '/bytes/10').body == b''
+
+            r = client.get(url + '/bytes/100000', stream=True)
+            assert r.headers['content-length'] == '100000'
+            assert r.body.read() == b''.join(payload_chunks(100000))
+
+            with pytest.raises(urllib3.exceptions.NewConnectionError):
+                client.get('http+unix://socket_does_not_exist/path')
+
+    # Large bodies, with a Content-Length and chunked
+    size = 8 * 1024 * 1024 + 3
+    for chunked in (False, True):
+        with UnixSocketServerThread(chunked=chunked) as usock_thread:
+            with requests_unixsocket.FastClient() as client:
+                r = client.get('http+unix://%s/bytes/%d' % (
+                    requests.compat.quote_plus(usock_thread.usock), size))
+                assert r.body == b''.join(payload_chunks(size))
+
+
+def answer_requests(sock, responses, heads):
+    # Answers the requests on one connection to the listening sock with
+    # responses, in order, recording the head of each request
+    conn, _ = sock.accept()
+    buffered = b''
+    with conn:
+        for response in responses:
+            while b'\r\n\r\n' not in buffered:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                buffered += data
+            head, _, buffered = buffered.partition(b'\r\n\r\n')
+            heads.append(head)
+            conn.sendall(response)
+
+
+def test_fast_client_framing():
+    ok = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+    responses = [
+        b'HTTP/1.1 100 Continue\r\n\r\n'
+        b'HTTP/1.1 103 Early Hints\r\nLink: </style.css>\r\n\r\n' + ok,
+        ok,
+        b'HTTP/1.1 200 OK\r\nContent-Length: two\r\n\r\nok',
+    ]
+    heads = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(path)
+        sock.listen(1)
+        server = threading.Thread(target=answer_requests,
+                                  args=(sock, responses, heads))
+        server.daemon = True
+        server.start()
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(path)
+        try:
+            with requests_unixsocket.FastClient() as client:
+                # Interim responses are skipped
+                r = client.get(url)
+                assert (r.status, r.body) == (200, b'ok')
+                assert 'link' not in r.headers
+                # A POST without a body says so
+                assert client.post(url).body == b'ok'
+                assert b'\r\nContent-Length: 0' in heads[1]
+                with pytest.raises(requests.exceptions.InvalidHeader):
+                    client.get(url)
+        finally:
+            sock.close()
+            server.join(5)
+
+
+def test_fast_client_ignores_stale_deadline():
+    with UnixSocketServerThread() as usock_thread:
+        url = 'http+unix://%s' % requests.compat.quote_plus(
+            usock_thread.usock)
+        with requests_unixsocket.FastClient(total_timeout=0.2) as client:
+            # Streamed requests go through urlopen, which sets a deadline
+            r = client.get(url + '/bytes/10', stream=True)
+            assert len(r.body.read()) == 10
+            time.sleep(0.3)
+            r = client.get(url + '/drip/2/0.1')
+            assert len(r.body) == 2048
+            pool = client.adapter.get_connection(url)
+            assert all(conn.sock.deadline is None for conn in pool.pool.queue
+                       if conn is not None and conn.sock is not None)
+
+
+def test_fast_client_circuit_breaker():
+    client = requests_unixsocket.FastClient(
+        circuit_breaker={'failure_threshold': 1, 'reset_timeout': 60})
+    url = 'http+unix://socket_does_not_exist/path'
+    with pytest.raises(urllib3.exceptions.NewConnectionError):
+        client.get(url)
+    for _ in range(2):
+        with pytest.raises(requests_unixsocket.SocketUnavailable):
+            client.get(url)
+    state = client.adapter.breaker_states()['socket_does_not_exist']
+    assert (state['failures'], state['rejected']) == (1, 2)
+
+
+def test_idle_connections_are_reaped():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(idle_timeout=0.05)
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(
+            usock_thread.usock)
+        assert session.get(url).ok
+        adapter = session.get_adapter(url)
+        info = adapter.pool_info()[usock_thread.usock]
+        assert (info['in_use'], len(info['connections'])) == (0, 1)
+        conn = info['connections'][0]
+        assert 0 <= conn['idle_for'] <= conn['age'] <= info['age']
+
+        time.sleep(0.1)
+        # Reaped by the next request, which reconnects
+        assert session.get(url).ok
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert (stats['created'], stats['reaped']) == (2, 1)
+        [conn] = adapter.pool_info()[usock_thread.usock]['connections']
+        assert conn['age'] < 0.05
+
+
+def test_unused_pools_are_dropped_by_reaper_thread():
+    with UnixSocketServerThread() as usock_thread1, \
+            UnixSocketServerThread() as usock_thread2:
+        session = requests_unixsocket.Session(
+            pool_idle_timeout=0.1, reaper_thread=True, circuit_breaker=True)
+        adapter = session.get_adapter('http+unix://')
+        for usock in (usock_thread1.usock, usock_thread2.usock):
+            assert session.get('http+unix://%s/path'
+                               % requests.compat.quote_plus(usock)).ok
+        assert set(adapter.pool_info()) == set([usock_thread1.usock,
+                                                usock_thread2.usock])
+        assert len(adapter.breaker_states()) == 2
+        deadline = time.monotonic() + 5
+        while adapter.pool_info() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert adapter.pool_info() == {}
+        assert adapter.breaker_states() == {}
+
+        def reaper_names():
+            return [thread.name for thread in threading.enumerate()
+                    if thread.name == 'requests_unixsocket reaper']
+
+        assert reaper_names()
+        session.close()
+        deadline = time.monotonic() + 5
+        while reaper_names() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert not reaper_names()
+
+
+def test_max_fds():
+    with UnixSocketServerThread() as usock_thread1, \
+            UnixSocketServerThread() as usock_thread2, \
+            UnixSocketServerThread() as usock_thread3:
+        usocks = [usock_thread1.usock, usock_thread2.usock,
+                  usock_thread3.usock]
+        session = requests_unixsocket.Session(max_fds=2, pool_maxsize=4)
+        adapter = session.get_adapter('http+unix://')
+        for usock in usocks:
+            assert session.get('http+unix://%s/path'
+                               % requests.compat.quote_plus(usock)).ok
+        info = adapter.pool_info()
+        # The longest idle socket made room for the third one
+        assert [len(info[usock]['connections']) for usock in usocks] == [
+            0, 1, 1]
+        assert adapter.pool_stats()[usocks[0]]['reaped'] == 1
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                    reason='requires /proc/self/fd')
+def test_soak_fds_stay_flat():
+    def num_fds():
+        gc.collect()
+        return len(os.listdir('/proc/self/fd'))
+
+    session = requests_unixsocket.Session(pool_idle_timeout=0.01)
+    counts = []
+    for i in range(30):
+        with UnixSocketServerThread() as usock_thread:
+            url = 'http+unix://%s/path' % requests.compat.quote_plus(
+                usock_thread.usock)
+            for _ in range(3):
+                assert session.get(url).ok
+        time.sleep(0.02)
+        counts.append(num_fds())
+    # Without reaping, every round would leave an idle socket behind
+    assert max(counts[5:]) <= counts[4]
+    assert len(session.get_adapter(url).pool_info()) <= 1
+
+
+def test_session_map():
+    with UnixSocketServerThread(threads=4) as usock_thread:
+        session = requests_unixsocket.Session(pool_maxsize=4)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        urls = ['http+unix://%s/containers/%d/stats' % (urlencoded_usock, i)
+                for i in range(50)]
+        items = urls + [
+            requests.Request('POST', urls[0], data=b'abc'),
+            'http+unix://socket_does_not_exist/path/to/page',
+        ]
+
+        threads = threading.active_count()
+        results = []
+        for result in session.map(iter(items), concurrency=4, timeout=5):
+            # Everything is sent from this thread
+            assert threading.active_count() == threads
+            results.append(result)
+        results.sort()
+        assert [result.index for result in results] == list(range(52))
+        for i, result in enumerate(results[:50]):
+            assert result.exception is None
+            assert result.response.headers['X-Requested-Path'] == (
+                '/containers/%d/stats' % i)
+        assert results[50].request.method == 'POST'
+        assert results[50].response.headers['X-Request-Body-Length'] == '3'
+        assert results[51].response is None
+        assert isinstance(results[51].exception, requests.ConnectionError)
+        assert usock_thread.connections_accepted <= 4
+
+        results = list(session.map(
+            ['http+unix://%s/sleep/1' % urlencoded_usock, urls[1]],
+            timeout=(5, 0.2)))
+        assert results[0].index == 1 and results[0].response.ok
+        assert isinstance(results[1].exception, requests.ReadTimeout)
+
+        session = requests_unixsocket.Session(total_timeout=0.3)
+        results = sorted(session.map(
+            ['http+unix://%s/drip/10/0.1' % urlencoded_usock, urls[1]]))
+        assert isinstance(results[0].exception, requests.ReadTimeout)
+        assert results[1].response.ok
+
+
+def test_session_map_iterable_raises():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session()
+        url = 'http+unix://%s/path/to/page' % requests.compat.quote_plus(
+            usock_thread.usock)
+
+        def items():
+            yield url
+            yield url
+            raise KeyError('no more')
+
+        results = []
+        with pytest.raises(KeyError):
+            for result in session.map(items(), concurrency=2):
+                results.append(result)
+        # The requests in flight were finished first
+        assert sorted(result.index for result in results) == [0, 1]
+        assert all(result.response.ok for result in results)
+
+
+def test_session_map_stops_when_closed():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+        results = session.map([url] * 1000, concurrency=2)
+        assert next(results).response.status_code == 200
+        results.close()
+        time.sleep(0.1)
+        assert usock_thread.requests_served < 10
+
+
+def test_unix_domain_adapter_prewarm():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(pool_maxsize=3)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+
+        assert session.prewarm(url) == 3
+        assert session.prewarm(url) == 0
+        adapter = session.get_adapter('http+unix://')
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats['created'] == 3
+        assert stats['idle'] == 3
+
+        for _ in range(3):
+            assert session.get(url).status_code == 200
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats['created'] == 3
+        assert stats['reused'] == 3
+        assert usock_thread.connections_accepted == 3
+
+
+def test_unix_http_connection_is_connected():
+    from requests_unixsocket.adapters import UnixHTTPConnection
+
+    conn = UnixHTTPConnection('http+unix://%2Ftmp%2Fsock')
+    assert not conn.is_connected
+    conn.sock, server = socket.socketpair(socket.AF_UNIX)
+    conn.sock.settimeout(60)
+    assert conn.is_connected
+    assert conn.sock.gettimeout() == 60
+    server.sendall(b'HTTP/1.1 200 OK')
+    assert not conn.is_connected
+    conn.sock.recv(100)
+    assert conn.is_connected
+    server.close()
+    assert not conn.is_connected
+    conn.close()
+
+
+def test_unix_domain_adapter_reconnects_after_server_restart():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+        assert session.get(url).status_code == 200
+
+    with UnixSocketServerThread(usock=usock_thread.usock):
+        assert session.get(url).status_code == 200
+        adapter = session.get_adapter('http+unix://')
+        stats = adapter.pool_stats()[usock_thread.usock]
+        assert stats['created'] == 2
+        assert stats['reused'] == 0
+
+
 def test_unix_domain_adapter_connection_error():
     session = requests_unixsocket.Session('http+unix://')
 
@@ -132,3 +1394,411 @@ def test_unix_domain_adapter_monkeypatch():
     for method in ['get', 'post', 'head', 'patch', 'put', 'delete', 'options']:
         with pytest.raises(requests.exceptions.InvalidSchema):
             getattr(requests, method)(url)
+
+
+def test_unix_domain_adapter_monkeypatch_shared_session():
+    with UnixSocketServerThread() as usock_thread:
+        with requests_unixsocket.monkeypatch(shared_session=True):
+            urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+            url = 'http+unix://%s/path/to/page' % urlencoded_usock
+
+            for _ in range(5):
+                r = requests.get(url)
+                assert r.status_code == 200
+                assert r.text == 'Hello world!'
+
+            session = requests_unixsocket.get_shared_session()
+            assert r.connection is session.get_adapter('http+unix://')
+            stats = r.connection.pool_stats()[usock_thread.usock]
+            assert stats['created'] == 1
+            assert stats['reused'] == 4
+
+        assert requests_unixsocket.sessions._shared_session is None
+        r = requests_unixsocket.get(url)
+        assert r.status_code == 200
+        assert requests_unixsocket.sessions._shared_session is None
+
+
+def test_shared_session_does_not_keep_cookies():
+    responses = [
+        b'HTTP/1.1 200 OK\r\nSet-Cookie: token=secret\r\n'
+        b'Content-Length: 2\r\n\r\nok',
+        b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok',
+        b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok',
+    ]
+    heads = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(path)
+        sock.listen(1)
+        server = threading.Thread(target=answer_requests,
+                                  args=(sock, responses, heads))
+        server.daemon = True
+        server.start()
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(path)
+        requests_unixsocket.use_shared_session()
+        try:
+            r = requests_unixsocket.get(url)
+            assert r.cookies['token'] == 'secret'
+            assert requests_unixsocket.get(url).ok
+            assert requests_unixsocket.get(url, cookies={'a': 'b'}).ok
+            assert not requests_unixsocket.get_shared_session().cookies
+        finally:
+            requests_unixsocket.use_shared_session(False)
+            sock.close()
+        server.join(5)
+
+    # All on one connection, but the cookie isn't sent back
+    assert len(heads) == 3
+    assert b'cookie' not in heads[1].lower()
+    assert b'\r\nCookie: a=b' in heads[2]
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+@pytest.mark.filterwarnings('ignore:This process .* is multi-threaded')
+def test_shared_session_is_replaced_after_fork():
+    requests_unixsocket.use_shared_session()
+    try:
+        session = requests_unixsocket.get_shared_session()
+        assert requests_unixsocket.get_shared_session() is session
+
+        pid = os.fork()
+        if pid == 0:  # child
+            child_session = requests_unixsocket.get_shared_session()
+            os._exit(0 if child_session is not session else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert requests_unixsocket.get_shared_session() is session
+    finally:
+        requests_unixsocket.use_shared_session(False)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+@pytest.mark.filterwarnings('ignore:This process .* is multi-threaded')
+def test_replica_sets_are_reset_after_fork():
+    adapter = requests_unixsocket.UnixAdapter(replicas={'svc': ['/a', '/b']})
+    replica_set = adapter.replicas['svc']
+    replica_set.acquire('/a')
+    replica_set.breakers['/b'].record_failure()
+    # As if another thread was in acquire() at fork time
+    with replica_set._lock:
+        pid = os.fork()
+        if pid == 0:  # child
+            states = replica_set.snapshot()
+            ok = (all(state['outstanding'] == 0 for state in states.values())
+                  and states['/b']['breaker']['state'] == 'closed'
+                  and adapter.replicas['svc'] is replica_set)
+            replica_set.acquire('/a')
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert replica_set.snapshot()['/a']['outstanding'] == 1
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+@pytest.mark.filterwarnings('ignore:This process .* is multi-threaded')
+def test_caching_adapter_is_reset_after_fork():
+    with UnixSocketServerThread() as usock_thread:
+        session = requests_unixsocket.Session(cache={'default_ttl': 60})
+        adapter = session.get_adapter('http+unix://')
+        url = 'http+unix://%s/path/to/page' % requests.compat.quote_plus(
+            usock_thread.usock)
+        assert not session.get(url).from_cache
+        # As if another thread was in send() at fork time
+        with adapter._lock:
+            pid = os.fork()
+            if pid == 0:  # child
+                ok = (session.get(url).from_cache
+                      and not session.get(url + '?x=1').from_cache
+                      and adapter.stats()['entries'] == 2)
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert adapter.stats()['entries'] == 1
+
+
+def test_async_session_ok():
+    async def run(url):
+        async with requests_unixsocket.AsyncSession() as session:
+            for method in ['get', 'post', 'head', 'patch', 'put', 'delete',
+                           'options']:
+                r = await getattr(session, method)(url, params={'a': 1})
+                assert r.status_code == 200
+                assert r.headers['X-Transport'] == 'unix domain socket'
+                assert r.headers['X-Requested-Path'] == '/path/to/page'
+                assert r.headers['X-Requested-Query-String'] == 'b=2&a=1'
+                if method == 'head':
+                    assert r.text == ''
+                else:
+                    assert r.text == 'Hello world!'
+
+            r = await session.get(url, stream=True)
+            chunks = [chunk async for chunk in r.iter_content(5)]
+            assert chunks == [b'Hello', b' worl', b'd!']
+
+            pool = session.get_pool(url)
+            assert pool.num_connections == 1
+            assert len(pool.idle) == 1
+
+    with UnixSocketServerThread() as usock_thread:
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page?b=2' % urlencoded_usock
+        asyncio.run(run(url))
+
+
+def test_async_session_connection_error():
+    async def run():
+        async with requests_unixsocket.AsyncSession() as session:
+            with pytest.raises(requests.ConnectionError):
+                await session.get(
+                    'http+unix://socket_does_not_exist/path/to/page')
+            with pytest.raises(requests.exceptions.InvalidSchema):
+                await session.get('http://localhost/path/to/page')
+
+    asyncio.run(run())
+
+
+def serve_script(sock, script, received):
+    # Answers each request on the listening sock with the next item of
+    # script: a full response (True), or these bytes, then closes
+    response = (b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+    while script:
+        conn, _ = sock.accept()
+        buffered = b''
+        with conn:
+            while script:
+                while b'\r\n\r\n' not in buffered:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    buffered += data
+                if not data:
+                    break
+                head, _, buffered = buffered.partition(b'\r\n\r\n')
+                for line in head.split(b'\r\n'):
+                    name, _, value = line.partition(b':')
+                    if name.lower() == b'content-length':
+                        buffered = buffered[int(value):]
+                received.append(head.split(b' ')[0].decode())
+                action = script.pop(0)
+                if action is True:
+                    conn.sendall(response)
+                else:
+                    conn.sendall(action)
+                    break
+
+
+def test_session_map_resends_on_closed_connection():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(path)
+        sock.listen(1)
+        received = []
+        # The server hangs up on the reused connection without answering
+        server = threading.Thread(target=serve_script, args=(
+            sock, [True, b'', True], received))
+        server.daemon = True
+        server.start()
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(path)
+        session = requests_unixsocket.Session()
+        try:
+            results = list(session.map([url, url], concurrency=1))
+        finally:
+            sock.close()
+            server.join(5)
+        assert [result.response.text for result in results] == ['ok', 'ok']
+        assert received == ['GET'] * 3
+
+
+@pytest.mark.parametrize('method,failure,sent', [
+    ('GET', b'HTTP/1.1 2', 3),
+    ('POST', b'HTTP/1.1 2', 2),
+    ('POST', b'', 3),
+])
+def test_async_session_resends_only_when_safe(method, failure, sent):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(path)
+        sock.listen(1)
+        received = []
+        server = threading.Thread(target=serve_script, args=(
+            sock, [True, failure, True][:sent], received))
+        server.daemon = True
+        server.start()
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(path)
+
+        async def run():
+            async with requests_unixsocket.AsyncSession() as session:
+                r = await session.request(method, url, data=b'x')
+                assert r.text == 'ok'
+                # The server fails on the reused connection; a partial
+                # response may mean it acted on the request
+                if sent == 3:
+                    r = await session.request(method, url, data=b'x')
+                    assert r.text == 'ok'
+                else:
+                    with pytest.raises(requests.ConnectionError):
+                        await session.request(method, url, data=b'x')
+
+        try:
+            asyncio.run(run())
+        finally:
+            sock.close()
+            server.join(5)
+        assert received == [method] * sent
+
+
+@pytest.mark.parametrize('response,error', [
+    # Closed where the next chunk size, or the rest of a chunk, should be
+    (b'Transfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n',
+     requests.ConnectionError),
+    (b'Transfer-Encoding: chunked\r\n\r\n5\r\nhel',
+     requests.ConnectionError),
+    (b'Transfer-Encoding: chunked\r\n\r\nfive\r\nhello\r\n',
+     requests.ConnectionError),
+    # A header line over the reader's limit
+    (b'X-Padding: %s\r\n\r\n' % (b'x' * 100000), requests.ConnectionError),
+    (b'Content-Length: two\r\n\r\nok', requests.exceptions.InvalidHeader),
+], ids=['eof_at_chunk_size', 'eof_in_chunk', 'bad_chunk_size', 'long_line',
+        'bad_content_length'])
+def test_async_session_bad_responses(response, error):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'sock')
+        sock = socket.socket(socket.AF_UNIX)
+        sock.bind(path)
+        sock.listen(1)
+        received = []
+        server = threading.Thread(target=serve_script, args=(
+            sock, [b'HTTP/1.1 200 OK\r\n' + response], received))
+        server.daemon = True
+        server.start()
+        url = 'http+unix://%s/path' % requests.compat.quote_plus(path)
+
+        async def run():
+            async with requests_unixsocket.AsyncSession() as session:
+                with pytest.raises(error):
+                    await session.get(url)
+
+        try:
+            asyncio.run(run())
+        finally:
+            sock.close()
+            server.join(5)
+        assert received == ['GET']
+
+
+def test_server_thread_counters_and_shutdown():
+    with UnixSocketServerThread(threads=2) as usock_thread:
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+        for _ in range(5):
+            assert session.get(url).text == 'Hello world!'
+        assert usock_thread.connections_accepted == 1
+        assert usock_thread.requests_served == 5
+        start = time.monotonic()
+
+    assert time.monotonic() - start < 0.5
+    assert not usock_thread.is_alive()
+    assert not os.path.exists(usock_thread.usock)
+
+
+def test_server_thread_without_keep_alive():
+    with UnixSocketServerThread(keep_alive=False) as usock_thread:
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+        for _ in range(3):
+            r = session.get(url)
+            assert r.headers['Connection'] == 'close'
+            assert r.text == 'Hello world!'
+        assert usock_thread.connections_accepted == 3
+        assert usock_thread.requests_served == 3
+
+
+def test_server_thread_response_options():
+    with UnixSocketServerThread(response_size=100000, chunked=True,
+                                latency=0.05) as usock_thread:
+        session = requests_unixsocket.Session()
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+        url = 'http+unix://%s/path/to/page' % urlencoded_usock
+        start = time.monotonic()
+        r = session.get(url)
+        assert time.monotonic() - start >= 0.05
+        assert r.headers['Transfer-Encoding'] == 'chunked'
+        assert r.content == b''.join(payload_chunks(100000))
+
+        async def run():
+            async with requests_unixsocket.AsyncSession() as async_session:
+                r = await async_session.get(url)
+                assert r.content == b''.join(payload_chunks(100000))
+
+        asyncio.run(run())
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+@pytest.mark.filterwarnings('ignore:This process .* is multi-threaded')
+def test_unix_domain_adapter_fork_under_load():
+    with UnixSocketServerThread(threads=8) as usock_thread:
+        session = requests_unixsocket.Session(pool_maxsize=4)
+        urlencoded_usock = requests.compat.quote_plus(usock_thread.usock)
+
+        def url(name, i):
+            return 'http+unix://%s/worker/%s/%d' % (urlencoded_usock, name, i)
+
+        stop = threading.Event()
+        errors = []
+
+        def load():
+            i = 0
+            while not stop.is_set():
+                i += 1
+                path = url('parent', i)
+                r = session.get(path)
+                if r.headers['X-Requested-Path'] != '/worker/parent/%d' % i:
+                    errors.append(r.headers['X-Requested-Path'])
+
+        threads = [threading.Thread(target=load) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            pids = []
+            for child in range(8):
+                time.sleep(0.01)
+                pid = os.fork()
+                if pid == 0:  # child
+                    status = 1
+                    try:
+                        adapter = session.get_adapter('http+unix://')
+                        assert not adapter.pool_stats()
+                        for i in range(20):
+                            r = session.get(url(child, i))
+                            assert r.headers['X-Requested-Path'] == (
+                                '/worker/%d/%d' % (child, i))
+                        status = 0
+                    finally:
+                        os._exit(status)
+                pids.append(pid)
+
+            deadline = time.monotonic() + 30
+            for pid in pids:
+                while True:
+                    done, status = os.waitpid(pid, os.WNOHANG)
+                    if done:
+                        break
+                    if time.monotonic() > deadline:
+                        os.kill(pid, 9)
+                        pytest.fail('child %d deadlocked' % pid)
+                    time.sleep(0.01)
+                assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        assert not errors
+        assert session.get(url('parent', 0)).status_code == 200
+        assert usock_thread.requests_served >= 8 * 20
@@ -14,42 +14,201 @@ Example usage:
                 urlencoded_usock = quote_plus(usock_process.usock)
                 url = 'http+unix://%s/path/to/page' % urlencoded_usock
                 r = requests.get(url)
+
+The server can be tuned for load tests, and counts the connections it
+accepted and the requests it served:
+
+.. code-block:: python
+
+    with UnixSocketServerThread(threads=16, response_size=4096,
+                                latency=0.001) as usock_thread:
+        ...
+        assert usock_thread.connections_accepted == 1
 """
 
+import gzip
+import http.server
+import json
 import logging
 import os
+import socket
+import socketserver
+import struct
+import sys
 import threading
 import time
 import uuid
+import wsgiref.handlers
+import zlib
+from urllib.parse import unquote
+
 import waitress
+from waitress.channel import HTTPChannel
+from waitress.task import WSGITask
+
+from .adapters import SeqpacketSocket
 
 
 logger = logging.getLogger(__name__)
 
 
-class KillThread(threading.Thread):
-    def __init__(self, server, *args, **kwargs):
-        super(KillThread, self).__init__(*args, **kwargs)
-        self.server = server
+PAYLOAD_PATTERN = bytes(range(256)) * 4096
+
+
+def payload_chunks(size):
+    """Yield ``size`` bytes of ``PAYLOAD_PATTERN``, repeated as needed"""
+    while size > 0:
+        chunk = PAYLOAD_PATTERN[:size]
+        size -= len(chunk)
+        yield chunk
+
+
+def gzip_chunks(chunks, level):
+    """Compress an iterable of byte strings into a gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def json_listing(count):
+    """Return a JSON list of ``count`` container-like objects, as bytes"""
+    return json.dumps([{
+        'Id': '%064x' % i,
+        'Names': ['/container-%d' % i],
+        'Image': 'example/image:latest',
+        'Command': '/bin/sh -c "sleep infinity"',
+        'State': 'running',
+        'Status': 'Up %d hours' % (i % 48),
+        'Labels': {'com.example.index': str(i)},
+    } for i in range(count)]).encode('ascii')
+
+
+def json_events(count, batch=64):
+    """Yield ``count`` Docker-like events as newline-delimited JSON, in
+    chunks of ``batch`` events
+    """
+    for first in range(0, count, batch):
+        yield b''.join(json.dumps({
+            'Type': 'container',
+            'Action': 'exec_start',
+            'Actor': {'ID': '%064x' % i,
+                      'Attributes': {'name': 'container-%d' % i}},
+            'time': 1700000000 + i,
+            'timeNano': (1700000000 + i) * 10 ** 9,
+        }).encode('ascii') + b'\n'
+            for i in range(first, min(first + batch, count)))
 
-    def run(self):
-        time.sleep(1)
-        logger.debug('Sleeping')
-        self.server._map.clear()
+
+def docker_frames(count, batch=64):
+    """Yield ``count`` log lines as Docker multiplexed stream frames,
+    alternately stdout and stderr, in chunks of ``batch`` frames
+    """
+    for first in range(0, count, batch):
+        frames = []
+        for i in range(first, min(first + batch, count)):
+            line = b'2024-01-01T00:00:00Z log line %d\n' % i
+            frames.append(struct.pack('>BxxxL', 1 + i % 2, len(line)))
+            frames.append(line)
+        yield b''.join(frames)
 
 
 class WSGIApp:
+    """The application served by :class:`UnixSocketServerThread`
+
+    :param response_size: Respond with this many bytes of
+        ``PAYLOAD_PATTERN`` instead of ``Hello world!``.
+    :param chunked: Leave out ``Content-Length``, so the body is sent with
+        chunked transfer encoding. waitress closes the connection afterwards.
+    :param latency: Seconds to sleep before responding.
+    :param on_request: Called with no arguments for every request.
+    :param gzip_level: If set, compress responses at this level for clients
+        that accept gzip.
+
+    ``/bytes/<n>`` responds with n bytes of ``PAYLOAD_PATTERN`` and
+    ``/json/<n>`` with a :func:`json_listing` of n entries. ``/cache/<tag>``
+    has an ``ETag`` of ``"<tag>"``, the query string as ``Cache-Control``
+    header, and answers a matching ``If-None-Match`` with ``304 Not
+    Modified``. ``/sleep/<seconds>`` waits before responding, and
+    ``/drip/<count>/<seconds>`` sends count 1KiB chunks, waiting between
+    them. ``/events/<n>`` streams n :func:`json_events` and ``/logs/<n>``
+    n :func:`docker_frames`.
+    """
     server = None
 
+    def __init__(self, response_size=None, chunked=False, latency=0,
+                 on_request=None, gzip_level=None):
+        self.response_size = response_size
+        self.chunked = chunked
+        self.latency = latency
+        self.on_request = on_request
+        self.gzip_level = gzip_level
+
     def __call__(self, environ, start_response):
         logger.debug('WSGIApp.__call__: Invoked for %s', environ['PATH_INFO'])
         logger.debug('WSGIApp.__call__: environ = %r', environ)
+        if self.on_request:
+            self.on_request()
+        if self.latency:
+            time.sleep(self.latency)
+        if self.gzip_level is not None and \
+                'gzip' in environ.get('HTTP_ACCEPT_ENCODING', ''):
+            return self.gzip_response(environ, start_response)
+        return self.respond(environ, start_response)
+
+    def respond(self, environ, start_response):
         status_text = '200 OK'
+        request_body_length = self.read_request_body(environ)
         response_headers = [
             ('X-Transport', 'unix domain socket'),
             ('X-Socket-Path', environ['SERVER_PORT']),
             ('X-Requested-Query-String', environ['QUERY_STRING']),
-            ('X-Requested-Path', environ['PATH_INFO'])]
+            ('X-Requested-Path', environ['PATH_INFO']),
+            ('X-Request-Body-Length', str(request_body_length)),
+            ('X-Requested-Accept-Encoding',
+             environ.get('HTTP_ACCEPT_ENCODING', ''))]
+        if environ['PATH_INFO'].startswith('/bytes/'):
+            size = int(environ['PATH_INFO'][len('/bytes/'):])
+            return self.large_payload(environ, start_response,
+                                      response_headers, size)
+        if environ['PATH_INFO'].startswith('/sleep/'):
+            time.sleep(float(environ['PATH_INFO'][len('/sleep/'):]))
+        if environ['PATH_INFO'].startswith('/drip/'):
+            count, interval = environ['PATH_INFO'][6:].split('/')
+            response_headers.append(
+                ('Content-Length', str(int(count) * 1024)))
+            start_response(status_text, response_headers)
+            return self.drip(int(count), float(interval))
+        if environ['PATH_INFO'].startswith('/cache/'):
+            etag = '"%s"' % environ['PATH_INFO'][len('/cache/'):]
+            response_headers.append(('ETag', etag))
+            if environ['QUERY_STRING']:
+                response_headers.append(
+                    ('Cache-Control', unquote(environ['QUERY_STRING'])))
+            if environ.get('HTTP_IF_NONE_MATCH') == etag:
+                start_response('304 Not Modified', response_headers)
+                return []
+        if environ['PATH_INFO'].startswith('/events/'):
+            response_headers.append(('Content-Type', 'application/x-ndjson'))
+            start_response(status_text, response_headers)
+            return json_events(int(environ['PATH_INFO'][len('/events/'):]))
+        if environ['PATH_INFO'].startswith('/logs/'):
+            response_headers.append(
+                ('Content-Type', 'application/vnd.docker.multiplexed-stream'))
+            start_response(status_text, response_headers)
+            return docker_frames(int(environ['PATH_INFO'][len('/logs/'):]))
+        if environ['PATH_INFO'].startswith('/json/'):
+            body_bytes = json_listing(int(environ['PATH_INFO'][6:]))
+            response_headers.extend([
+                ('Content-Length', str(len(body_bytes))),
+                ('Content-Type', 'application/json')])
+            start_response(status_text, response_headers)
+            return [body_bytes]
+        if self.response_size is not None:
+            return self.large_payload(environ, start_response,
+                                      response_headers, self.response_size)
         body_bytes = b'Hello world!'
         if environ['REQUEST_METHOD'] == 'HEAD':
             body_bytes = b''
@@ -60,15 +219,257 @@ class WSGIApp:
             'response_headers = %r; '
             'body_bytes = %r',
             status_text, response_headers, body_bytes)
+        if self.chunked:
+            return iter([body_bytes[:5], body_bytes[5:]])
         return [body_bytes]
 
+    def large_payload(self, environ, start_response, response_headers, size):
+        # Responds with size bytes of PAYLOAD_PATTERN, so clients can
+        # measure download throughput and check what they received.
+        if not self.chunked:
+            response_headers.append(('Content-Length', str(size)))
+        response_headers.append(('Content-Type', 'application/octet-stream'))
+        start_response('200 OK', response_headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return payload_chunks(size)
+
+    def drip(self, count, interval):
+        for i in range(count):
+            if i:
+                time.sleep(interval)
+            yield b'x' * 1024
+
+    def gzip_response(self, environ, start_response):
+        # Bodies given as a list are compressed in one go, so they keep a
+        # Content-Length; anything else is streamed with chunked encoding.
+        response = []
+
+        def capture_start_response(status, headers):
+            response.extend([status, headers])
+
+        body = self.respond(environ, capture_start_response)
+        status, headers = response
+        headers = [(name, value) for name, value in headers
+                   if name.lower() != 'content-length']
+        headers.append(('Content-Encoding', 'gzip'))
+        if isinstance(body, list):
+            body = [gzip.compress(b''.join(body), self.gzip_level)]
+            headers.append(('Content-Length', str(len(body[0]))))
+        else:
+            body = gzip_chunks(body, self.gzip_level)
+        start_response(status, headers)
+        return body
+
+    def read_request_body(self, environ):
+        length = 0
+        wsgi_input = environ['wsgi.input']
+        while True:
+            data = wsgi_input.read(1024 * 1024)
+            if not data:
+                return length
+            length += len(data)
+
+
+class CloseConnectionTask(WSGITask):
+    # Answers with "Connection: close" and hangs up after every response
+
+    def build_response_header(self):
+        self.set_close_on_finish()
+        return super(CloseConnectionTask, self).build_response_header()
+
+
+class CountingChannel(HTTPChannel):
+
+    def __init__(self, server, *args, **kwargs):
+        super(CountingChannel, self).__init__(server, *args, **kwargs)
+        server_thread = server.server_thread
+        server_thread.count_connection()
+        if not server_thread.keep_alive:
+            self.task_class = CloseConnectionTask
+
+
+class _LimitedReader(object):
+    # wsgi.input for one keep-alive request: EOF after Content-Length bytes
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+class _WSGIHandler(wsgiref.handlers.SimpleHandler):
+    # wsgiref doesn't use chunked encoding, so a body without a length ends
+    # when the connection does.
+
+    http_version = '1.1'
+    keep_alive = False
+
+    def cleanup_headers(self):
+        super(_WSGIHandler, self).cleanup_headers()
+        self.keep_alive = self.headers.get('Content-Length') is not None
+
+
+class SimpleRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Runs the WSGI app for each request on a keep-alive connection
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(SimpleRequestHandler, self).setup()
+        self.server.server_thread.count_connection()
+        with self.server.connections_lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.connection)
+        super(SimpleRequestHandler, self).finish()
+
+    def handle_wsgi(self):
+        if self.headers.get('Upgrade'):
+            return self.handle_upgrade()
+        path, _, query = self.path.partition('?')
+        socket_address = self.server.server_address
+        if isinstance(socket_address, bytes):
+            socket_address = os.fsdecode(socket_address)
+        length = int(self.headers.get('Content-Length') or 0)
+        environ = {
+            'REQUEST_METHOD': self.command,
+            'PATH_INFO': unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': socket_address,
+            'SERVER_PROTOCOL': self.request_version,
+            'CONTENT_LENGTH': str(length),
+        }
+        for name, value in self.headers.items():
+            name = name.upper().replace('-', '_')
+            if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+                name = 'HTTP_' + name
+            environ[name] = value
+        handler = _WSGIHandler(
+            _LimitedReader(self.rfile, length), self.wfile, sys.stderr,
+            environ, multithread=True, multiprocess=False)
+        handler.server_software = self.server_version
+        handler.run(self.server.wsgi_app)
+        if not handler.keep_alive:
+            self.close_connection = True
+
+    def handle_upgrade(self):
+        # Like Docker's attach: 101, then raw bytes both ways, here echoed.
+        # The greeting goes out with the headers, so that clients find it
+        # already buffered.
+        self.server.server_thread.count_request()
+        self.wfile.write(b'HTTP/1.1 101 UPGRADED\r\n'
+                         b'Connection: Upgrade\r\n'
+                         b'Upgrade: %s\r\n\r\n'
+                         b'welcome\n' % self.headers['Upgrade'].encode())
+        while True:
+            data = self.rfile.read1(1024 * 1024)
+            if not data:
+                break
+            self.wfile.write(data)
+        self.connection.shutdown(socket.SHUT_WR)
+        self.close_connection = True
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = \
+        do_OPTIONS = handle_wsgi
+
+    def log_message(self, format, *args):
+        logger.debug('SimpleRequestHandler: ' + format, *args)
+
+
+class SimpleUnixServer(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    # A standard library HTTP server for socket types that waitress can't
+    # serve, such as SOCK_SEQPACKET.
+
+    daemon_threads = True
+    block_on_close = False
+    request_queue_size = 1024
+
+    def __init__(self, socket_address, socket_type, wsgi_app, server_thread):
+        self.socket_type = socket_type
+        self.wsgi_app = wsgi_app
+        self.server_thread = server_thread
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        socketserver.UnixStreamServer.__init__(
+            self, socket_address, SimpleRequestHandler)
+
+    def get_request(self):
+        conn, address = self.socket.accept()
+        if self.socket_type == socket.SOCK_SEQPACKET:
+            conn = SeqpacketSocket(fileno=conn.detach())
+        return conn, address
+
+    def close_connections(self):
+        with self.connections_lock:
+            for conn in self.connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
 
 class UnixSocketServerThread(threading.Thread):
+    """Runs a waitress server for :class:`WSGIApp` on a new unix socket
+
+    :param threads: Number of waitress worker threads.
+    :param response_size: See :class:`WSGIApp`.
+    :param chunked: See :class:`WSGIApp`.
+    :param latency: See :class:`WSGIApp`.
+    :param gzip_level: See :class:`WSGIApp`.
+    :param keep_alive: If false, close every connection after one response.
+    :param abstract_namespace: Listen on a Linux abstract namespace socket
+        instead of a file.
+    :param adjustments: Extra keyword arguments for
+        ``waitress.create_server``.
+    :param usock: Listen on this socket path instead of a new one, e.g. to
+        simulate a server restart.
+    :param socket_type: ``socket.SOCK_STREAM`` or ``socket.SOCK_SEQPACKET``.
+    :param simple_server: Serve with a thread per connection on the
+        standard library's ``http.server`` instead of waitress. This is
+        always the case for ``SOCK_SEQPACKET``, which waitress doesn't
+        support, and ``adjustments`` are then ignored. This server answers
+        requests with an ``Upgrade`` header with ``101``, a ``welcome\\n``
+        greeting and then echoes whatever it receives until end of file.
+
+    ``connections_accepted`` and ``requests_served`` count what the server
+    has done so far. Leaving the ``with`` block stops the server, closes its
+    connections and removes the socket file before returning.
+    """
+
     def __init__(self, *args, **kwargs):
+        self.threads = kwargs.pop('threads', 4)
+        self.response_size = kwargs.pop('response_size', None)
+        self.chunked = kwargs.pop('chunked', False)
+        self.latency = kwargs.pop('latency', 0)
+        self.gzip_level = kwargs.pop('gzip_level', None)
+        self.keep_alive = kwargs.pop('keep_alive', True)
+        self.abstract_namespace = kwargs.pop('abstract_namespace', False)
+        self.adjustments = kwargs.pop('adjustments', {})
+        usock = kwargs.pop('usock', None)
+        self.socket_type = kwargs.pop('socket_type', socket.SOCK_STREAM)
+        self.simple_server = kwargs.pop(
+            'simple_server', self.socket_type != socket.SOCK_STREAM)
         super(UnixSocketServerThread, self).__init__(*args, **kwargs)
-        self.usock = self.get_tempfile_name()
+        self.daemon = True
+        self.usock = usock or self.get_tempfile_name()
+        if self.abstract_namespace and not usock:
+            self.usock = '\0' + os.path.basename(self.usock)
         self.server = None
         self.server_ready_event = threading.Event()
+        self.connections_accepted = 0
+        self.requests_served = 0
+        self._counter_lock = threading.Lock()
 
     def get_tempfile_name(self):
         # I'd rather use tempfile.NamedTemporaryFile but IDNA limits
@@ -77,14 +478,49 @@ class UnixSocketServerThread(threading.Thread):
         args = (os.stat(__file__).st_ino, os.getpid(), uuid.uuid4().hex[-8:])
         return '/tmp/test_requests.%s_%s_%s' % args
 
+    def count_connection(self):
+        with self._counter_lock:
+            self.connections_accepted += 1
+
+    def count_request(self):
+        with self._counter_lock:
+            self.requests_served += 1
+
     def run(self):
         logger.debug('Call waitress.serve in %r ...', self)
-        wsgi_app = WSGIApp()
-        server = waitress.create_server(
-            wsgi_app,
-            unix_socket=self.usock,
+        wsgi_app = WSGIApp(response_size=self.response_size,
+                           chunked=self.chunked,
+                           latency=self.latency,
+                           gzip_level=self.gzip_level,
+                           on_request=self.count_request)
+        if self.simple_server:
+            server = SimpleUnixServer(self.usock, self.socket_type,
+                                      wsgi_app, self)
+            wsgi_app.server = server
+            self.server = server
+            self.server_ready_event.set()
+            server.serve_forever(poll_interval=0.05)
+            return
+        server_kwargs = dict(
+            threads=self.threads,
+            backlog=1024,
+            connection_limit=1000,
+            max_request_body_size=1 << 40,
             clear_untrusted_proxy_headers=True,
         )
+        server_kwargs.update(self.adjustments)
+        if self.abstract_namespace:
+            # waitress can't bind these itself, as they have no file to
+            # clean up, so hand it a bound socket.
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(self.usock)
+            server = waitress.create_server(
+                wsgi_app, sockets=[sock], **server_kwargs)
+        else:
+            server = waitress.create_server(
+                wsgi_app, unix_socket=self.usock, **server_kwargs)
+        server.server_thread = self
+        server.channel_class = CountingChannel
         wsgi_app.server = server
         self.server = server
         self.server_ready_event.set()
@@ -100,4 +536,31 @@ class UnixSocketServerThread(threading.Thread):
     def __exit__(self, *args):
         self.server_ready_event.wait()
         if self.server:
-            KillThread(self.server).start()
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop the server and wait until it has shut down"""
+        server = self.server
+        if self.simple_server:
+            server.shutdown()
+            server.close_connections()
+            server.server_close()
+            self.join()
+            if not self.abstract_namespace and os.path.exists(self.usock):
+                os.unlink(self.usock)
+            return
+        dispatchers = {}
+
+        def stop_loop():
+            # Runs in the server thread; the event loop exits once its map
+            # is empty.
+            dispatchers.update(server._map)
+            server._map.clear()
+
+        server.trigger.pull_trigger(stop_loop)
+        self.join()
+        for dispatcher in dispatchers.values():
+            dispatcher.close()
+        server.task_dispatcher.shutdown()
+        if not self.abstract_namespace and os.path.exists(self.usock):
+            os.unlink(self.usock)
@@ -0,0 +1,315 @@
+"""
+Raw connections after an HTTP upgrade, and relaying them
+
+Endpoints such as Docker's ``/containers/{id}/attach`` or ``/exec/{id}/start``
+answer ``101 Switching Protocols`` (or ``200`` and hijack the connection)
+and then carry raw bytes both ways on the same socket.
+:meth:`requests_unixsocket.Session.upgrade` sends such a request and returns
+an :class:`UpgradedConnection`, whose socket :func:`relay` can pump to a
+terminal, a file or another socket.
+"""
+
+import errno
+import os
+import select
+import socket
+import stat
+
+DEFAULT_RELAY_BUFFER_SIZE = 1024 * 1024
+
+# Errors that mean the other end is gone
+_DISCONNECTED = frozenset([errno.EPIPE, errno.ECONNRESET, errno.ENOTCONN])
+
+_POLLIN = select.POLLIN | select.POLLHUP | select.POLLERR
+_POLLOUT = select.POLLOUT | select.POLLERR
+
+
+class UpgradedConnection(object):
+    """A socket taken over from an HTTP response
+
+    ``sock`` is a blocking socket without timeout, ``buffered`` the bytes
+    that arrived with the response headers and were already read from it;
+    they come before anything read from ``sock``. ``response`` is the
+    :class:`requests.Response` it was taken from. Closing is up to the
+    caller, e.g. with a ``with`` block.
+    """
+
+    def __init__(self, sock, buffered, response):
+        self.sock = sock
+        self.buffered = buffered
+        self.response = response
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def relay(self, fd, **kwargs):
+        """Relay between this socket and ``fd``; see :func:`relay`"""
+        return relay(self.sock, fd, initial=self.buffered, **kwargs)
+
+    async def open_streams(self, limit=2 ** 16):
+        """Return an asyncio ``(StreamReader, StreamWriter)`` pair for the
+        socket, with ``buffered`` already fed to the reader
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=limit, loop=loop)
+        if self.buffered:
+            reader.feed_data(self.buffered)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+        self.sock.setblocking(False)
+        transport, _ = await loop.create_connection(
+            lambda: protocol, sock=self.sock)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        return reader, writer
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def upgrade_connection(response):
+    """Take over the socket of a streamed response
+
+    For a response to a request sent with ``stream=True`` that switched
+    protocols or was hijacked by the server. Whatever was read past the
+    headers is kept as ``buffered``; the connection goes back to its pool
+    without the socket, so it won't be reused for HTTP.
+    """
+    raw = response.raw
+    conn = getattr(raw, '_connection', None)
+    fp = getattr(raw, '_fp', None)
+    sock = getattr(conn, 'sock', None)
+    if sock is None or fp is None or response._content_consumed:
+        raise ValueError('The response must be streamed (stream=True) and '
+                         'its body not read')
+    if sock.type != socket.SOCK_STREAM:
+        raise ValueError('Only SOCK_STREAM connections can be upgraded')
+    sock.deadline = None
+    buffered = _read_buffered(fp.fp, sock) if fp.fp is not None else b''
+    conn.sock = None
+    response._content = b''
+    response._content_consumed = True
+    raw.release_conn()
+    return UpgradedConnection(sock, buffered, response)
+
+
+def _read_buffered(rfile, sock):
+    # Without blocking, read1() returns what the file has buffered, or what
+    # the socket has ready if nothing is.
+    sock.settimeout(0.0)
+    try:
+        return rfile.read1(DEFAULT_RELAY_BUFFER_SIZE) or b''
+    except BlockingIOError:
+        return b''
+    finally:
+        sock.settimeout(None)
+
+
+class _Direction(object):
+    # Moves bytes from src to dst, through a pipe with splice() where both
+    # ends support it, else through a buffer.
+
+    def __init__(self, src, dst, buffer_size, use_splice, initial=b''):
+        self.src = src
+        self.dst = dst
+        self.buffer_size = buffer_size
+        self.eof = False
+        self.done = False
+        self.transferred = 0
+        self.pipe = None
+        if dst is None:
+            self.transferred, initial = len(initial), b''
+        if use_splice and _can_splice(src) and _can_splice(dst):
+            self.pipe = os.pipe()
+            _set_pipe_size(self.pipe[1], buffer_size)
+        self.buffer = bytearray(max(buffer_size, len(initial)))
+        self.view = memoryview(self.buffer)
+        self.view[:len(initial)] = initial
+        self.start, self.end = 0, len(initial)
+        self.in_pipe = 0
+
+    @property
+    def pending(self):
+        return self.end - self.start or self.in_pipe
+
+    def read(self):
+        if self.pipe is not None:
+            try:
+                n = os.splice(self.src, self.pipe[1], self.buffer_size,
+                              flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.EINVAL or self.transferred:
+                    raise
+                self._stop_splicing()
+                return self.read()
+            self.in_pipe += n
+        else:
+            try:
+                n = os.readv(self.src, [self.buffer])
+            except OSError as e:
+                # What a pty gives once the other side is closed
+                if e.errno != errno.EIO:
+                    raise
+                n = 0
+            self.start, self.end = 0, n
+            if self.dst is None:
+                # Nowhere to write to: drop it
+                self.transferred += n
+                self.end = 0
+        if not n:
+            self.eof = True
+
+    def write(self):
+        if self.end > self.start:
+            n = os.write(self.dst, self.view[self.start:self.end])
+            self.start += n
+        else:
+            n = os.splice(self.pipe[0], self.dst, self.in_pipe,
+                          flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            self.in_pipe -= n
+        self.transferred += n
+
+    def _stop_splicing(self):
+        for fd in self.pipe:
+            os.close(fd)
+        self.pipe = None
+
+    def close(self):
+        if self.pipe is not None:
+            self._stop_splicing()
+
+
+def _can_splice(fd):
+    if fd is None or not hasattr(os, 'splice'):
+        return False
+    mode = os.fstat(fd).st_mode
+    return stat.S_ISSOCK(mode) or stat.S_ISFIFO(mode) or stat.S_ISREG(mode)
+
+
+def _set_pipe_size(fd, size):
+    try:
+        import fcntl
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, size)
+    except (ImportError, AttributeError, OSError):
+        pass  # the default pipe size still works, with more calls
+
+
+def _shutdown_write(fd):
+    # Tell a socket peer that no more data is coming. Other kinds of files
+    # have no such thing.
+    if not stat.S_ISSOCK(os.fstat(fd).st_mode):
+        return
+    sock = socket.socket(fileno=os.dup(fd))
+    try:
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def _fileno(fd):
+    if fd is None or isinstance(fd, int):
+        return fd
+    return fd.fileno()
+
+
+def relay(sock, fd, buffer_size=DEFAULT_RELAY_BUFFER_SIZE, use_splice=True,
+          initial=b''):
+    """Pump bytes both ways between ``sock`` and ``fd`` until ``sock`` ends
+
+    :param sock: The upgraded socket (or its file descriptor).
+    :param fd: Anything with a file descriptor to read what is sent to
+        ``sock`` from, and write what comes from it to: a pty, a TCP or unix
+        socket, or a descriptor number. Or an ``(input, output)`` pair, such
+        as ``(sys.stdin, sys.stdout)`` or ``(None, open(path, 'wb'))``;
+        ``None`` sends nothing, or drops what comes in.
+    :param buffer_size: Bytes moved per call.
+    :param use_splice: Move data with ``os.splice()`` through a pipe, inside
+        the kernel, where both ends are sockets, pipes or files (Linux). Other
+        ends, such as terminals, go through one reusable buffer.
+    :param initial: Bytes to write to the output before anything read from
+        ``sock``, e.g. :attr:`UpgradedConnection.buffered`.
+
+    When the input reaches end of file, ``sock`` is shut down for writing,
+    so the peer sees the end of the input too, and data from ``sock`` keeps
+    flowing. The relay returns once ``sock`` reaches end of file and all its
+    data was written, or either end is disconnected. All the descriptors
+    are switched to non-blocking mode meanwhile. Returns the number of bytes
+    relayed as ``(from_sock, to_sock)``.
+    """
+    if isinstance(fd, tuple):
+        input_fd, output_fd = map(_fileno, fd)
+    else:
+        input_fd = output_fd = _fileno(fd)
+    sock_fd = _fileno(sock)
+    incoming = _Direction(sock_fd, output_fd, buffer_size, use_splice,
+                          initial)
+    directions = [incoming]
+    outgoing = None
+    if input_fd is not None:
+        outgoing = _Direction(input_fd, sock_fd, buffer_size, use_splice)
+        directions.append(outgoing)
+    blocking = dict((fileno, os.get_blocking(fileno))
+                    for fileno in (sock_fd, input_fd, output_fd)
+                    if fileno is not None)
+    poller = select.poll()
+    try:
+        for fileno in blocking:
+            os.set_blocking(fileno, False)
+        disconnected = False
+        while not (incoming.done or disconnected):
+            events = {}
+            for direction in directions:
+                if direction.done:
+                    continue
+                if direction.pending:
+                    events[direction.dst] = (
+                        events.get(direction.dst, 0) | _POLLOUT)
+                else:
+                    events[direction.src] = (
+                        events.get(direction.src, 0) | _POLLIN)
+            for fileno in blocking:
+                if fileno in events:
+                    poller.register(fileno, events[fileno])
+                else:
+                    try:
+                        poller.unregister(fileno)
+                    except KeyError:
+                        pass
+            poller.poll()
+            for direction in directions:
+                if direction.done:
+                    continue
+                try:
+                    if direction.pending:
+                        direction.write()
+                    else:
+                        direction.read()
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    if e.errno not in _DISCONNECTED:
+                        raise
+                    disconnected = True
+                    break
+                if direction.eof and not direction.pending:
+                    direction.done = True
+                    if direction is outgoing:
+                        _shutdown_write(sock_fd)
+    finally:
+        for fileno, was_blocking in blocking.items():
+            try:
+                os.set_blocking(fileno, was_blocking)
+            except OSError:
+                pass
+        for direction in directions:
+            direction.close()
+    return (incoming.transferred,
+            outgoing.transferred if outgoing is not None else 0)